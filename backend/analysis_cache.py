@@ -0,0 +1,235 @@
+"""
+Two-tier cache for Gemini meal analyses.
+
+Descriptions like "black coffee" or "2 eggs and toast" come up again and
+again. Each one would otherwise cost a full Gemini call with a large
+thinking budget. Results are keyed on the normalized description plus the
+model, temperature and schema version, and are kept in two tiers:
+
+    memory   bounded LRU inside the process (CHUNDIET_ANALYSIS_CACHE_MEMORY, default 512)
+    disk     SQLite file (CHUNDIET_ANALYSIS_CACHE_DB, default analysis_cache.db)
+
+Disk entries expire after CHUNDIET_ANALYSIS_CACHE_TTL_DAYS (default 30).
+Once the disk tier holds more than CHUNDIET_ANALYSIS_CACHE_MAX_ENTRIES
+(default 10000), the least recently used entries are evicted. Set
+CHUNDIET_ANALYSIS_CACHE=0 to turn the cache off.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from connection_pool import ConnectionPool
+
+# Expired and over-size rows are purged once every this many stores
+EVICT_EVERY = 64
+
+
+def normalize_description(description: str) -> str:
+    """Lowercase, unify quotes, collapse whitespace and drop trailing punctuation"""
+    text = (description or '').lower().replace('’', "'").replace('‘', "'")
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' .!?;,')
+
+
+def cache_key(description: str, model: str, temperature: float, schema_version: int) -> str:
+    raw = json.dumps([normalize_description(description), model, round(float(temperature), 3), schema_version])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """In-process LRU in front of a persistent SQLite table with TTL and size-based eviction"""
+
+    def __init__(self, db_path: str = 'analysis_cache.db', memory_size: int = 512, max_entries: int = 10000,
+                 ttl_seconds: float = 30 * 86400):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.pool = ConnectionPool(db_path, max_size=4, cache_size_kb=2048, mmap_size=0)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._stores_since_evict = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'bypassed': 0,
+            'stores': 0,
+            'expired': 0,
+            'evicted': 0
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional['AnalysisCache']:
+        """Cache configured from the environment, or None when CHUNDIET_ANALYSIS_CACHE=0"""
+        if os.environ.get('CHUNDIET_ANALYSIS_CACHE', '1').strip().lower() in ('0', 'false', 'no', 'off'):
+            return None
+        return cls(
+            db_path=os.environ.get('CHUNDIET_ANALYSIS_CACHE_DB', 'analysis_cache.db'),
+            memory_size=int(os.environ.get('CHUNDIET_ANALYSIS_CACHE_MEMORY', 512)),
+            max_entries=int(os.environ.get('CHUNDIET_ANALYSIS_CACHE_MAX_ENTRIES', 10000)),
+            ttl_seconds=float(os.environ.get('CHUNDIET_ANALYSIS_CACHE_TTL_DAYS', 30)) * 86400
+        )
+
+    def _connection(self):
+        # Created on first use so a relative path resolves in the data directory
+        conn = self.pool.acquire()
+        if not self._initialized:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    key TEXT PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_used ON analysis_cache (last_used_at)')
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a fresh copy of the cached analysis, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return json.loads(result)
+                del self._memory[key]
+
+        conn = self._connection()
+        try:
+            row = conn.execute(
+                'SELECT result, expires_at FROM analysis_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self._count('misses')
+                if row is not None:
+                    self._count('expired')
+                return None
+            conn.execute(
+                'UPDATE analysis_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?', (now, key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._remember(key, row[0], row[1])
+        self._count('disk_hits')
+        return json.loads(row[0])
+
+    def put(self, key: str, description: str, model: str, result: Dict):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        payload = json.dumps(result)
+        self._remember(key, payload, expires_at)
+
+        conn = self._connection()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO analysis_cache
+                    (key, description, model, result, created_at, expires_at, last_used_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            ''', (key, normalize_description(description), model, payload, now, expires_at, now))
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stats['stores'] += 1
+            self._stores_since_evict += 1
+            evict = self._stores_since_evict >= EVICT_EVERY
+            if evict:
+                self._stores_since_evict = 0
+        if evict:
+            self.evict()
+
+    def _remember(self, key: str, payload: str, expires_at: float):
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (payload, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def evict(self) -> int:
+        """Drop expired rows, then the least recently used ones above max_entries"""
+        conn = self._connection()
+        try:
+            removed = conn.execute('DELETE FROM analysis_cache WHERE expires_at <= ?', (time.time(),)).rowcount
+            total = conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+            if total > self.max_entries:
+                removed += conn.execute('''
+                    DELETE FROM analysis_cache WHERE key IN (
+                        SELECT key FROM analysis_cache ORDER BY last_used_at LIMIT ?
+                    )
+                ''', (total - self.max_entries,)).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        self._count('evicted', removed)
+        return removed
+
+    def iter_entries(self, model: str):
+        """Yield (description, result) for every unexpired entry of a model, oldest first"""
+        conn = self._connection()
+        try:
+            cursor = conn.execute(
+                'SELECT description, result FROM analysis_cache WHERE model = ? AND expires_at > ? ORDER BY created_at',
+                (model, time.time())
+            )
+            for description, result in cursor:
+                yield description, json.loads(result)
+        finally:
+            conn.close()
+
+    def record_bypass(self):
+        self._count('bypassed')
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        conn = self._connection()
+        try:
+            conn.execute('DELETE FROM analysis_cache')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        conn = self._connection()
+        try:
+            stats['disk_entries'] = conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+        finally:
+            conn.close()
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats.update({
+            'memory_size': self.memory_size,
+            'max_entries': self.max_entries,
+            'ttl_days': self.ttl_seconds / 86400,
+            'hit_rate': (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        })
+        return stats
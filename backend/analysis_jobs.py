@@ -0,0 +1,290 @@
+"""
+Durable queue of meal-analysis jobs run by a bounded worker pool.
+
+A synchronous /api/analyze-meal holds a server thread for the whole Gemini
+call, which takes several seconds with thinking enabled. In async mode the
+request only records a job and returns its id. A small pool of worker
+threads runs the analysis and stores the meal, and the client polls
+/api/jobs/<id> or follows /api/jobs/<id>/events.
+
+Jobs live in a SQLite file (CHUNDIET_JOBS_DB, default analysis_jobs.db), so
+queued work survives a restart. Jobs that were running when the process
+died are queued again, up to MAX_ATTEMPTS times. Finished jobs are purged
+after CHUNDIET_JOB_RETENTION_HOURS (default 24). The number of workers comes
+from CHUNDIET_ANALYSIS_WORKERS (default 2). CHUNDIET_ANALYSIS_QUEUE_MAX
+(default 500) caps the number of queued jobs.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from connection_pool import ConnectionPool
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+# A job that was interrupted this many times is marked failed instead of retried
+MAX_ATTEMPTS = 3
+# Idle workers look for jobs queued by another process this often
+POLL_SECONDS = 5.0
+PURGE_EVERY_SECONDS = 600.0
+
+
+class QueueFullError(Exception):
+    """Too many jobs are already waiting"""
+
+
+class AnalysisJobQueue:
+    """SQLite-backed job table plus the worker threads that drain it"""
+
+    def __init__(self, handler: Callable[[int, Dict], Dict], db_path: str = 'analysis_jobs.db', workers: int = 2,
+                 max_pending: int = 500, retention_seconds: float = 86400):
+        # handler(user_id, payload) -> JSON-serializable result; exceptions fail the job
+        self.handler = handler
+        self.db_path = db_path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.pool = ConnectionPool(db_path, max_size=workers + 2, cache_size_kb=2048, mmap_size=0)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._threads = []
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+        self._waits_ms = deque(maxlen=500)
+        self._run_ms = deque(maxlen=500)
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'recovered': 0, 'rejected': 0}
+
+    @classmethod
+    def from_env(cls, handler: Callable[[int, Dict], Dict]) -> 'AnalysisJobQueue':
+        return cls(
+            handler,
+            db_path=os.environ.get('CHUNDIET_JOBS_DB', 'analysis_jobs.db'),
+            workers=int(os.environ.get('CHUNDIET_ANALYSIS_WORKERS', 2)),
+            max_pending=int(os.environ.get('CHUNDIET_ANALYSIS_QUEUE_MAX', 500)),
+            retention_seconds=float(os.environ.get('CHUNDIET_JOB_RETENTION_HOURS', 24)) * 3600
+        )
+
+    def start(self):
+        """Create the table, requeue interrupted jobs and start the workers (idempotent)"""
+        if self._threads:
+            return self
+        with self._lock:
+            if self._threads:
+                return self
+            # Opened here rather than in __init__ so a relative path resolves in the data directory
+            conn = self.pool.acquire()
+            try:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS analysis_jobs (
+                        id TEXT PRIMARY KEY,
+                        user_id INTEGER NOT NULL,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        result TEXT,
+                        error TEXT,
+                        created_at REAL NOT NULL,
+                        started_at REAL,
+                        finished_at REAL
+                    ) WITHOUT ROWID
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs (status, created_at)')
+                recovered = conn.execute(
+                    'UPDATE analysis_jobs SET status = ?, started_at = NULL WHERE status = ? AND attempts < ?',
+                    (QUEUED, RUNNING, MAX_ATTEMPTS)
+                ).rowcount
+                conn.execute(
+                    'UPDATE analysis_jobs SET status = ?, error = ?, finished_at = ? WHERE status = ?',
+                    (FAILED, 'Interrupted too many times', time.time(), RUNNING)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            self._stats['recovered'] += recovered
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'chundiet-analysis-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+
+    def submit(self, user_id: int, payload: Dict) -> str:
+        """Record a job and wake a worker; returns the job id"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        conn = self.pool.acquire()
+        try:
+            pending = conn.execute(
+                'SELECT COUNT(*) FROM analysis_jobs WHERE status = ?', (QUEUED,)
+            ).fetchone()[0]
+            if pending >= self.max_pending:
+                with self._lock:
+                    self._stats['rejected'] += 1
+                raise QueueFullError(f'{pending} meal analyses are already queued, try again shortly')
+            conn.execute(
+                'INSERT INTO analysis_jobs (id, user_id, payload, status, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, int(user_id), json.dumps(payload), QUEUED, time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats['submitted'] += 1
+        with self._changed:
+            self._changed.notify_all()
+        return job_id
+
+    def get(self, job_id: str, user_id: Optional[int] = None) -> Optional[Dict]:
+        """The job's status and, once finished, its result or error"""
+        self.start()
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute('''
+                SELECT id, user_id, status, attempts, result, error, created_at, started_at, finished_at
+                FROM analysis_jobs WHERE id = ?
+            ''', (job_id,)).fetchone()
+            if row is None or (user_id is not None and row[1] != int(user_id)):
+                return None
+            job = {
+                'job_id': row[0],
+                'status': row[2],
+                'attempts': row[3],
+                'created_at': row[6],
+                'started_at': row[7],
+                'finished_at': row[8]
+            }
+            if row[2] == QUEUED:
+                job['queue_position'] = conn.execute(
+                    'SELECT COUNT(*) FROM analysis_jobs WHERE status = ? AND created_at <= ?', (QUEUED, row[6])
+                ).fetchone()[0]
+        finally:
+            conn.close()
+        if row[4]:
+            job.update(json.loads(row[4]))
+        if row[5]:
+            job['error'] = row[5]
+        return job
+
+    def wait_for_change(self, timeout: float):
+        """Block until any job finishes (or timeout); used by the SSE stream"""
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def _claim(self) -> Optional[tuple]:
+        conn = self.pool.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, user_id, payload, created_at FROM analysis_jobs WHERE status = ? ORDER BY created_at LIMIT 1',
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            started_at = time.time()
+            conn.execute(
+                'UPDATE analysis_jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?',
+                (RUNNING, started_at, row[0])
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._waits_ms.append((started_at - row[3]) * 1000)
+        return row[0], row[1], json.loads(row[2])
+
+    def _finish(self, job_id: str, status: str, result: Dict = None, error: str = None):
+        conn = self.pool.acquire()
+        try:
+            conn.execute(
+                'UPDATE analysis_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        with self._changed:
+            self._changed.notify_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"[JOBS ERROR] Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._purge()
+                with self._changed:
+                    self._changed.wait(POLL_SECONDS)
+                continue
+
+            job_id, user_id, payload = job
+            started = time.perf_counter()
+            try:
+                result = self.handler(user_id, payload)
+                self._finish(job_id, DONE, result=result)
+                stat = 'completed'
+            except Exception as e:
+                self._finish(job_id, FAILED, error=str(e))
+                stat = 'failed'
+            with self._lock:
+                self._stats[stat] += 1
+                self._run_ms.append((time.perf_counter() - started) * 1000)
+
+    def _purge(self):
+        now = time.time()
+        if now - self._last_purge < PURGE_EVERY_SECONDS:
+            return
+        self._last_purge = now
+        conn = self.pool.acquire()
+        try:
+            conn.execute(
+                'DELETE FROM analysis_jobs WHERE status IN (?, ?) AND finished_at < ?',
+                (DONE, FAILED, now - self.retention_seconds)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """Queue depth by status, worker count and wait/run time percentiles"""
+        self.start()
+        conn = self.pool.acquire()
+        try:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status').fetchall())
+            oldest = conn.execute(
+                'SELECT MIN(created_at) FROM analysis_jobs WHERE status = ?', (QUEUED,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            stats = dict(self._stats)
+            waits = sorted(self._waits_ms)
+            runs = sorted(self._run_ms)
+        stats.update({
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'queue_depth': counts.get(QUEUED, 0),
+            'running': counts.get(RUNNING, 0),
+            'by_status': counts,
+            'oldest_queued_age_s': round(time.time() - oldest, 1) if oldest else 0.0,
+            'avg_wait_ms': sum(waits) / len(waits) if waits else 0.0,
+            'p95_wait_ms': waits[int(len(waits) * 0.95)] if waits else 0.0,
+            'avg_run_ms': sum(runs) / len(runs) if runs else 0.0,
+            'p95_run_ms': runs[int(len(runs) * 0.95)] if runs else 0.0
+        })
+        return stats
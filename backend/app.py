@@ -1,9 +1,20 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from flask_cors import CORS
 from models import init_db, User, Meal, NutritionEntry
 from gemini_service import GeminiNutritionAnalyzer
-from database import DatabaseManager
+from sharding import ShardedDatabaseManager
+from storage import create_database_manager
+from compaction import MaintenanceScheduler
+from analysis_cache import AnalysisCache
+from analysis_jobs import AnalysisJobQueue, QueueFullError
+from meal_similarity import MealSimilarityIndex
+from food_composition import FoodCompositionDB
+from gemini_scheduler import GeminiScheduler
+from meal_import import ImportReport, detect_format, iter_raw_records, valid_records, validate_record
+from meal_export import csv_chunks, gzip_chunks, ndjson_chunks
+from recommendation_cache import FRESH, STALE, RecommendationRefresher, input_fingerprint
 import os
+import time
 from datetime import datetime, date
 import json
 
@@ -11,8 +22,27 @@ app = Flask(__name__, static_folder='../frontend', template_folder='../frontend'
 CORS(app)
 
 # Initialize components
-db_manager = DatabaseManager('chundiet.db')
-gemini_analyzer = GeminiNutritionAnalyzer()
+# Single chundiet.db unless CHUNDIET_DATABASE_URL / CHUNDIET_SHARDS select another backend
+db_manager = create_database_manager('chundiet.db')
+# Daily archive/optimize pass; archiving stays off unless CHUNDIET_ARCHIVE_AFTER_DAYS is set
+maintenance_scheduler = MaintenanceScheduler(
+    db_manager,
+    interval_hours=float(os.environ.get('CHUNDIET_MAINTENANCE_INTERVAL_HOURS', 24)),
+    archive_after_days=int(os.environ['CHUNDIET_ARCHIVE_AFTER_DAYS']) if os.environ.get('CHUNDIET_ARCHIVE_AFTER_DAYS') else None
+).start()
+# Simple meals are answered from the bundled food table (CHUNDIET_LOCAL_FOODS=0 disables it),
+# repeated meal descriptions from the analysis cache (CHUNDIET_ANALYSIS_CACHE=0 disables it)
+# and close variants from the similarity index (CHUNDIET_SIMILARITY=0 disables it)
+food_db = FoodCompositionDB.from_env()
+gemini_analyzer = GeminiNutritionAnalyzer(
+    cache=AnalysisCache.from_env(),
+    similarity=MealSimilarityIndex.from_env(),
+    food_db=food_db,
+    # Per-key rate limits and retry policy (CHUNDIET_GEMINI_RPM / _TPM / _MAX_ATTEMPTS)
+    scheduler=GeminiScheduler.from_env(),
+    # Estimated-token ceiling for recommendation prompts; older days are summarized to fit
+    prompt_token_budget=int(os.environ.get('CHUNDIET_RECOMMENDATION_PROMPT_TOKENS', 1200))
+)
 
 @app.route('/')
 def index():
@@ -22,42 +52,303 @@ def index():
 def serve_assets(filename):
     return send_from_directory(os.path.join(app.root_path, '../frontend/assets'), filename)
 
+def analyze_and_store_meal(user_id, data):
+    """Analyze one meal description and store it; shared by the sync route and the job workers"""
+    # Get user settings for API keys
+    settings = db_manager.get_user_settings(user_id)
+    
+    # Call Gemini API for nutrition analysis
+    nutrition_data = gemini_analyzer.analyze_meal(
+        data.get('description'), 
+        data.get('time'),
+        temperature=settings.get('ai_temperature', 0.5),
+        use_cache=data.get('use_cache', True),
+        api_keys=settings.get('gemini_api_keys')
+    )
+    
+    # Store in database
+    meal_id = db_manager.store_meal(user_id, nutrition_data)
+    return {'meal_id': meal_id, 'nutrition_data': nutrition_data}
+
+def recommendation_inputs(user_id):
+    """Everything a recommendation is generated from, plus its fingerprint"""
+    recent_data = db_manager.get_recent_nutrition_summary(user_id, days=7)
+    user_profile = db_manager.get_user_profile(user_id)
+    user_goals = db_manager.get_user_goals(user_id)
+    # Get user settings for API keys
+    settings = db_manager.get_user_settings(user_id)
+    fingerprint = input_fingerprint(recent_data, user_profile, user_goals, settings.get('ai_temperature', 0.7))
+    return recent_data, user_profile, user_goals, settings, fingerprint
+
+def generate_and_store_recommendations(user_id, inputs=None):
+    """Generate recommendations via Gemini and store them tagged with their input fingerprint"""
+    recent_data, user_profile, user_goals, settings, fingerprint = inputs or recommendation_inputs(user_id)
+    recommendations = gemini_analyzer.generate_recommendations(
+        recent_data, 
+        user_profile,
+        user_goals,
+        temperature=settings.get('ai_temperature', 0.7),
+        api_keys=settings.get('gemini_api_keys')
+    )
+    db_manager.store_recommendations(user_id, recommendations, input_fingerprint=json.dumps(fingerprint))
+    return recommendations
+
+# Stored recommendations are reused while their inputs are unchanged and refreshed
+# in the background after small changes (CHUNDIET_RECOMMENDATION_STALE_MEALS / _CALORIES)
+recommendation_refresher = RecommendationRefresher.from_env()
+
+# Upper bound for one /api/analyze-meals request
+MAX_BATCH_REQUEST_MEALS = int(os.environ.get('CHUNDIET_BATCH_MAX_MEALS', 50))
+
+# Durable queue for "async": true analyses (CHUNDIET_ANALYSIS_WORKERS workers)
+analysis_jobs = AnalysisJobQueue.from_env(analyze_and_store_meal)
+
+# Each open /events stream holds one of waitress's 8 threads, so streams end after
+# CHUNDIET_JOB_EVENTS_SECONDS with a 'timeout' event and clients poll status_url
+JOB_EVENTS_SECONDS = float(os.environ.get('CHUNDIET_JOB_EVENTS_SECONDS', 30))
+
+@app.before_request
+def resume_analysis_jobs():
+    # Started on the first request so the jobs file opens in the data directory,
+    # then picks up anything still queued from before a restart
+    analysis_jobs.start()
+
 # API Routes
 @app.route('/api/analyze-meal', methods=['POST'])
 def analyze_meal():
     """
     Process natural language meal input through Gemini API
     Expected input: {"description": "I ate pizza", "time": "2025-01-15T18:30:00"}
+    With "async": true (or ?async=1) the analysis is queued and the response
+    is 202 with a job_id to poll at /api/jobs/<job_id>
     """
     data = request.get_json()
-    meal_description = data.get('description')
-    meal_time = data.get('time')
     user_id = data.get('user_id', 1)  # Default user for simplicity
+    # "bypass_cache": true or Cache-Control: no-cache forces a fresh Gemini call
+    use_cache = not data.get('bypass_cache') and 'no-cache' not in request.headers.get('Cache-Control', '')
+    job = {'description': data.get('description'), 'time': data.get('time'), 'use_cache': use_cache}
+    
+    if data.get('async') or request.args.get('async', '0').lower() in ('1', 'true', 'yes'):
+        try:
+            job_id = analysis_jobs.submit(user_id, job)
+        except QueueFullError as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}?user_id={user_id}',
+            'events_url': f'/api/jobs/{job_id}/events?user_id={user_id}'
+        }), 202
+    
+    try:
+        result = analyze_and_store_meal(user_id, job)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/analyze-meal/stream', methods=['POST'])
+def analyze_meal_stream():
+    """
+    /api/analyze-meal as Server-Sent Events, read with fetch() since the body is POSTed.
+    'field' events carry each value as soon as Gemini has generated it
+    ({"path": "nutritional_values.calories", "value": 540}), 'retry' means the
+    fields so far belong to a failed attempt, and the stream ends with 'done'
+    ({"success": true, "meal_id": ..., "nutrition_data": ...}) once the whole
+    response has validated and been stored, or with 'error'
+    """
+    data = request.get_json()
+    user_id = data.get('user_id', 1)
+    use_cache = not data.get('bypass_cache') and 'no-cache' not in request.headers.get('Cache-Control', '')
+    settings = db_manager.get_user_settings(user_id)
+    
+    def events():
+        # Sent before Gemini is called so the browser knows the stream is live
+        yield 'event: status\ndata: {"status": "analyzing"}\n\n'
+        try:
+            nutrition_data = None
+            for kind, value in gemini_analyzer.analyze_meal_stream(
+                data.get('description'),
+                data.get('time'),
+                temperature=settings.get('ai_temperature', 0.5),
+                use_cache=use_cache,
+                api_keys=settings.get('gemini_api_keys')
+            ):
+                if kind == 'field':
+                    path, field = value
+                    yield f"event: field\ndata: {json.dumps({'path': path, 'value': field})}\n\n"
+                elif kind == 'retry':
+                    yield "event: retry\ndata: {}\n\n"
+                else:
+                    nutrition_data = value
+            # Store only what would also pass a bulk import
+            validate_record(nutrition_data)
+            meal_id = db_manager.store_meal(user_id, nutrition_data)
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'success': False, 'error': str(e)})}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps({'success': True, 'meal_id': meal_id, 'nutrition_data': nutrition_data})}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/analyze-meals', methods=['POST'])
+def analyze_meals():
+    """
+    Analyze a whole day in one Gemini round trip
+    Expected input: {"meals": [{"description": "oatmeal", "time": "2025-01-15T08:00:00"}, ...]}
+    (plain description strings are accepted too). Meals that analyzed are
+    stored in one transaction; results are in input order, each with
+    success and either meal_id + nutrition_data or error
+    """
+    data = request.get_json()
+    user_id = data.get('user_id', 1)
+    use_cache = not data.get('bypass_cache') and 'no-cache' not in request.headers.get('Cache-Control', '')
+    meals = [meal if isinstance(meal, dict) else {'description': meal} for meal in data.get('meals') or []]
+    if not meals or any(not str(meal.get('description') or '').strip() for meal in meals):
+        return jsonify({'success': False, 'error': 'meals must be a non-empty list of descriptions'}), 400
+    if len(meals) > MAX_BATCH_REQUEST_MEALS:
+        return jsonify({'success': False, 'error': f'At most {MAX_BATCH_REQUEST_MEALS} meals per request'}), 400
     
     try:
-        # Get user settings for API keys
         settings = db_manager.get_user_settings(user_id)
-        if settings.get('gemini_api_keys'):
-            gemini_analyzer.set_api_keys(settings['gemini_api_keys'])
-        
-        # Call Gemini API for nutrition analysis
-        nutrition_data = gemini_analyzer.analyze_meal(
-            meal_description, 
-            meal_time,
-            temperature=settings.get('ai_temperature', 0.5)
+        analyses = gemini_analyzer.analyze_meals(
+            meals,
+            temperature=settings.get('ai_temperature', 0.5),
+            use_cache=use_cache,
+            api_keys=settings.get('gemini_api_keys')
         )
+        analyzed = [index for index, analysis in enumerate(analyses) if 'nutrition_data' in analysis]
+        meal_ids = db_manager.store_meals(user_id, [analyses[index]['nutrition_data'] for index in analyzed])
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    results = [{'index': index, 'success': False, 'error': analysis.get('error')} for index, analysis in enumerate(analyses)]
+    for index, meal_id in zip(analyzed, meal_ids):
+        results[index] = {'index': index, 'success': True, 'meal_id': meal_id,
+                          'nutrition_data': analyses[index]['nutrition_data']}
+    return jsonify({'success': bool(meal_ids), 'stored': len(meal_ids), 'failed': len(meals) - len(meal_ids),
+                    'results': results})
+
+@app.route('/api/jobs/<job_id>')
+def get_analysis_job(job_id):
+    """Status of a queued meal analysis; finished jobs include meal_id and nutrition_data or error"""
+    job = analysis_jobs.get(job_id, user_id=request.args.get('user_id', 1))
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/events')
+def analysis_job_events(job_id):
+    """
+    Server-Sent Events: a 'status' event on every change, then one 'done' or 'failed' event.
+    A stream lasts at most JOB_EVENTS_SECONDS; it then ends with a 'timeout' event
+    carrying status_url, and the client polls that instead.
+    """
+    user_id = request.args.get('user_id', 1)
+    if not analysis_jobs.get(job_id, user_id=user_id):
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    status_url = f'/api/jobs/{job_id}?user_id={user_id}'
+    
+    def events():
+        last_status = None
+        deadline = time.monotonic() + JOB_EVENTS_SECONDS
+        while True:
+            job = analysis_jobs.get(job_id, user_id=user_id)
+            if job is None:
+                # Expired and cleaned up while the stream was open
+                gone = {'job_id': job_id, 'status': 'failed', 'error': 'Job not found'}
+                yield f"event: failed\ndata: {json.dumps(gone)}\n\n"
+                return
+            if job['status'] in ('done', 'failed'):
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            analysis_jobs.wait_for_change(min(15, remaining))
+        timeout = {'job_id': job_id, 'status': last_status, 'status_url': status_url}
+        yield f"event: timeout\ndata: {json.dumps(timeout)}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/foods/search')
+def search_foods():
+    """Look up the local food table by name prefix (?prefix=1) or by words (?q=...&limit=10)"""
+    if not food_db:
+        return jsonify({'foods': [], 'enabled': False})
+    foods = food_db.search(
+        request.args.get('q', ''),
+        limit=min(int(request.args.get('limit', 10)), 50),
+        prefix=request.args.get('prefix', '0').lower() in ('1', 'true', 'yes')
+    )
+    return jsonify({'foods': foods})
+
+@app.route('/api/meals/bulk', methods=['POST'])
+def bulk_import_meals():
+    """
+    Import already-structured meals from CSV or JSON Lines in one transaction.
+    Send the file as multipart field 'file' or as the raw request body;
+    use ?format=csv|jsonl when the content type or filename is ambiguous.
+    """
+    user_id = request.args.get('user_id', 1)
+    upload = request.files.get('file')
+    
+    try:
+        if upload:
+            fmt = detect_format(upload.mimetype, upload.filename, request.args.get('format'))
+            stream = upload.stream
+        else:
+            fmt = detect_format(request.content_type, None, request.args.get('format'))
+            stream = request.stream
         
-        # Store in database
-        meal_id = db_manager.store_meal(user_id, nutrition_data)
+        report = ImportReport()
+        records = valid_records(iter_raw_records(stream, fmt), report)
+        report.imported = db_manager.bulk_store_meals(user_id, records)
         
-        return jsonify({
-            'success': True,
-            'meal_id': meal_id,
-            'nutrition_data': nutrition_data
-        })
+        return jsonify({'success': True, **report.as_dict()})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@app.route('/api/export')
+def export_meals():
+    """
+    Stream a user's full meal history as NDJSON (default) or CSV.
+    Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD limits the date range; the
+    response is gzip-encoded when the client accepts it.
+    """
+    user_id = request.args.get('user_id', 1)
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in ('ndjson', 'jsonl', 'csv'):
+        return jsonify({'success': False, 'error': f'Unsupported export format: {fmt}'}), 400
+    
+    records = db_manager.iter_meal_export(
+        user_id,
+        start_date=request.args.get('start'),
+        end_date=request.args.get('end')
+    )
+    if fmt == 'csv':
+        chunks = csv_chunks(records)
+        mimetype, extension = 'text/csv', 'csv'
+    else:
+        chunks = ndjson_chunks(records)
+        mimetype, extension = 'application/x-ndjson', 'ndjson'
+    
+    headers = {'Content-Disposition': f'attachment; filename=chundiet-export.{extension}'}
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and request.args.get('gzip', '1') != '0':
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
 @app.route('/api/daily-summary/<date_str>')
 def get_daily_summary(date_str):
     """Get aggregated nutrition data for a specific date"""
@@ -65,12 +356,36 @@ def get_daily_summary(date_str):
     summary = db_manager.get_daily_summary(user_id, date_str)
     return jsonify(summary)
 
+@app.route('/api/micronutrients/<date_str>')
+def get_micronutrients(date_str):
+    """Get vitamin/mineral %DV totals for a day or the week ending on date_str"""
+    user_id = request.args.get('user_id', 1)
+    period = request.args.get('period', 'day')
+    days = 7 if period == 'week' else 1
+    totals = db_manager.get_micronutrient_totals(user_id, date_str, days)
+    return jsonify(totals)
+
+@app.route('/api/meals')
+def list_meals():
+    """List individual meals newest first with cursor pagination (?limit=20&cursor=...)"""
+    user_id = request.args.get('user_id', 1)
+    try:
+        page = db_manager.list_meals(
+            user_id,
+            limit=int(request.args.get('limit', 20)),
+            cursor_token=request.args.get('cursor')
+        )
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
 @app.route('/api/history')
 def get_history():
     """Get nutrition history with pagination"""
     user_id = request.args.get('user_id', 1)
     days = int(request.args.get('days', 30))
-    history = db_manager.get_nutrition_history(user_id, days)
+    include_foods = request.args.get('foods', '0').lower() in ('1', 'true', 'yes')
+    history = db_manager.get_nutrition_history(user_id, days, include_foods=include_foods)
     return jsonify(history)
 
 @app.route('/api/ai-recommendations', methods=['GET', 'POST'])
@@ -82,38 +397,66 @@ def get_ai_recommendations():
         # Return stored recommendations
         stored_recommendations = db_manager.get_stored_recommendations(user_id)
         if stored_recommendations:
+            stored_recommendations.pop('input_fingerprint', None)
             return jsonify(stored_recommendations)
         else:
             return jsonify({'recommendations': [], 'message': 'No recommendations found'})
     
     elif request.method == 'POST':
-        # Generate new recommendations
+        # Generate new recommendations unless the stored ones were made from the same inputs;
+        # "force": true always generates
         try:
-            # Get user's recent nutrition data
-            recent_data = db_manager.get_recent_nutrition_summary(user_id, days=7)
-            user_profile = db_manager.get_user_profile(user_id)
-            user_goals = db_manager.get_user_goals(user_id)
-            
-            # Get user settings for API keys
-            settings = db_manager.get_user_settings(user_id)
-            if settings.get('gemini_api_keys'):
-                gemini_analyzer.set_api_keys(settings['gemini_api_keys'])
+            inputs = recommendation_inputs(user_id)
+            stored = None if request.get_json().get('force') else db_manager.get_stored_recommendations(user_id)
+            if stored:
+                state = recommendation_refresher.classify(stored.pop('input_fingerprint', None), inputs[-1])
+                if state == FRESH:
+                    return jsonify({**stored, 'cache_status': 'fresh'})
+                if state == STALE:
+                    # Answer now; the next request sees the regenerated plan
+                    refreshing = recommendation_refresher.refresh(
+                        user_id, lambda: generate_and_store_recommendations(user_id)
+                    )
+                    return jsonify({**stored, 'cache_status': 'stale', 'refreshing': refreshing})
             
-            # Generate recommendations via Gemini
-            recommendations = gemini_analyzer.generate_recommendations(
-                recent_data, 
-                user_profile,
-                user_goals,
-                temperature=settings.get('ai_temperature', 0.7)
-            )
-            
-            # Store recommendations in database
-            db_manager.store_recommendations(user_id, recommendations)
-            
-            return jsonify(recommendations)
+            recommendations = generate_and_store_recommendations(user_id, inputs)
+            return jsonify({**recommendations, 'cache_status': 'generated'})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
 
+@app.route('/api/ai-recommendations/history')
+def list_recommendation_versions():
+    """List past recommendation versions newest first (?limit=20), without their bodies"""
+    user_id = request.args.get('user_id', 1)
+    try:
+        versions = db_manager.list_recommendation_versions(user_id, limit=int(request.args.get('limit', 20)))
+        return jsonify({'versions': versions})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/ai-recommendations/history/<int:version>')
+def get_recommendation_version(version):
+    """Get one past recommendation version"""
+    user_id = request.args.get('user_id', 1)
+    entry = db_manager.get_recommendation_version(user_id, version)
+    if not entry:
+        return jsonify({'success': False, 'error': 'Version not found'}), 404
+    return jsonify(entry)
+
+@app.route('/api/ai-recommendations/diff')
+def diff_recommendation_versions():
+    """Compare two recommendation versions (?from=1&to=2)"""
+    user_id = request.args.get('user_id', 1)
+    try:
+        diff = db_manager.diff_recommendation_versions(
+            user_id, int(request.args['from']), int(request.args['to'])
+        )
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'from and to must be version numbers'}), 400
+    if not diff:
+        return jsonify({'success': False, 'error': 'Version not found'}), 404
+    return jsonify(diff)
+
 @app.route('/api/user/profile', methods=['GET', 'POST'])
 def user_profile():
     """Get or update user profile"""
@@ -171,6 +514,44 @@ def user_goals():
         success = db_manager.update_user_goals(user_id, goals_data)
         return jsonify({'success': success})
 
+@app.route('/api/admin/db-stats')
+def db_stats():
+    """Connection pool and write queue statistics for sizing and tuning"""
+    stats = {
+        'pool': db_manager.pool_stats(),
+        'writer': db_manager.writer_stats(),
+        'maintenance': maintenance_scheduler.last_report
+    }
+    if isinstance(db_manager, ShardedDatabaseManager):
+        stats['shards'] = db_manager.shard_stats()
+    return jsonify(stats)
+
+@app.route('/api/admin/jobs')
+def analysis_job_stats():
+    """Async meal analysis queue depth, worker count and wait/run times"""
+    return jsonify(analysis_jobs.stats())
+
+@app.route('/api/admin/analysis-cache')
+def analysis_cache_stats():
+    """Hit/miss counters and sizes of the Gemini meal analysis cache and similarity index"""
+    return jsonify(gemini_analyzer.cache_stats())
+
+@app.route('/api/admin/recommendation-cache')
+def recommendation_cache_stats():
+    """How often stored recommendations were reused, refreshed in the background or regenerated"""
+    return jsonify(recommendation_refresher.stats())
+
+@app.route('/api/admin/gemini-keys')
+def gemini_key_stats():
+    """Per-key health, circuit breaker state and rate-limit budget of the Gemini API keys"""
+    return jsonify(gemini_analyzer.key_stats())
+
+@app.route('/api/admin/query-stats')
+def query_stats():
+    """Per-query latency histograms and recent slow queries with their plans (CHUNDIET_QUERY_STATS=1)"""
+    stats = db_manager.query_stats(limit=int(request.args.get('limit', 20)))
+    return jsonify(stats or {'enabled': False})
+
 if __name__ == '__main__':
     init_db()
     port = int(os.environ.get('PORT', 5000))
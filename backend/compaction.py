@@ -0,0 +1,172 @@
+"""
+Cold-data archival and routine SQLite upkeep.
+
+Meals older than the archive horizon are moved into meals_archive. Each one
+keeps its day, time, food name and gram totals, but its nutrition_entries row,
+text macros, vitamins JSON and micronutrient rows are dropped. daily_totals
+does not change, so history charts look the same. The hot tables then only
+hold recent meals and fit in the page cache.
+
+Candidates are found with short reads over the primary key. Each batch is
+then archived in its own small write, so the write lock is only ever held
+for one batch. After archiving, PRAGMA optimize runs, and VACUUM runs once
+enough pages are free. MaintenanceScheduler repeats all of this on a timer.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+# get_recent_nutrition_summary reads a 7-day window of full meal rows
+MIN_ARCHIVE_DAYS = 14
+
+
+def archive_cutoff(archive_after_days: int) -> str:
+    """First day that stays hot; meals logged before it are archived"""
+    if archive_after_days < MIN_ARCHIVE_DAYS:
+        raise ValueError(f"archive_after_days must be at least {MIN_ARCHIVE_DAYS}")
+    return (datetime.utcnow().date() - timedelta(days=archive_after_days)).isoformat()
+
+
+def find_archive_candidates(cursor, cutoff: str, after_id: int, batch_size: int,
+                            scan_limit: int = 20000) -> Tuple[List[int], int]:
+    """
+    Return up to batch_size meal ids older than cutoff with id > after_id,
+    and the last id scanned. Walks the primary key in bounded windows so a
+    call never reads the whole table.
+    """
+    rows = cursor.execute('''
+        SELECT id, date_logged < ? FROM meals
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (cutoff, after_id, scan_limit)).fetchall()
+
+    meal_ids = []
+    last_id = after_id
+    for meal_id, is_old in rows:
+        last_id = meal_id
+        if is_old:
+            meal_ids.append(meal_id)
+            if len(meal_ids) >= batch_size:
+                break
+    return meal_ids, last_id
+
+
+def archive_meals(cursor, meal_ids: List[int], cutoff: str) -> int:
+    """Move the given meals (if still older than cutoff) into meals_archive; runs inside a write"""
+    if not meal_ids:
+        return 0
+    ids_json = '[' + ','.join(str(int(meal_id)) for meal_id in meal_ids) + ']'
+
+    cursor.execute('''
+        INSERT INTO meals_archive (
+            id, user_id, day, consumption_time, food_item, calories,
+            protein_g, carbs_g, fiber_g, sugars_g, fat_g, saturated_fat_g
+        )
+        SELECT
+            m.id,
+            m.user_id,
+            DATE(m.date_logged),
+            m.consumption_time,
+            m.food_item,
+            SUM(n.calories),
+            SUM(n.protein_g),
+            SUM(n.carbs_g),
+            SUM(n.fiber_g),
+            SUM(n.sugars_g),
+            SUM(n.fat_g),
+            SUM(n.saturated_fat_g)
+        FROM meals m
+        JOIN nutrition_entries n ON m.id = n.meal_id
+        WHERE m.id IN (SELECT value FROM json_each(?)) AND m.date_logged < ?
+        GROUP BY m.id
+    ''', (ids_json, cutoff))
+    archived = cursor.rowcount
+
+    # Only rows that made it into the archive are removed from the hot tables
+    cursor.execute('''
+        DELETE FROM micronutrients WHERE entry_id IN (
+            SELECT n.id FROM nutrition_entries n
+            JOIN meals_archive a ON a.id = n.meal_id
+            WHERE n.meal_id IN (SELECT value FROM json_each(?))
+        )
+    ''', (ids_json,))
+    cursor.execute('''
+        DELETE FROM nutrition_entries
+        WHERE meal_id IN (SELECT value FROM json_each(?))
+          AND meal_id IN (SELECT id FROM meals_archive)
+    ''', (ids_json,))
+    cursor.execute('''
+        DELETE FROM meals
+        WHERE id IN (SELECT value FROM json_each(?))
+          AND id IN (SELECT id FROM meals_archive)
+    ''', (ids_json,))
+    return archived
+
+
+def optimize_database(conn, analyze: bool = False, vacuum_threshold: float = 0.25) -> Dict:
+    """
+    Refresh planner statistics and reclaim free pages. Needs a connection
+    in autocommit mode (isolation_level=None) with no open transaction.
+    """
+    started = time.perf_counter()
+    # Bounded sampling keeps optimize cheap on large tables
+    conn.execute('PRAGMA analysis_limit = 1000')
+    if analyze:
+        conn.execute('ANALYZE')
+    conn.execute('PRAGMA optimize')
+
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    free_ratio = free_pages / page_count if page_count else 0.0
+    vacuumed = free_ratio >= vacuum_threshold
+    if vacuumed:
+        conn.execute('VACUUM')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    return {
+        'analyzed': analyze,
+        'vacuumed': vacuumed,
+        'free_ratio': round(free_ratio, 3),
+        'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+class MaintenanceScheduler:
+    """Daemon thread that runs db_manager.run_maintenance() every interval"""
+
+    def __init__(self, db_manager, interval_hours: float = 24, archive_after_days: int = None,
+                 analyze_every: int = 7):
+        self.db_manager = db_manager
+        self.interval_seconds = interval_hours * 3600
+        self.archive_after_days = archive_after_days
+        self.analyze_every = analyze_every
+        self.runs = 0
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name='chundiet-db-maintenance', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # First run after one interval, so startup is never slowed down
+        while not self._stop.wait(self.interval_seconds):
+            self.runs += 1
+            try:
+                self.last_report = self.db_manager.run_maintenance(
+                    archive_after_days=self.archive_after_days,
+                    # A full ANALYZE only every few runs; PRAGMA optimize covers the rest
+                    analyze=self.runs % self.analyze_every == 0
+                )
+                print(f"[MAINTENANCE] {self.last_report}")
+            except Exception as e:
+                print(f"[MAINTENANCE ERROR] {e}")
@@ -0,0 +1,157 @@
+import sqlite3
+import threading
+import time
+from queue import LifoQueue, Empty
+from typing import Dict
+
+from query_stats import InstrumentedConnection
+
+
+class PooledConnection:
+    """Thin proxy around a sqlite3 connection that returns it to the pool on close()"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def __del__(self):
+        # Safety net for code paths that raise before reaching close()
+        self.close()
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a connection returned to the pool.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable SQLite connections.
+    Connections are opened lazily, tuned once with PRAGMAs and handed out
+    LIFO so the warmest connection (and its statement cache) is reused first.
+    """
+
+    def __init__(self, db_path, max_size=8, timeout=30.0, cache_size_kb=16384,
+                 mmap_size=268435456, busy_timeout_ms=5000, cached_statements=256, query_stats=None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        # Optional QueryStats; connections are only instrumented when it is set
+        self.query_stats = query_stats
+
+        self._idle = LifoQueue()
+        self._lock = threading.Lock()
+        self._all = []
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'reused': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'rollbacks_on_release': 0
+        }
+
+    def create_connection(self):
+        """Open a new connection with the tuned PRAGMAs (also used for dedicated connections)"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=InstrumentedConnection if self.query_stats else sqlite3.Connection
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # Negative cache_size is interpreted by SQLite as KiB rather than pages
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if self.query_stats:
+            conn.query_stats = self.query_stats
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection, opening a new one if the pool is not yet full"""
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._stats['checkouts'] += 1
+                self._stats['reused'] += 1
+            return PooledConnection(self, conn)
+        except Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.max_size:
+                conn = self.create_connection()
+                self._all.append(conn)
+                self._stats['created'] += 1
+                self._stats['checkouts'] += 1
+                return PooledConnection(self, conn)
+
+        # Pool exhausted: wait for another thread to release a connection
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except Empty:
+            raise TimeoutError(f"Timed out after {self.timeout}s waiting for a database connection")
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['reused'] += 1
+            self._stats['waits'] += 1
+            self._stats['wait_time_ms'] += waited_ms
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        if self.query_stats:
+            conn.finish_statements()
+        if conn.in_transaction:
+            conn.rollback()
+            with self._lock:
+                self._stats['rollbacks_on_release'] += 1
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Close every idle connection and reset the pool"""
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except Empty:
+                    break
+                conn.close()
+                if conn in self._all:
+                    self._all.remove(conn)
+
+    def stats(self) -> Dict:
+        """Return a snapshot of pool usage counters for sizing the pool"""
+        with self._lock:
+            stats = dict(self._stats)
+            total = len(self._all)
+        idle = self._idle.qsize()
+        stats.update({
+            'max_size': self.max_size,
+            'open': total,
+            'idle': idle,
+            'in_use': total - idle,
+            'avg_wait_ms': stats['wait_time_ms'] / stats['waits'] if stats['waits'] else 0.0
+        })
+        return stats
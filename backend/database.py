@@ -1,64 +1,386 @@
-import sqlite3
 import json
-from datetime import datetime, date, timedelta
-from typing import Dict, List, Any
+import os
+import base64
+import time
+from typing import Callable, Dict, Iterable, Iterator, List
+from concurrent.futures import Future
+from connection_pool import ConnectionPool
+from write_queue import WriteQueue
+from storage import StorageBackend
+from nutrient_parser import parse_macros
+from itertools import islice
+from rollups import apply_meal_to_daily_totals, apply_meal_range_to_daily_totals, rebuild_daily_totals
+from micronutrients import store_micronutrients, store_micronutrients_many
+from recommendation_history import (
+    decode_payload, encode_payload, history_limit, recommendation_document, split_recommendations
+)
+from meal_import import SpooledRecords
+from compaction import archive_cutoff, archive_meals, find_archive_candidates, optimize_database
 
-class DatabaseManager:
-    def __init__(self, db_path):
+class DatabaseManager(StorageBackend):
+    """SQLite storage backend"""
+    
+    def __init__(self, db_path, pool_size=8, single_writer=True, write_timeout=None, **pool_options):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, max_size=pool_size, **pool_options)
+        # All writes go through one writer thread that group-commits them;
+        # reads keep using the pool
+        self.writer = WriteQueue(self.pool.create_connection) if single_writer else None
+        # Longest a request waits for its write to commit (CHUNDIET_WRITE_TIMEOUT seconds)
+        self.write_timeout = write_timeout if write_timeout is not None else float(
+            os.environ.get('CHUNDIET_WRITE_TIMEOUT', 60)
+        )
     
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Check out a pooled connection; close() hands it back to the pool"""
+        return self.pool.acquire()
     
-    def store_meal(self, user_id: int, nutrition_data: Dict) -> int:
-        """Store meal and nutrition data, return meal_id"""
+    def pool_stats(self) -> Dict:
+        """Connection pool usage counters"""
+        return self.pool.stats()
+    
+    def writer_stats(self) -> Dict:
+        """Write queue depth, batch sizes and commit latency"""
+        return self.writer.stats() if self.writer else {}
+    
+    def query_stats(self, limit: int = 20) -> Dict:
+        """Per-statement timings and slow queries (only with CHUNDIET_QUERY_STATS on)"""
+        return self.pool.query_stats.snapshot(limit) if self.pool.query_stats else {}
+    
+    def submit_write(self, op: Callable, *args, **kwargs) -> Future:
+        """
+        Run op(cursor, *args, **kwargs) as one write and return a Future for its
+        result. With the single writer enabled the call returns immediately and
+        the Future resolves once the batch containing it has committed.
+        """
+        if self.writer:
+            return self.writer.submit(op, *args, **kwargs)
+        
+        future = Future()
         conn = self.get_connection()
         cursor = conn.cursor()
-        
         try:
-            # Insert meal record
-            cursor.execute('''
-                INSERT INTO meals (user_id, food_item, consumption_time)
-                VALUES (?, ?, ?)
-            ''', (
-                user_id,
-                nutrition_data['food_item'],
-                nutrition_data.get('consumption_time')
-            ))
-            
-            meal_id = cursor.lastrowid
-            
-            # Insert nutrition data
-            nutritional_values = nutrition_data['nutritional_values']
-            carbs = nutritional_values['carbohydrates']
-            fats = nutritional_values['fat']
-            vitamins_json = json.dumps(nutritional_values['vitamins'])
+            cursor.execute('BEGIN IMMEDIATE')
+            result = op(cursor, *args, **kwargs)
+            conn.commit()
+            future.set_result(result)
+        except Exception as e:
+            conn.rollback()
+            future.set_exception(e)
+        finally:
+            conn.close()
+        return future
+    
+    def close(self):
+        """Drain the write queue and close pooled connections"""
+        if self.writer:
+            self.writer.close()
+        self.pool.close_all()
+    
+    def rebuild_daily_totals(self, verify_only: bool = False) -> Dict:
+        """Recompute the daily_totals rollup from raw meals and report drift"""
+        # Operator-run and possibly long: no timeout (a failed writer still fails the Future)
+        return self.submit_write(rebuild_daily_totals, verify_only=verify_only).result()
+    
+    def archive_old_meals(self, archive_after_days: int, batch_size: int = 500, pause: float = 0.05) -> Dict:
+        """
+        Move meals logged more than archive_after_days ago into meals_archive,
+        one short write per batch so other writes interleave
+        """
+        cutoff = archive_cutoff(archive_after_days)
+        archived = 0
+        batches = 0
+        after_id = 0
+        
+        while True:
+            conn = self.get_connection()
+            try:
+                meal_ids, last_id = find_archive_candidates(conn.cursor(), cutoff, after_id, batch_size)
+            finally:
+                conn.close()
+            if last_id == after_id:
+                break
             
-            cursor.execute('''
+            if meal_ids:
+                archived += self.submit_write(archive_meals, meal_ids, cutoff).result(self.write_timeout)
+                batches += 1
+                time.sleep(pause)
+            after_id = last_id
+        
+        return {'cutoff': cutoff, 'archived': archived, 'batches': batches}
+    
+    def run_maintenance(self, archive_after_days: int = None, analyze: bool = False,
+                        vacuum_threshold: float = 0.25) -> Dict:
+        """Archive cold meals (if configured), then PRAGMA optimize / ANALYZE / VACUUM"""
+        report = {}
+        if archive_after_days:
+            report['archive'] = self.archive_old_meals(archive_after_days)
+        
+        # Dedicated autocommit connection: VACUUM cannot run inside a transaction
+        conn = self.pool.create_connection()
+        conn.isolation_level = None
+        try:
+            report['optimize'] = optimize_database(conn, analyze=analyze, vacuum_threshold=vacuum_threshold)
+        finally:
+            conn.close()
+        return report
+    
+    def store_meal_async(self, user_id: int, nutrition_data: Dict) -> Future:
+        """Queue a meal insert; the Future resolves to the new meal_id"""
+        return self.submit_write(self._store_meal_op, user_id, nutrition_data)
+    
+    def store_meal(self, user_id: int, nutrition_data: Dict) -> int:
+        """Store meal and nutrition data, return meal_id"""
+        return self.store_meal_async(user_id, nutrition_data).result(self.write_timeout)
+    
+    def store_meals(self, user_id: int, meals: List[Dict]) -> List[int]:
+        """Store several meals in one transaction, return their meal_ids in order"""
+        return self.submit_write(self._store_meals_op, user_id, meals).result(self.write_timeout)
+    
+    def _store_meals_op(self, cursor, user_id: int, meals: List[Dict]) -> List[int]:
+        return [self._store_meal_op(cursor, user_id, nutrition_data) for nutrition_data in meals]
+    
+    def _store_meal_op(self, cursor, user_id: int, nutrition_data: Dict) -> int:
+        # Insert meal record
+        cursor.execute('''
+            INSERT INTO meals (user_id, food_item, consumption_time)
+            VALUES (?, ?, ?)
+        ''', (
+            user_id,
+            nutrition_data['food_item'],
+            nutrition_data.get('consumption_time')
+        ))
+        
+        meal_id = cursor.lastrowid
+        
+        # Insert nutrition data
+        nutritional_values = nutrition_data['nutritional_values']
+        carbs = nutritional_values['carbohydrates']
+        fats = nutritional_values['fat']
+        vitamins_json = json.dumps(nutritional_values['vitamins'])
+        # Parse unit strings once here so aggregates can SUM() plain numbers
+        grams = parse_macros(nutritional_values)
+        
+        cursor.execute('''
+            INSERT INTO nutrition_entries (
+                meal_id, serving_size, calories, protein,
+                total_carbohydrates, fiber, sugars,
+                total_fat, saturated_fat, vitamins,
+                protein_g, carbs_g, fiber_g, sugars_g,
+                fat_g, saturated_fat_g
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            meal_id,
+            nutritional_values['serving_size'],
+            nutritional_values['calories'],
+            nutritional_values['protein'],
+            carbs['total'],
+            carbs['fiber'],
+            carbs['sugars'],
+            fats['total'],
+            fats['saturated'],
+            vitamins_json,
+            grams['protein_g'],
+            grams['carbs_g'],
+            grams['fiber_g'],
+            grams['sugars_g'],
+            grams['fat_g'],
+            grams['saturated_fat_g']
+        ))
+        
+        # Normalized per-nutrient rows for %DV aggregation in SQL
+        store_micronutrients(cursor, cursor.lastrowid, nutritional_values['vitamins'])
+        
+        # Keep the per-day rollup in step within the same transaction
+        apply_meal_to_daily_totals(cursor, meal_id, sign=1)
+        return meal_id
+    
+    @staticmethod
+    def _next_autoincrement_id(cursor, table: str) -> int:
+        """Next id an AUTOINCREMENT table would assign (never reuses deleted ids)"""
+        max_id = cursor.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 0
+        row = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+        return max(max_id, row[0] if row else 0) + 1
+    
+    def bulk_store_meals(self, user_id: int, records: Iterable[Dict], chunk_size: int = 500) -> int:
+        """
+        Store already-validated nutrition records in one transaction using
+        chunked executemany batches. `records` may be a lazy iterator (e.g. an
+        upload still arriving): it is spooled on the calling thread first, so
+        the writer thread only reads local data while it holds the write lock.
+        Returns the number of meals stored.
+        """
+        with SpooledRecords(records) as spooled:
+            if not spooled:
+                return 0
+            future = self.submit_write(self._bulk_store_meals_op, user_id, spooled, chunk_size)
+            return future.result(self.write_timeout)
+    
+    def _bulk_store_meals_op(self, cursor, user_id: int, records: Iterable[Dict], chunk_size: int = 500) -> int:
+        # The writer holds the write lock for the whole import, so pre-assigned ids stay free
+        records = iter(records)
+        stored = 0
+        next_meal_id = self._next_autoincrement_id(cursor, 'meals')
+        next_entry_id = self._next_autoincrement_id(cursor, 'nutrition_entries')
+        
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+        
+            meal_rows = []
+            entry_rows = []
+            vitamin_rows = []
+            first_meal_id = next_meal_id
+            for nutrition_data in chunk:
+                nutritional_values = nutrition_data['nutritional_values']
+                carbs = nutritional_values['carbohydrates']
+                fats = nutritional_values['fat']
+                grams = parse_macros(nutritional_values)
+        
+                meal_rows.append((
+                    next_meal_id,
+                    user_id,
+                    nutrition_data['food_item'],
+                    nutrition_data.get('consumption_time'),
+                    nutrition_data.get('date_logged')
+                ))
+                entry_rows.append((
+                    next_entry_id,
+                    next_meal_id,
+                    nutritional_values['serving_size'],
+                    nutritional_values['calories'],
+                    nutritional_values['protein'],
+                    carbs['total'],
+                    carbs['fiber'],
+                    carbs['sugars'],
+                    fats['total'],
+                    fats['saturated'],
+                    json.dumps(nutritional_values['vitamins']),
+                    grams['protein_g'],
+                    grams['carbs_g'],
+                    grams['fiber_g'],
+                    grams['sugars_g'],
+                    grams['fat_g'],
+                    grams['saturated_fat_g']
+                ))
+                vitamin_rows.append((next_entry_id, nutritional_values['vitamins']))
+                next_meal_id += 1
+                next_entry_id += 1
+        
+            cursor.executemany('''
+                INSERT INTO meals (id, user_id, food_item, consumption_time, date_logged)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_DATE))
+            ''', meal_rows)
+            cursor.executemany('''
                 INSERT INTO nutrition_entries (
-                    meal_id, serving_size, calories, protein,
+                    id, meal_id, serving_size, calories, protein,
                     total_carbohydrates, fiber, sugars,
-                    total_fat, saturated_fat, vitamins
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                meal_id,
-                nutritional_values['serving_size'],
-                nutritional_values['calories'],
-                nutritional_values['protein'],
-                carbs['total'],
-                carbs['fiber'],
-                carbs['sugars'],
-                fats['total'],
-                fats['saturated'],
-                vitamins_json
-            ))
-            
-            conn.commit()
-            return meal_id
+                    total_fat, saturated_fat, vitamins,
+                    protein_g, carbs_g, fiber_g, sugars_g,
+                    fat_g, saturated_fat_g
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', entry_rows)
+            store_micronutrients_many(cursor, vitamin_rows)
+            apply_meal_range_to_daily_totals(cursor, first_meal_id, next_meal_id - 1)
+            stored += len(chunk)
+        return stored
+    
+    def iter_meal_export(self, user_id: int, start_date: str = None, end_date: str = None,
+                         chunk_size: int = 500) -> Iterator[Dict]:
+        """
+        Yield every meal of a user (optionally within [start_date, end_date])
+        as an import-compatible record, reading the cursor in chunks.
+        The pooled connection is held until the generator is exhausted or closed.
+        """
+        conditions = ['m.user_id = ?']
+        archive_conditions = ['a.user_id = ?']
+        params = [user_id]
+        archive_params = [user_id]
+        if start_date:
+            conditions.append('m.date_logged >= ?')
+            archive_conditions.append('a.day >= DATE(?)')
+            params.append(start_date)
+            archive_params.append(start_date)
+        if end_date:
+            conditions.append("m.date_logged < DATE(?, '+1 day')")
+            archive_conditions.append('a.day <= DATE(?)')
+            params.append(end_date)
+            archive_params.append(end_date)
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            # Archived meals only kept gram totals, so they come back without
+            # serving size or vitamins
+            cursor.execute(f'''
+                SELECT 
+                    m.id,
+                    m.food_item,
+                    m.consumption_time,
+                    m.date_logged,
+                    n.serving_size,
+                    n.calories,
+                    n.protein,
+                    n.total_carbohydrates,
+                    n.fiber,
+                    n.sugars,
+                    n.total_fat,
+                    n.saturated_fat,
+                    n.vitamins,
+                    0 AS archived
+                FROM meals m
+                JOIN nutrition_entries n ON m.id = n.meal_id
+                WHERE {' AND '.join(conditions)}
+                UNION ALL
+                SELECT 
+                    a.id,
+                    a.food_item,
+                    a.consumption_time,
+                    a.day,
+                    NULL,
+                    a.calories,
+                    a.protein_g,
+                    a.carbs_g,
+                    a.fiber_g,
+                    a.sugars_g,
+                    a.fat_g,
+                    a.saturated_fat_g,
+                    NULL,
+                    1 AS archived
+                FROM meals_archive a
+                WHERE {' AND '.join(archive_conditions)}
+                ORDER BY 4, 3, 1
+            ''', params + archive_params)
             
-        except Exception as e:
-            conn.rollback()
-            raise e
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    if row[13]:
+                        row = row[:6] + tuple(f"{grams or 0:g}g" for grams in row[6:12]) + row[12:]
+                    yield {
+                        'id': row[0],
+                        'food_item': row[1],
+                        'consumption_time': row[2],
+                        'date_logged': row[3],
+                        'nutritional_values': {
+                            'serving_size': row[4],
+                            'calories': row[5],
+                            'protein': row[6],
+                            'carbohydrates': {
+                                'total': row[7],
+                                'fiber': row[8],
+                                'sugars': row[9]
+                            },
+                            'fat': {
+                                'total': row[10],
+                                'saturated': row[11]
+                            },
+                            'vitamins': json.loads(row[12]) if row[12] else []
+                        }
+                    }
         finally:
             conn.close()
     
@@ -67,17 +389,19 @@ class DatabaseManager:
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        # Day totals come from the rollup table (single primary key lookup)
         cursor.execute('''
             SELECT 
-                COUNT(*) as meal_count,
-                SUM(calories) as total_calories,
-                GROUP_CONCAT(protein) as proteins,
-                GROUP_CONCAT(total_carbohydrates) as carbs,
-                GROUP_CONCAT(total_fat) as fats,
-                GROUP_CONCAT(m.food_item) as foods
-            FROM meals m
-            JOIN nutrition_entries n ON m.id = n.meal_id
-            WHERE m.user_id = ? AND DATE(m.date_logged) = ?
+                meal_count,
+                calories,
+                protein_g,
+                carbs_g,
+                fat_g,
+                fiber_g,
+                sugars_g,
+                saturated_fat_g
+            FROM daily_totals
+            WHERE user_id = ? AND day = DATE(?)
         ''', (user_id, date_str))
         
         result = cursor.fetchone()
@@ -96,11 +420,21 @@ class DatabaseManager:
                 n.vitamins
             FROM meals m
             JOIN nutrition_entries n ON m.id = n.meal_id
-            WHERE m.user_id = ? AND DATE(m.date_logged) = ?
+            WHERE m.user_id = ? AND m.date_logged >= ? AND m.date_logged < DATE(?, '+1 day')
             ORDER BY m.consumption_time DESC
-        ''', (user_id, date_str))
+        ''', (user_id, date_str, date_str))
         
         meals_detail = cursor.fetchall()
+        foods = [meal[1] for meal in meals_detail]
+        
+        # Meals moved to meals_archive still count in the rollup; list their names too
+        if result and result[0] > len(meals_detail):
+            cursor.execute('''
+                SELECT food_item FROM meals_archive
+                WHERE user_id = ? AND day = DATE(?)
+                ORDER BY consumption_time DESC
+            ''', (user_id, date_str))
+            foods.extend(row[0] for row in cursor.fetchall())
         conn.close()
         
         if result and result[0] > 0:
@@ -108,7 +442,13 @@ class DatabaseManager:
                 'date': date_str,
                 'meal_count': result[0],
                 'total_calories': result[1] or 0,
-                'foods': result[5].split(',') if result[5] else [],
+                'total_protein': round(result[2] or 0, 1),
+                'total_carbs': round(result[3] or 0, 1),
+                'total_fat': round(result[4] or 0, 1),
+                'total_fiber': round(result[5] or 0, 1),
+                'total_sugars': round(result[6] or 0, 1),
+                'total_saturated_fat': round(result[7] or 0, 1),
+                'foods': foods,
                 'meals': [
                     {
                         'id': meal[0],
@@ -129,89 +469,289 @@ class DatabaseManager:
                 'date': date_str,
                 'meal_count': 0,
                 'total_calories': 0,
+                'total_protein': 0,
+                'total_carbs': 0,
+                'total_fat': 0,
+                'total_fiber': 0,
+                'total_sugars': 0,
+                'total_saturated_fat': 0,
                 'foods': [],
                 'meals': [],
                 'summary': 'No meals logged'
             }
     
-    def get_nutrition_history(self, user_id: int, days: int = 30) -> List[Dict]:
-        """Get nutrition history for the past N days"""
+    @staticmethod
+    def encode_meal_cursor(date_logged: str, consumption_time: str, meal_id: int) -> str:
+        """Opaque pagination token for the position after a given meal"""
+        raw = json.dumps([date_logged, consumption_time, meal_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_meal_cursor(token: str):
+        """Inverse of encode_meal_cursor; raises ValueError for malformed tokens"""
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            date_logged, consumption_time, meal_id = json.loads(base64.urlsafe_b64decode(padded))
+            return str(date_logged), consumption_time, int(meal_id)
+        except Exception:
+            raise ValueError("Invalid pagination cursor")
+    
+    def list_meals(self, user_id: int, limit: int = 20, cursor_token: str = None) -> Dict:
+        """
+        List individual meals newest first using keyset pagination on
+        (date_logged, consumption_time, id). Every page is a bounded range scan
+        of idx_meals_user_date, so deep pages cost the same as the first one.
+        """
+        limit = max(1, min(int(limit), 100))
+        params = [user_id]
+        keyset = ''
+        if cursor_token:
+            date_logged, consumption_time, meal_id = self.decode_meal_cursor(cursor_token)
+            # NULL consumption times sort last within a day (SQLite orders NULL lowest)
+            if consumption_time is None:
+                keyset = '''
+                    AND m.date_logged <= ?
+                    AND (m.date_logged < ? OR (m.consumption_time IS NULL AND m.id < ?))
+                '''
+                params += [date_logged, date_logged, meal_id]
+            else:
+                keyset = '''
+                    AND m.date_logged <= ?
+                    AND (m.date_logged < ?
+                         OR m.consumption_time < ?
+                         OR m.consumption_time IS NULL
+                         OR (m.consumption_time = ? AND m.id < ?))
+                '''
+                params += [date_logged, date_logged, consumption_time, consumption_time, meal_id]
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT 
-                DATE(m.date_logged) as date,
-                COUNT(*) as meal_count,
-                SUM(n.calories) as total_calories,
-                GROUP_CONCAT(m.food_item) as foods
+                m.id, 
+                m.food_item, 
+                n.calories, 
+                m.consumption_time,
+                m.date_logged,
+                n.serving_size,
+                n.protein,
+                n.total_carbohydrates,
+                n.total_fat,
+                n.vitamins
             FROM meals m
             JOIN nutrition_entries n ON m.id = n.meal_id
-            WHERE m.user_id = ? AND m.date_logged >= date('now', '-{} days')
-            GROUP BY DATE(m.date_logged)
-            ORDER BY m.date_logged DESC
-        '''.format(days), (user_id,))
+            WHERE m.user_id = ? {keyset}
+            ORDER BY m.date_logged DESC, m.consumption_time DESC, m.id DESC
+            LIMIT ?
+        ''', params + [limit + 1])
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = self.encode_meal_cursor(last[4], last[3], last[0])
+        
+        return {
+            'meals': [
+                {
+                    'id': row[0],
+                    'food_item': row[1],
+                    'calories': row[2],
+                    'time': row[3],
+                    'date': row[4],
+                    'serving_size': row[5],
+                    'protein': row[6],
+                    'carbohydrates': row[7],
+                    'fat': row[8],
+                    'vitamins': json.loads(row[9]) if row[9] else []
+                } for row in rows
+            ],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+    
+    def get_nutrition_history(self, user_id: int, days: int = 30, include_foods: bool = False) -> List[Dict]:
+        """
+        Get nutrition history for the past N days from the daily rollup.
+        Food names are only fetched when include_foods is set, since that
+        requires reading every meal in the window.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT 
+                day,
+                meal_count,
+                calories,
+                protein_g,
+                carbs_g,
+                fat_g
+            FROM daily_totals
+            WHERE user_id = ? AND day >= DATE('now', ?)
+            ORDER BY day DESC
+        ''', (user_id, f'-{int(days)} days'))
         
         results = cursor.fetchall()
+        
+        foods_by_day = {}
+        if include_foods and results:
+            cursor.execute('''
+                SELECT DATE(date_logged), food_item, consumption_time
+                FROM meals
+                WHERE user_id = ? AND date_logged >= DATE('now', ?)
+                UNION ALL
+                SELECT day, food_item, consumption_time
+                FROM meals_archive
+                WHERE user_id = ? AND day >= DATE('now', ?)
+                ORDER BY 1, 3
+            ''', (user_id, f'-{int(days)} days', user_id, f'-{int(days)} days'))
+            for day, food_item, _ in cursor.fetchall():
+                foods_by_day.setdefault(day, []).append(food_item)
         conn.close()
         
         history = []
         for row in results:
-            history.append({
+            entry = {
                 'date': row[0],
                 'meal_count': row[1],
                 'total_calories': row[2] or 0,
-                'foods': row[3].split(',') if row[3] else []
-            })
+                'total_protein': round(row[3] or 0, 1),
+                'total_carbs': round(row[4] or 0, 1),
+                'total_fat': round(row[5] or 0, 1)
+            }
+            if include_foods:
+                entry['foods'] = foods_by_day.get(row[0], [])
+            history.append(entry)
         
         return history
     
+    def get_micronutrient_totals(self, user_id: int, end_date: str, days: int = 1) -> Dict:
+        """
+        Get per-day %DV totals for every vitamin/mineral over the `days` days
+        ending on end_date (inclusive), plus totals and daily averages for the period
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT 
+                DATE(m.date_logged) as day,
+                nu.name,
+                nu.kind,
+                SUM(mi.pct_dv) as pct_dv
+            FROM meals m
+            JOIN nutrition_entries n ON m.id = n.meal_id
+            JOIN micronutrients mi ON mi.entry_id = n.id
+            JOIN nutrients nu ON nu.id = mi.nutrient_id
+            WHERE m.user_id = ? AND m.date_logged >= DATE(?, ?) AND m.date_logged < DATE(?, '+1 day')
+            GROUP BY day, nu.id
+            ORDER BY day, nu.name
+        ''', (user_id, end_date, f'-{int(days) - 1} days', end_date))
+        
+        rows = cursor.fetchall()
+        cursor.execute("SELECT DATE(?, ?), DATE(?)", (end_date, f'-{int(days) - 1} days', end_date))
+        start_date, end_date = cursor.fetchone()
+        conn.close()
+        
+        per_day = {}
+        totals = {}
+        for day, name, kind, pct_dv in rows:
+            per_day.setdefault(day, []).append({'name': name, 'kind': kind, 'pct_dv': round(pct_dv, 1)})
+            total = totals.setdefault(name, {'name': name, 'kind': kind, 'pct_dv': 0.0})
+            total['pct_dv'] += pct_dv
+        
+        for total in totals.values():
+            total['avg_daily_pct_dv'] = round(total['pct_dv'] / int(days), 1)
+            total['pct_dv'] = round(total['pct_dv'], 1)
+        
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'period_days': int(days),
+            'days': [{'date': day, 'nutrients': nutrients} for day, nutrients in per_day.items()],
+            'totals': sorted(totals.values(), key=lambda t: t['name'])
+        }
+    
     def delete_meal(self, meal_id: int, user_id: int) -> bool:
         """Delete a meal and its nutrition data"""
         print(f"[DELETE] DELETE MEAL REQUEST: meal_id={meal_id}, user_id={user_id}")
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Verify the meal belongs to the user
-            cursor.execute('SELECT user_id FROM meals WHERE id = ?', (meal_id,))
-            result = cursor.fetchone()
-            
-            print(f"[CHECK] Meal ownership check: {result}")
-            
-            if not result:
-                print(f"[ERROR] Meal {meal_id} not found")
-                return False
-                
-            if result[0] != user_id:
-                print(f"[ERROR] Meal {meal_id} belongs to user {result[0]}, not {user_id}")
-                return False
-            
-            # Check nutrition entries before deletion
-            cursor.execute('SELECT COUNT(*) FROM nutrition_entries WHERE meal_id = ?', (meal_id,))
-            nutrition_count = cursor.fetchone()[0]
-            print(f"[INFO] Found {nutrition_count} nutrition entries for meal {meal_id}")
-            
-            # Delete nutrition entries first (foreign key constraint)
-            cursor.execute('DELETE FROM nutrition_entries WHERE meal_id = ?', (meal_id,))
-            deleted_nutrition = cursor.rowcount
-            print(f"[DELETE] Deleted {deleted_nutrition} nutrition entries")
-            
-            # Delete the meal
-            cursor.execute('DELETE FROM meals WHERE id = ?', (meal_id,))
-            deleted_meals = cursor.rowcount
-            print(f"[DELETE] Deleted {deleted_meals} meal records")
-            
-            conn.commit()
-            print(f"[SUCCESS] Successfully deleted meal {meal_id}")
-            return True
+            return self.submit_write(self._delete_meal_op, meal_id, user_id).result(self.write_timeout)
         except Exception as e:
             print(f"[ERROR] Meal deletion error: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
+    
+    def _delete_meal_op(self, cursor, meal_id: int, user_id: int) -> bool:
+        # Verify the meal belongs to the user
+        cursor.execute('SELECT user_id FROM meals WHERE id = ?', (meal_id,))
+        result = cursor.fetchone()
+        
+        print(f"[CHECK] Meal ownership check: {result}")
+        
+        if not result:
+            print(f"[ERROR] Meal {meal_id} not found")
+            return False
+        
+        if result[0] != user_id:
+            print(f"[ERROR] Meal {meal_id} belongs to user {result[0]}, not {user_id}")
+            return False
+        
+        # Check nutrition entries before deletion
+        cursor.execute('SELECT COUNT(*) FROM nutrition_entries WHERE meal_id = ?', (meal_id,))
+        nutrition_count = cursor.fetchone()[0]
+        print(f"[INFO] Found {nutrition_count} nutrition entries for meal {meal_id}")
+        
+        # Subtract from the daily rollup while the rows still exist
+        apply_meal_to_daily_totals(cursor, meal_id, sign=-1)
+        
+        cursor.execute('''
+            DELETE FROM micronutrients
+            WHERE entry_id IN (SELECT id FROM nutrition_entries WHERE meal_id = ?)
+        ''', (meal_id,))
+        
+        # Delete nutrition entries first (foreign key constraint)
+        cursor.execute('DELETE FROM nutrition_entries WHERE meal_id = ?', (meal_id,))
+        deleted_nutrition = cursor.rowcount
+        print(f"[DELETE] Deleted {deleted_nutrition} nutrition entries")
+        
+        # Delete the meal
+        cursor.execute('DELETE FROM meals WHERE id = ?', (meal_id,))
+        deleted_meals = cursor.rowcount
+        print(f"[DELETE] Deleted {deleted_meals} meal records")
+        print(f"[SUCCESS] Successfully deleted meal {meal_id}")
+        return True
+    
+    def purge_user(self, user_id: int) -> Dict:
+        """Delete everything stored for a user, return the number of rows removed per table"""
+        return self.submit_write(self._purge_user_op, user_id).result(self.write_timeout)
+    
+    def _purge_user_op(self, cursor, user_id: int) -> Dict:
+        removed = {}
+        # Children first (foreign key constraints)
+        cursor.execute('''
+            DELETE FROM micronutrients WHERE entry_id IN (
+                SELECT n.id FROM nutrition_entries n JOIN meals m ON m.id = n.meal_id WHERE m.user_id = ?
+            )
+        ''', (user_id,))
+        removed['micronutrients'] = cursor.rowcount
+        cursor.execute(
+            'DELETE FROM nutrition_entries WHERE meal_id IN (SELECT id FROM meals WHERE user_id = ?)', (user_id,)
+        )
+        removed['nutrition_entries'] = cursor.rowcount
+        for table in ('meals', 'meals_archive', 'daily_totals', 'recommendations', 'user_goals', 'user_settings'):
+            cursor.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+            removed[table] = cursor.rowcount
+        cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        removed['users'] = cursor.rowcount
+        print(f"[DELETE] Purged user {user_id}: {removed}")
+        return removed
     
     def get_recent_nutrition_summary(self, user_id: int, days: int = 7) -> Dict:
         """Get detailed nutrition summary for AI recommendations"""
@@ -231,7 +771,7 @@ class DatabaseManager:
                 DATE(m.date_logged) as meal_date
             FROM meals m
             JOIN nutrition_entries n ON m.id = n.meal_id
-            WHERE m.user_id = ? AND DATE(m.date_logged) = DATE('now')
+            WHERE m.user_id = ? AND m.date_logged >= DATE('now') AND m.date_logged < DATE('now', '+1 day')
             ORDER BY m.consumption_time DESC
         ''', (user_id,))
         
@@ -250,9 +790,9 @@ class DatabaseManager:
                 DATE(m.date_logged) as meal_date
             FROM meals m
             JOIN nutrition_entries n ON m.id = n.meal_id
-            WHERE m.user_id = ? AND m.date_logged >= date('now', '-{} days') AND DATE(m.date_logged) < DATE('now')
+            WHERE m.user_id = ? AND m.date_logged >= DATE('now', ?) AND m.date_logged < DATE('now')
             ORDER BY m.date_logged DESC, m.consumption_time DESC
-        '''.format(days), (user_id,))
+        ''', (user_id, f'-{int(days)} days'))
         
         previous_meals = cursor.fetchall()
         
@@ -262,11 +802,14 @@ class DatabaseManager:
                 COUNT(DISTINCT DATE(m.date_logged)) as days_with_data,
                 SUM(n.calories) as total_calories,
                 COUNT(*) as total_meals,
-                GROUP_CONCAT(DISTINCT m.food_item) as unique_foods
+                GROUP_CONCAT(DISTINCT m.food_item) as unique_foods,
+                SUM(n.protein_g) as total_protein,
+                SUM(n.carbs_g) as total_carbs,
+                SUM(n.fat_g) as total_fat
             FROM meals m
             JOIN nutrition_entries n ON m.id = n.meal_id
-            WHERE m.user_id = ? AND m.date_logged >= date('now', '-{} days')
-        '''.format(days), (user_id,))
+            WHERE m.user_id = ? AND m.date_logged >= DATE('now', ?)
+        ''', (user_id, f'-{int(days)} days'))
         
         stats = cursor.fetchone()
         
@@ -274,6 +817,9 @@ class DatabaseManager:
         days_with_data = stats[0] or 0
         total_calories = stats[1] or 0
         avg_daily_calories = total_calories / days_with_data if days_with_data > 0 else 0
+        total_protein = stats[4] or 0
+        total_carbs = stats[5] or 0
+        total_fat = stats[6] or 0
         
         conn.close()
         
@@ -296,6 +842,12 @@ class DatabaseManager:
             'avg_daily_calories': avg_daily_calories,
             'total_calories': total_calories,
             'total_meals': stats[2] or 0,
+            'total_protein': round(total_protein, 1),
+            'total_carbs': round(total_carbs, 1),
+            'total_fat': round(total_fat, 1),
+            'avg_daily_protein': round(total_protein / days_with_data, 1) if days_with_data > 0 else 0,
+            'avg_daily_carbs': round(total_carbs / days_with_data, 1) if days_with_data > 0 else 0,
+            'avg_daily_fat': round(total_fat / days_with_data, 1) if days_with_data > 0 else 0,
             'food_variety': len(stats[3].split(',')) if stats[3] else 0,
             'unique_foods': stats[3].split(',') if stats[3] else [],
             'today_meals': [format_meal(meal) for meal in today_meals],
@@ -326,58 +878,53 @@ class DatabaseManager:
     
     def update_user_profile(self, user_id: int, profile_data: Dict) -> bool:
         """Update user profile"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Get current profile data
-            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-            current = cursor.fetchone()
-            
-            if current:
-                # Update existing user
-                cursor.execute('''
-                    UPDATE users 
-                    SET name = COALESCE(?, name), 
-                        age = COALESCE(?, age), 
-                        gender = COALESCE(?, gender), 
-                        weight = COALESCE(?, weight), 
-                        height = COALESCE(?, height), 
-                        activity_level = COALESCE(?, activity_level)
-                    WHERE id = ?
-                ''', (
-                    profile_data.get('name') if profile_data.get('name') else None,
-                    profile_data.get('age') if profile_data.get('age') else None,
-                    profile_data.get('gender') if profile_data.get('gender') else None,
-                    profile_data.get('weight') if profile_data.get('weight') else None,
-                    profile_data.get('height') if profile_data.get('height') else None,
-                    profile_data.get('activity_level') if profile_data.get('activity_level') else None,
-                    user_id
-                ))
-            else:
-                # Create new user if doesn't exist
-                cursor.execute('''
-                    INSERT INTO users (id, name, email, age, gender, weight, height, activity_level)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    profile_data.get('name', 'Demo User'),
-                    profile_data.get('email', f'user{user_id}@chundiet.app'),
-                    profile_data.get('age'),
-                    profile_data.get('gender'),
-                    profile_data.get('weight'),
-                    profile_data.get('height'),
-                    profile_data.get('activity_level')
-                ))
-            
-            conn.commit()
-            return True
+            return self.submit_write(self._update_user_profile_op, user_id, profile_data).result(self.write_timeout)
         except Exception as e:
             print(f"Profile update error: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
+    
+    def _update_user_profile_op(self, cursor, user_id: int, profile_data: Dict) -> bool:
+        # Get current profile data
+        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        current = cursor.fetchone()
+        
+        if current:
+            # Update existing user
+            cursor.execute('''
+                UPDATE users 
+                SET name = COALESCE(?, name), 
+                    age = COALESCE(?, age), 
+                    gender = COALESCE(?, gender), 
+                    weight = COALESCE(?, weight), 
+                    height = COALESCE(?, height), 
+                    activity_level = COALESCE(?, activity_level)
+                WHERE id = ?
+            ''', (
+                profile_data.get('name') if profile_data.get('name') else None,
+                profile_data.get('age') if profile_data.get('age') else None,
+                profile_data.get('gender') if profile_data.get('gender') else None,
+                profile_data.get('weight') if profile_data.get('weight') else None,
+                profile_data.get('height') if profile_data.get('height') else None,
+                profile_data.get('activity_level') if profile_data.get('activity_level') else None,
+                user_id
+            ))
+        else:
+            # Create new user if doesn't exist
+            cursor.execute('''
+                INSERT INTO users (id, name, email, age, gender, weight, height, activity_level)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id,
+                profile_data.get('name', 'Demo User'),
+                profile_data.get('email', f'user{user_id}@chundiet.app'),
+                profile_data.get('age'),
+                profile_data.get('gender'),
+                profile_data.get('weight'),
+                profile_data.get('height'),
+                profile_data.get('activity_level')
+            ))
+        return True
     
     def get_user_settings(self, user_id: int) -> Dict:
         """Get user settings"""
@@ -401,112 +948,111 @@ class DatabaseManager:
     
     def update_user_settings(self, user_id: int, settings_data: Dict) -> bool:
         """Update user settings"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Check if settings exist
-            cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
-            current = cursor.fetchone()
-            
-            if current:
-                # Get current values to preserve existing data
-                current_keys = json.loads(current[2]) if current[2] else []
-                
-                cursor.execute('''
-                    UPDATE user_settings 
-                    SET gemini_api_keys = COALESCE(?, gemini_api_keys), 
-                        ai_temperature = COALESCE(?, ai_temperature), 
-                        ai_top_p = COALESCE(?, ai_top_p), 
-                        theme = COALESCE(?, theme), 
-                        units = COALESCE(?, units), 
-                        notifications_enabled = COALESCE(?, notifications_enabled)
-                    WHERE user_id = ?
-                ''', (
-                    json.dumps(settings_data.get('gemini_api_keys')) if 'gemini_api_keys' in settings_data else None,
-                    settings_data.get('ai_temperature') if 'ai_temperature' in settings_data else None,
-                    settings_data.get('ai_top_p') if 'ai_top_p' in settings_data else None,
-                    settings_data.get('theme') if 'theme' in settings_data else None,
-                    settings_data.get('units') if 'units' in settings_data else None,
-                    settings_data.get('notifications_enabled') if 'notifications_enabled' in settings_data else None,
-                    user_id
-                ))
-            else:
-                # Create new settings if doesn't exist
-                cursor.execute('''
-                    INSERT INTO user_settings (user_id, gemini_api_keys, ai_temperature, ai_top_p, theme, units, notifications_enabled)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    json.dumps(settings_data.get('gemini_api_keys', [])),
-                    settings_data.get('ai_temperature', 0.5),
-                    settings_data.get('ai_top_p', 0.9),
-                    settings_data.get('theme', 'dark'),
-                    settings_data.get('units', 'metric'),
-                    settings_data.get('notifications_enabled', True)
-                ))
-            
-            conn.commit()
-            return True
+            return self.submit_write(self._update_user_settings_op, user_id, settings_data).result(self.write_timeout)
         except Exception as e:
             print(f"Settings update error: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
     
-    def store_recommendations(self, user_id: int, recommendations_data: Dict) -> bool:
-        """Store AI-generated recommendations"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _update_user_settings_op(self, cursor, user_id: int, settings_data: Dict) -> bool:
+        # Check if settings exist
+        cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
+        current = cursor.fetchone()
+        
+        if current:
+            # Get current values to preserve existing data
+            current_keys = json.loads(current[2]) if current[2] else []
         
+            cursor.execute('''
+                UPDATE user_settings 
+                SET gemini_api_keys = COALESCE(?, gemini_api_keys), 
+                    ai_temperature = COALESCE(?, ai_temperature), 
+                    ai_top_p = COALESCE(?, ai_top_p), 
+                    theme = COALESCE(?, theme), 
+                    units = COALESCE(?, units), 
+                    notifications_enabled = COALESCE(?, notifications_enabled)
+                WHERE user_id = ?
+            ''', (
+                json.dumps(settings_data.get('gemini_api_keys')) if 'gemini_api_keys' in settings_data else None,
+                settings_data.get('ai_temperature') if 'ai_temperature' in settings_data else None,
+                settings_data.get('ai_top_p') if 'ai_top_p' in settings_data else None,
+                settings_data.get('theme') if 'theme' in settings_data else None,
+                settings_data.get('units') if 'units' in settings_data else None,
+                settings_data.get('notifications_enabled') if 'notifications_enabled' in settings_data else None,
+                user_id
+            ))
+        else:
+            # Create new settings if doesn't exist
+            cursor.execute('''
+                INSERT INTO user_settings (user_id, gemini_api_keys, ai_temperature, ai_top_p, theme, units, notifications_enabled)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id,
+                json.dumps(settings_data.get('gemini_api_keys', [])),
+                settings_data.get('ai_temperature', 0.5),
+                settings_data.get('ai_top_p', 0.9),
+                settings_data.get('theme', 'dark'),
+                settings_data.get('units', 'metric'),
+                settings_data.get('notifications_enabled', True)
+            ))
+        return True
+    
+    def store_recommendations(self, user_id: int, recommendations_data: Dict, input_fingerprint: str = None) -> bool:
+        """Store AI-generated recommendations, tagged with the fingerprint of their inputs"""
         try:
-            # Delete existing recommendations for this user
-            cursor.execute('DELETE FROM recommendations WHERE user_id = ?', (user_id,))
-            
-            # Insert new recommendations - handle both old and new format
-            if 'food_recommendations' in recommendations_data or 'nutritional_analysis' in recommendations_data:
-                # New enhanced format - store entire data structure
-                cursor.execute('''
-                    INSERT INTO recommendations (user_id, recommendations_data, overall_assessment, weekly_goal)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    json.dumps(recommendations_data),
-                    recommendations_data.get('overall_assessment', ''),
-                    recommendations_data.get('weekly_goal', '')
-                ))
-            else:
-                # Legacy format
-                cursor.execute('''
-                    INSERT INTO recommendations (user_id, recommendations_data, overall_assessment, weekly_goal)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    json.dumps(recommendations_data.get('recommendations', [])),
-                    recommendations_data.get('overall_assessment', ''),
-                    recommendations_data.get('weekly_goal', '')
-                ))
-            
-            conn.commit()
-            return True
+            return self.submit_write(self._store_recommendations_op, user_id, recommendations_data,
+                                     input_fingerprint).result(self.write_timeout)
         except Exception as e:
             print(f"Recommendations storage error: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
+    
+    def _store_recommendations_op(self, cursor, user_id: int, recommendations_data: Dict,
+                                  input_fingerprint: str = None) -> bool:
+        # Append a new version; older ones stay readable until retention drops them
+        body, overall_assessment, weekly_goal = split_recommendations(recommendations_data)
+        payload = encode_payload(body)
+        cursor.execute('''
+            SELECT COALESCE(MAX(version), 0) + 1 FROM recommendations WHERE user_id = ?
+        ''', (user_id,))
+        version = cursor.fetchone()[0]
+        
+        cursor.execute('''
+            INSERT INTO recommendations (
+                user_id, version, payload, payload_codec, payload_size, content_hash,
+                overall_assessment, weekly_goal, input_fingerprint
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            version,
+            payload['payload'],
+            payload['payload_codec'],
+            payload['payload_size'],
+            payload['content_hash'],
+            overall_assessment,
+            weekly_goal,
+            input_fingerprint
+        ))
+        
+        keep = history_limit()
+        if keep:
+            cursor.execute('''
+                DELETE FROM recommendations WHERE user_id = ? AND version <= ?
+            ''', (user_id, version - keep))
+        return True
     
     def get_stored_recommendations(self, user_id: int) -> Dict:
-        """Get stored recommendations for user"""
+        """Get the latest stored recommendations for user"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        # Newest entry of idx_recommendations_user (user_id, created_at, rowid)
         cursor.execute('''
-            SELECT recommendations_data, overall_assessment, weekly_goal, created_at
+            SELECT payload, payload_codec, recommendations_data, overall_assessment, weekly_goal,
+                   created_at, version, input_fingerprint
             FROM recommendations 
             WHERE user_id = ? 
-            ORDER BY created_at DESC 
+            ORDER BY created_at DESC, id DESC 
             LIMIT 1
         ''', (user_id,))
         
@@ -514,25 +1060,70 @@ class DatabaseManager:
         conn.close()
         
         if result:
-            recommendations_data = json.loads(result[0]) if result[0] else {}
-            
-            # Check if it's the new enhanced format
-            if isinstance(recommendations_data, dict) and ('food_recommendations' in recommendations_data or 'nutritional_analysis' in recommendations_data):
-                # New enhanced format - return as is with metadata
-                recommendations_data['overall_assessment'] = result[1]
-                recommendations_data['weekly_goal'] = result[2]
-                recommendations_data['created_at'] = result[3]
-                return recommendations_data
-            else:
-                # Legacy format
-                return {
-                    'recommendations': recommendations_data if isinstance(recommendations_data, list) else [],
-                    'overall_assessment': result[1],
-                    'weekly_goal': result[2],
-                    'created_at': result[3]
-                }
+            body = decode_payload(result[0], result[1], result[2])
+            document = recommendation_document(body, result[3], result[4], result[5], result[6])
+            document['input_fingerprint'] = result[7]
+            return document
         return None
     
+    def list_recommendation_versions(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """List stored recommendation versions newest first, without their bodies"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT version, created_at, overall_assessment, weekly_goal, payload_size,
+                   LENGTH(payload), content_hash
+            FROM recommendations
+            WHERE user_id = ?
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ''', (user_id, max(1, min(int(limit), 100))))
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        return [
+            {
+                'version': row[0],
+                'created_at': row[1],
+                'overall_assessment': row[2],
+                'weekly_goal': row[3],
+                'size': row[4],
+                'stored_size': row[5],
+                'content_hash': row[6]
+            } for row in results
+        ]
+    
+    def get_recommendation_version(self, user_id: int, version: int, include_body: bool = True) -> Dict:
+        """Get one stored version; the body is only decompressed when include_body is set"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        body_columns = 'payload, payload_codec, recommendations_data' if include_body else 'NULL, NULL, NULL'
+        cursor.execute(f'''
+            SELECT version, created_at, overall_assessment, weekly_goal, content_hash, {body_columns}
+            FROM recommendations
+            WHERE user_id = ? AND version = ?
+        ''', (user_id, version))
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        if not result:
+            return None
+        entry = {
+            'version': result[0],
+            'created_at': result[1],
+            'overall_assessment': result[2],
+            'weekly_goal': result[3],
+            'content_hash': result[4]
+        }
+        if include_body:
+            body = decode_payload(result[5], result[6], result[7])
+            entry['recommendations'] = recommendation_document(body, result[2], result[3], result[1], result[0])
+        return entry
+    
     def get_user_goals(self, user_id: int) -> Dict:
         """Get user nutrition goals"""
         conn = self.get_connection()
@@ -555,52 +1146,49 @@ class DatabaseManager:
     
     def update_user_goals(self, user_id: int, goals_data: Dict) -> bool:
         """Update user nutrition goals"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Check if goals exist
-            cursor.execute('SELECT id FROM user_goals WHERE user_id = ?', (user_id,))
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Update existing goals
-                cursor.execute('''
-                    UPDATE user_goals 
-                    SET goal_description = ?, 
-                        daily_calories = ?, 
-                        daily_protein = ?, 
-                        daily_carbs = ?, 
-                        daily_fat = ?,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                ''', (
-                    goals_data.get('goal_description'),
-                    goals_data.get('daily_calories'),
-                    goals_data.get('daily_protein'),
-                    goals_data.get('daily_carbs'),
-                    goals_data.get('daily_fat'),
-                    user_id
-                ))
-            else:
-                # Create new goals
-                cursor.execute('''
-                    INSERT INTO user_goals (user_id, goal_description, daily_calories, daily_protein, daily_carbs, daily_fat)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    goals_data.get('goal_description'),
-                    goals_data.get('daily_calories'),
-                    goals_data.get('daily_protein'),
-                    goals_data.get('daily_carbs'),
-                    goals_data.get('daily_fat')
-                ))
-            
-            conn.commit()
-            return True
+            return self.submit_write(self._update_user_goals_op, user_id, goals_data).result(self.write_timeout)
         except Exception as e:
             print(f"Goals update error: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
\ No newline at end of file
+    
+    def _update_user_goals_op(self, cursor, user_id: int, goals_data: Dict) -> bool:
+        # Check if goals exist
+        cursor.execute('SELECT id FROM user_goals WHERE user_id = ?', (user_id,))
+        existing = cursor.fetchone()
+        
+        if existing:
+            # Update existing goals
+            cursor.execute('''
+                UPDATE user_goals 
+                SET goal_description = ?, 
+                    daily_calories = ?, 
+                    daily_protein = ?, 
+                    daily_carbs = ?, 
+                    daily_fat = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ?
+            ''', (
+                goals_data.get('goal_description'),
+                goals_data.get('daily_calories'),
+                goals_data.get('daily_protein'),
+                goals_data.get('daily_carbs'),
+                goals_data.get('daily_fat'),
+                user_id
+            ))
+        else:
+            # Create new goals
+            cursor.execute('''
+                INSERT INTO user_goals (user_id, goal_description, daily_calories, daily_protein, daily_carbs, daily_fat)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id,
+                goals_data.get('goal_description'),
+                goals_data.get('daily_calories'),
+                goals_data.get('daily_protein'),
+                goals_data.get('daily_carbs'),
+                goals_data.get('daily_fat')
+            ))
+        return True
+    
+        
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""
+Local food-composition table used before Gemini for simple meals.
+
+"an apple", "2 slices of white bread" or "150g chicken breast" name one food
+and a portion, so they can be answered from a bundled table. Nutrients are
+stored per 100 g next to the standard portions of each food
+(data/foods.csv). On first use the CSV is loaded into a SQLite file
+(CHUNDIET_FOOD_DB, default food_composition.db). That file is rebuilt when
+the CSV changes and is read through memory-mapped pooled connections. It
+holds three tables:
+
+    foods        one row per food with its nutrients and portions
+    food_names   every normalized name and alias, indexed for exact and prefix lookups
+    foods_fts    FTS5 index over names and aliases (LIKE fallback without FTS5)
+
+A description is only answered locally when it normalizes to exactly one
+known name, optionally preceded by a quantity and a portion or mass unit.
+Anything else goes to Gemini. That includes lists of several foods,
+percentages ("2% milk" is not whole milk), clock times ("rice at 7") and
+any second number. Set CHUNDIET_LOCAL_FOODS=0 to turn this off.
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from connection_pool import ConnectionPool
+from meal_similarity import parse_description
+from nutrient_parser import UNIT_TO_GRAMS
+
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'foods.csv')
+
+# CSV column -> name used in the Gemini "vitamins" list
+VITAMIN_COLUMNS = {
+    'vitamin_c_dv': 'Vitamin C',
+    'iron_dv': 'Iron',
+    'calcium_dv': 'Calcium',
+    'potassium_dv': 'Potassium',
+}
+
+NUTRIENT_COLUMNS = ('kcal', 'protein_g', 'carbs_g', 'fiber_g', 'sugars_g', 'fat_g', 'saturated_fat_g') + tuple(VITAMIN_COLUMNS)
+
+
+def normalize_food_name(name: str) -> str:
+    """Same word folding as meal descriptions, so names and queries compare equal"""
+    return parse_description(name)[1]
+
+
+def _format_grams(value: float) -> str:
+    return f'{value:.1f}'.rstrip('0').rstrip('.') + 'g'
+
+
+class FoodCompositionDB:
+    """SQLite-backed food table with exact, prefix and full-text lookups"""
+
+    def __init__(self, db_path: str = 'food_composition.db', csv_path: str = DEFAULT_CSV_PATH):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.pool = ConnectionPool(db_path, max_size=4, cache_size_kb=2048)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._fts = True
+        self._stats = {'hits': 0, 'misses': 0}
+
+    @classmethod
+    def from_env(cls) -> Optional['FoodCompositionDB']:
+        """Table configured from the environment, or None when CHUNDIET_LOCAL_FOODS=0"""
+        if os.environ.get('CHUNDIET_LOCAL_FOODS', '1').strip().lower() in ('0', 'false', 'no', 'off'):
+            return None
+        return cls(db_path=os.environ.get('CHUNDIET_FOOD_DB', 'food_composition.db'))
+
+    def _connection(self):
+        # Loaded on first use so app start-up does not pay for it
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                    self._loaded = True
+        return self.pool.acquire()
+
+    def _load(self):
+        with open(self.csv_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        conn = self.pool.acquire()
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS food_meta (key TEXT PRIMARY KEY, value TEXT)')
+            row = conn.execute("SELECT value FROM food_meta WHERE key = 'csv_sha256'").fetchone()
+            self._fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'foods_fts'"
+            ).fetchone() is not None
+            if row is not None and row[0] == digest:
+                return
+            self._rebuild(conn, digest)
+        finally:
+            conn.close()
+
+    def _rebuild(self, conn, digest: str):
+        with open(self.csv_path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+
+        conn.execute('DROP TABLE IF EXISTS food_names')
+        conn.execute('DROP TABLE IF EXISTS foods_fts')
+        conn.execute('DROP TABLE IF EXISTS foods')
+        conn.execute(f'''
+            CREATE TABLE foods (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                aliases TEXT NOT NULL,
+                {', '.join(f'{column} REAL NOT NULL' for column in NUTRIENT_COLUMNS)},
+                portions TEXT NOT NULL,
+                default_portion TEXT NOT NULL
+            )
+        ''')
+        conn.execute('CREATE TABLE food_names (name TEXT PRIMARY KEY, food_id INTEGER NOT NULL) WITHOUT ROWID')
+        try:
+            conn.execute('CREATE VIRTUAL TABLE foods_fts USING fts5(name, aliases, content=foods, content_rowid=id)')
+            self._fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; search() falls back to LIKE
+            self._fts = False
+
+        for food_id, row in enumerate(rows, start=1):
+            aliases = [alias.strip() for alias in row['aliases'].split('|') if alias.strip()]
+            portions = {}
+            for part in row['portions'].split('|'):
+                unit, grams = part.split(':')
+                portions[unit.strip().lower()] = float(grams)
+            conn.execute(f'''
+                INSERT INTO foods (id, name, aliases, {', '.join(NUTRIENT_COLUMNS)}, portions, default_portion)
+                VALUES (?, ?, ?, {', '.join('?' for _ in NUTRIENT_COLUMNS)}, ?, ?)
+            ''', (
+                food_id, row['name'], ' '.join(aliases),
+                *(float(row[column] or 0) for column in NUTRIENT_COLUMNS),
+                json.dumps(portions), row['default_portion'].strip().lower()
+            ))
+            conn.executemany(
+                'INSERT OR IGNORE INTO food_names (name, food_id) VALUES (?, ?)',
+                [(normalize_food_name(name), food_id) for name in [row['name']] + aliases]
+            )
+        if self._fts:
+            conn.execute("INSERT INTO foods_fts (foods_fts) VALUES ('rebuild')")
+        conn.execute(
+            "INSERT OR REPLACE INTO food_meta (key, value) VALUES ('csv_sha256', ?)", (digest,)
+        )
+        conn.commit()
+
+    def _food(self, conn, food_id: int) -> Dict:
+        cursor = conn.execute('SELECT * FROM foods WHERE id = ?', (food_id,))
+        columns = [d[0] for d in cursor.description]
+        food = dict(zip(columns, cursor.fetchone()))
+        food['portions'] = json.loads(food['portions'])
+        return food
+
+    def _match(self, conn, text: str) -> Optional[Tuple[Dict, Optional[str]]]:
+        """(food, unit word or None) for "<unit> <name>" or "<name>", else None"""
+        row = conn.execute('SELECT food_id FROM food_names WHERE name = ?', (text,)).fetchone()
+        if row is not None:
+            return self._food(conn, row[0]), None
+        unit, _, rest = text.partition(' ')
+        if rest:
+            row = conn.execute('SELECT food_id FROM food_names WHERE name = ?', (rest,)).fetchone()
+            if row is not None:
+                return self._food(conn, row[0]), unit
+        return None
+
+    def lookup(self, description: str) -> Optional[Dict]:
+        """Nutrition data in the Gemini analysis shape, or None when the description is not a confident match"""
+        quantity, text, scalable = parse_description(description, default_quantity=None)
+        counted = quantity is not None
+        quantity = quantity if counted else 1.0
+        if not scalable or not text or quantity <= 0:
+            self._count('misses')
+            return None
+
+        conn = self._connection()
+        try:
+            match = self._match(conn, text)
+        finally:
+            conn.close()
+        if match is None:
+            self._count('misses')
+            return None
+
+        food, unit = match
+        if unit is None:
+            # "3 almonds" counts single pieces; a bare "almonds" means the usual portion
+            unit = 'each' if counted and 'each' in food['portions'] else food['default_portion']
+        if unit in food['portions']:
+            grams = quantity * food['portions'][unit]
+            label = f'{quantity:g}' if unit == 'each' else f'{quantity:g} {unit}'
+            serving = f'{label} ({grams:.0f}g)'
+        elif unit in UNIT_TO_GRAMS:
+            grams = quantity * UNIT_TO_GRAMS[unit]
+            serving = f'{grams:.0f}g'
+        else:
+            # "2 bowls of apple": the unit is not one this food is measured in
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return self._analysis(food, grams, serving)
+
+    def _analysis(self, food: Dict, grams: float, serving: str) -> Dict:
+        factor = grams / 100.0
+        vitamins = [
+            {'name': name, 'percent_daily_value': f'{round(food[column] * factor)}%'}
+            for column, name in VITAMIN_COLUMNS.items()
+            if round(food[column] * factor) > 0
+        ]
+        return {
+            'food_item': food['name'],
+            'consumption_time': None,
+            'nutritional_values': {
+                'serving_size': serving,
+                'calories': int(round(food['kcal'] * factor)),
+                'protein': _format_grams(food['protein_g'] * factor),
+                'carbohydrates': {
+                    'total': _format_grams(food['carbs_g'] * factor),
+                    'fiber': _format_grams(food['fiber_g'] * factor),
+                    'sugars': _format_grams(food['sugars_g'] * factor),
+                },
+                'fat': {
+                    'total': _format_grams(food['fat_g'] * factor),
+                    'saturated': _format_grams(food['saturated_fat_g'] * factor),
+                },
+                'vitamins': vitamins,
+            },
+        }
+
+    def search(self, query: str, limit: int = 10, prefix: bool = False) -> List[Dict]:
+        """Foods whose name or alias starts with query (prefix=True) or matches its words"""
+        text = normalize_food_name(query)
+        if not text:
+            return []
+        conn = self._connection()
+        try:
+            if prefix:
+                # Range scan on the food_names primary key
+                rows = conn.execute('''
+                    SELECT DISTINCT f.id, f.name, f.kcal, f.default_portion, f.portions
+                    FROM food_names n JOIN foods f ON f.id = n.food_id
+                    WHERE n.name >= ? AND n.name < ?
+                    ORDER BY n.name LIMIT ?
+                ''', (text, text + '\uffff', limit)).fetchall()
+            elif self._fts:
+                terms = ' '.join(f'"{word}"*' for word in text.split() if word != '+')
+                rows = conn.execute('''
+                    SELECT f.id, f.name, f.kcal, f.default_portion, f.portions
+                    FROM foods_fts JOIN foods f ON f.id = foods_fts.rowid
+                    WHERE foods_fts MATCH ? ORDER BY rank LIMIT ?
+                ''', (terms, limit)).fetchall()
+            else:
+                rows = conn.execute('''
+                    SELECT DISTINCT f.id, f.name, f.kcal, f.default_portion, f.portions
+                    FROM food_names n JOIN foods f ON f.id = n.food_id
+                    WHERE n.name LIKE ? LIMIT ?
+                ''', (f'%{text}%', limit)).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                'id': food_id,
+                'name': name,
+                'kcal_per_100g': kcal,
+                'default_portion': default_portion,
+                'portions': json.loads(portions)
+            }
+            for food_id, name, kcal, default_portion, portions in rows
+        ]
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,91 @@
+"""
+Shared pool of long-lived Gemini clients, one per API key.
+
+Every genai.Client owns an HTTP connection pool, so building one per request
+throws away warm connections. It also made the analyzer share mutable key
+state across the server threads. Clients are created once per key and then
+reused. A user's key list maps to a KeySet that is only rebuilt when the
+list itself changes. Each call takes its own rotation order from the
+KeySet, so concurrent requests never change each other's key.
+"""
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from google import genai
+
+
+class KeySet:
+    """An immutable list of API keys with a thread-safe round-robin starting point"""
+
+    def __init__(self, keys: Tuple[str, ...]):
+        self.keys = keys
+        self._counter = itertools.count()
+
+    def rotation(self) -> List[str]:
+        """Every key once, starting one further along than the previous call"""
+        # next() on itertools.count is atomic under the GIL
+        start = next(self._counter) % len(self.keys)
+        return list(self.keys[start:] + self.keys[:start])
+
+
+class GeminiClientPool:
+    """Thread-safe cache of genai.Client objects keyed by API key"""
+
+    def __init__(self, max_key_sets: int = 64):
+        self.max_key_sets = max_key_sets
+        self._clients: Dict[str, genai.Client] = {}
+        self._key_sets = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'clients_created': 0, 'key_sets_built': 0}
+
+    def key_set(self, api_keys: Optional[Sequence[str]] = None) -> KeySet:
+        """KeySet for a user's stored keys, falling back to GEMINI_API_KEY"""
+        keys = tuple(key.strip() for key in (api_keys or ()) if key and key.strip())
+        if not keys:
+            env_key = os.environ.get("GEMINI_API_KEY")
+            if not env_key:
+                raise ValueError("No Gemini API key available")
+            keys = (env_key,)
+
+        with self._lock:
+            key_set = self._key_sets.get(keys)
+            if key_set is not None:
+                self._key_sets.move_to_end(keys)
+                return key_set
+            key_set = KeySet(keys)
+            self._key_sets[keys] = key_set
+            self._stats['key_sets_built'] += 1
+            while len(self._key_sets) > self.max_key_sets:
+                self._key_sets.popitem(last=False)
+            self._drop_unused_clients()
+            return key_set
+
+    def client(self, api_key: str) -> genai.Client:
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = genai.Client(api_key=api_key)
+                self._clients[api_key] = client
+                self._stats['clients_created'] += 1
+            return client
+
+    def rotation(self, api_keys: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, genai.Client]]:
+        """(key, client) pairs to try in order for one call"""
+        for key in self.key_set(api_keys).rotation():
+            yield key, self.client(key)
+
+    def _drop_unused_clients(self):
+        # Keys removed from every user's settings no longer need a client
+        live = {key for keys in self._key_sets for key in keys}
+        for key in [key for key in self._clients if key not in live]:
+            del self._clients[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['clients'] = len(self._clients)
+            stats['key_sets'] = len(self._key_sets)
+        return stats
@@ -0,0 +1,264 @@
+"""
+Per-key admission control and retry policy for Gemini calls.
+
+Each API key gets two token buckets, one for requests per minute and one for
+tokens per minute, plus a health score and a circuit breaker. A call asks for
+the healthiest key that is closed (or due for a half-open probe) and has
+room in both buckets. Only if no key has room does it wait, and for at most
+CHUNDIET_GEMINI_MAX_WAIT seconds.
+
+Failures are classified before anything is retried:
+
+    quota       429 / RESOURCE_EXHAUSTED: the key is parked until its quota resets
+    transient   5xx, timeouts, broken connections, truncated JSON: back off and retry
+    key         401 / 403 / invalid key: the key is parked for an hour
+    permanent   any other 4xx: retrying cannot help, so raise at once
+
+Limits come from CHUNDIET_GEMINI_RPM (default 10), CHUNDIET_GEMINI_TPM
+(default 250000) and CHUNDIET_GEMINI_MAX_ATTEMPTS (default 4).
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+QUOTA = 'quota'
+TRANSIENT = 'transient'
+KEY = 'key'
+PERMANENT = 'permanent'
+
+# Consecutive transient failures before a key's breaker opens
+FAILURE_THRESHOLD = 3
+BASE_COOLDOWN = 30.0
+MAX_COOLDOWN = 300.0
+QUOTA_COOLDOWN = 60.0
+KEY_COOLDOWN = 3600.0
+HEALTH_ALPHA = 0.2
+
+_RETRY_DELAY_RE = re.compile(r'retry(?:Delay)?[^0-9]{0,20}(\d+(?:\.\d+)?)\s*s', re.IGNORECASE)
+
+
+class GeminiUnavailableError(Exception):
+    """No key can take the call within the allowed wait"""
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, (json.JSONDecodeError, TimeoutError, ConnectionError)):
+        return TRANSIENT
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    text = str(error)
+    if not isinstance(code, int):
+        match = re.match(r'\s*(\d{3})\b', text)
+        code = int(match.group(1)) if match else None
+    upper = text.upper()
+    if code == 429 or 'RESOURCE_EXHAUSTED' in upper or 'QUOTA' in upper or 'RATE LIMIT' in upper:
+        return QUOTA
+    if code in (401, 403) or 'API_KEY_INVALID' in upper or 'API KEY NOT VALID' in upper or 'PERMISSION_DENIED' in upper:
+        return KEY
+    if code is not None and 400 <= code < 500 and code != 408:
+        return PERMANENT
+    return TRANSIENT
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Server-suggested delay ("retryDelay": "23s", "retry in 23.4s"), if any"""
+    match = _RETRY_DELAY_RE.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough token count of a prompt (4 characters per token)"""
+    return len(text or '') // 4 + 1
+
+
+def estimate_tokens(contents) -> int:
+    """Rough prompt size for the tokens-per-minute bucket"""
+    text = ''.join(
+        getattr(part, 'text', None) or ''
+        for content in contents or []
+        for part in getattr(content, 'parts', None) or []
+    )
+    return estimate_text_tokens(text)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate else float('inf')
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+
+class KeyState:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm, rpm)
+        self.tokens = TokenBucket(tpm, tpm)
+        self.health = 1.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = BASE_COOLDOWN
+        self.probing = False
+        self.counts = {'calls': 0, 'successes': 0, **{f'{kind}_errors': 0 for kind in (QUOTA, TRANSIENT, KEY, PERMANENT)}}
+        self.last_error = None
+        self.last_latency_ms = None
+
+    def state(self, now: float) -> str:
+        if self.open_until > now:
+            return 'open'
+        return 'half_open' if self.open_until else 'closed'
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        state = self.state(now)
+        if state == 'open':
+            return self.open_until - now
+        if state == 'half_open' and self.probing:
+            # One probe at a time; the others wait for its outcome
+            return 1.0
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+
+class GeminiScheduler:
+    """Picks a key per call, records outcomes and decides whether and when to retry"""
+
+    def __init__(self, rpm: float = 10, tpm: float = 250000, max_attempts: int = 4, max_wait: float = 20.0,
+                 base_backoff: float = 0.5, max_backoff: float = 8.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._keys: Dict[str, KeyState] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'GeminiScheduler':
+        return cls(
+            rpm=float(os.environ.get('CHUNDIET_GEMINI_RPM', 10)),
+            tpm=float(os.environ.get('CHUNDIET_GEMINI_TPM', 250000)),
+            max_attempts=int(os.environ.get('CHUNDIET_GEMINI_MAX_ATTEMPTS', 4)),
+            max_wait=float(os.environ.get('CHUNDIET_GEMINI_MAX_WAIT', 20))
+        )
+
+    def _state(self, key: str) -> KeyState:
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = KeyState(self.rpm, self.tpm)
+        return state
+
+    def acquire(self, keys: Sequence[str], tokens: int = 1, exclude: Sequence[str] = ()) -> str:
+        """
+        Reserve capacity on the healthiest usable key, waiting up to max_wait.
+        keys should already be in rotation order so equal keys share the load;
+        keys in exclude are only used when nothing else is left.
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                waits = []
+                for key in keys:
+                    state = self._state(key)
+                    waits.append((state.wait_time(tokens, now), key in exclude, -state.health, key))
+                ready = [entry for entry in waits if entry[0] == 0.0]
+                if ready:
+                    # Stable sort keeps the rotation order among equally healthy keys
+                    _, _, _, key = sorted(ready, key=lambda entry: (entry[1], entry[2]))[0]
+                    state = self._keys[key]
+                    state.requests.take(1)
+                    state.tokens.take(tokens)
+                    state.counts['calls'] += 1
+                    if state.state(now) == 'half_open':
+                        state.probing = True
+                    return key
+                wait = min(entry[0] for entry in waits)
+            if now + wait > deadline:
+                raise GeminiUnavailableError(
+                    f"All {len(keys)} Gemini API key(s) are rate limited or failing; next one frees up in {wait:.0f}s"
+                )
+            time.sleep(min(wait, 1.0))
+
+    def record_success(self, key: str, latency: float):
+        with self._lock:
+            state = self._state(key)
+            state.counts['successes'] += 1
+            state.health = state.health * (1 - HEALTH_ALPHA) + HEALTH_ALPHA
+            state.consecutive_failures = 0
+            state.open_until = 0.0
+            state.cooldown = BASE_COOLDOWN
+            state.probing = False
+            state.last_latency_ms = round(latency * 1000, 1)
+
+    def record_failure(self, key: str, kind: str, error: Exception):
+        with self._lock:
+            state = self._state(key)
+            now = time.monotonic()
+            state.counts[f'{kind}_errors'] += 1
+            state.last_error = f'{kind}: {str(error)[:200]}'
+            was_probe, state.probing = state.probing, False
+            if kind == PERMANENT:
+                # The request was bad, not the key
+                return
+            state.health *= 1 - HEALTH_ALPHA
+            state.consecutive_failures += 1
+            if kind == QUOTA:
+                state.open_until = now + (retry_after(error) or QUOTA_COOLDOWN)
+                state.requests.tokens = 0
+            elif kind == KEY:
+                state.open_until = now + KEY_COOLDOWN
+            elif was_probe or state.consecutive_failures >= FAILURE_THRESHOLD:
+                state.open_until = now + state.cooldown
+                state.cooldown = min(state.cooldown * 2, MAX_COOLDOWN)
+
+    def release(self, key: str):
+        """The caller abandoned the call (client went away); free a half-open probe without judging the key"""
+        with self._lock:
+            self._state(key).probing = False
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        return kind != PERMANENT and attempt + 1 < self.max_attempts
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential delay before retry number attempt + 1"""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def stats(self) -> List[Dict]:
+        """Per-key state with the keys masked to their last four characters"""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    'key': f'...{key[-4:]}',
+                    'state': state.state(now),
+                    'health': round(state.health, 3),
+                    'reopens_in_s': round(max(state.open_until - now, 0.0), 1),
+                    'requests_available': round(state.requests.available(now), 2),
+                    'tokens_available': int(state.tokens.available(now)),
+                    'consecutive_failures': state.consecutive_failures,
+                    'last_latency_ms': state.last_latency_ms,
+                    'last_error': state.last_error,
+                    **state.counts
+                }
+                for key, state in self._keys.items()
+            ]
@@ -1,60 +1,441 @@
-import os
+import hashlib
 import json
 import logging
+import threading
+import time
+from collections import deque
 from google import genai
 from google.genai import types
 from datetime import datetime
+from analysis_cache import cache_key
+from gemini_clients import GeminiClientPool
+from gemini_scheduler import GeminiScheduler, TRANSIENT, classify_error, estimate_text_tokens, estimate_tokens
+from incremental_json import IncrementalJSONParser
+from meal_import import validate_record
+from single_flight import FlightAbandoned, SingleFlight
+from recommendation_prompt import DEFAULT_TOKEN_BUDGET, build_recommendation_prompt
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump whenever the analysis prompt or _get_nutrition_schema changes so cached results are not reused
+ANALYSIS_SCHEMA_VERSION = 1
+# Meals per batched Gemini call; larger days are split over several calls
+MAX_BATCH_MEALS = 10
+
 class GeminiNutritionAnalyzer:
-    def __init__(self):
-        self.client = None
+    def __init__(self, cache=None, similarity=None, food_db=None, clients=None, scheduler=None,
+                 prompt_token_budget=DEFAULT_TOKEN_BUDGET):
         self.model = "gemini-2.5-flash"
-        self.api_keys = []
-        self.current_key_index = 0
-        
-    def set_api_keys(self, api_keys):
-        """Set multiple API keys for rotation"""
-        self.api_keys = api_keys
-        self.current_key_index = 0
-        self._initialize_client()
+        # One long-lived client per API key, shared by all request threads
+        self.clients = clients or GeminiClientPool()
+        # Per-key rate limits, health and retry policy
+        self.scheduler = scheduler or GeminiScheduler()
+        # Cache of meal analyses (None disables it)
+        self.cache = cache
+        # Near-duplicate index consulted after an exact cache miss (None disables it)
+        self.similarity = similarity
+        self._similarity_seeded = False
+        self._seed_lock = threading.Lock()
+        # Bundled food table answering simple "N unit food" meals without Gemini (None disables it)
+        self.food_db = food_db
+        # Identical requests already in flight are joined instead of sent again
+        self._meal_flights = SingleFlight()
+        self._recommendation_flights = SingleFlight()
+        # Recommendation prompts summarize older days to stay under this estimate
+        self.prompt_token_budget = prompt_token_budget
+        self._prompt_reports = deque(maxlen=200)
+        self._stats_lock = threading.Lock()
+    
+    def _stream_events(self, contents, config, api_keys, label):
+        """
+        Run one generate_content_stream call on the key the scheduler picks.
+        Quota, key and transient failures are retried on the next best key
+        with jittered exponential backoff, up to max_attempts in total.
+        Yields ('text', chunk) as the response arrives, ('retry', None) when
+        an attempt fails after some text was yielded (drop what came before)
+        and finally ('json', parsed_response)
+        """
+        keys = self.clients.key_set(api_keys).rotation()
+        tokens = estimate_tokens(contents)
+        tried = []
+        last_error = None
+        for attempt in range(self.scheduler.max_attempts):
+            key = self.scheduler.acquire(keys, tokens, exclude=tried)
+            client = self.clients.client(key)
+            if attempt:
+                logger.info(f"[RETRY] Attempt {attempt + 1} of {self.scheduler.max_attempts}...")
+            started = time.monotonic()
+            response_text = ""
+            try:
+                for chunk in client.models.generate_content_stream(
+                    model=self.model,
+                    contents=contents,
+                    config=config,
+                ):
+                    if chunk.text:
+                        response_text += chunk.text
+                        yield 'text', chunk.text
+                
+                logger.info(f"[LLM RESPONSE] {label} (Raw):")
+                logger.info(f"{response_text}")
+                parsed_response = json.loads(response_text)
+            except GeneratorExit:
+                # The consumer stopped reading (browser closed the stream)
+                self.scheduler.release(key)
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                logger.error(f"[ERROR] {label} ERROR ({kind}): {str(e)}")
+                self.scheduler.record_failure(key, kind, e)
+                last_error = e
+                tried.append(key)
+                if not self.scheduler.should_retry(kind, attempt):
+                    break
+                if kind == TRANSIENT:
+                    # Quota and key failures move straight to another key; the scheduler handles waiting
+                    time.sleep(self.scheduler.backoff(attempt))
+                if response_text:
+                    yield 'retry', None
+                continue
+            self.scheduler.record_success(key, time.monotonic() - started)
+            yield 'json', parsed_response
+            return
+        raise Exception(f"Gemini API error: {str(last_error)}")
+    
+    def _stream_json(self, contents, config, api_keys, label):
+        """_stream_events for callers that only want the parsed JSON"""
+        for kind, value in self._stream_events(contents, config, api_keys, label):
+            if kind == 'json':
+                return value
+    
+    def key_stats(self):
+        """Per-key health, breaker state, remaining rate-limit budget and recommendation prompt sizes"""
+        return {'keys': self.scheduler.stats(), 'clients': self.clients.stats(), 'prompts': self.prompt_stats()}
     
-    def _initialize_client(self):
-        """Initialize Gemini client with current API key"""
-        if self.api_keys:
-            api_key = self.api_keys[self.current_key_index]
-        else:
-            api_key = os.environ.get("GEMINI_API_KEY")
+    def prompt_stats(self):
+        """Estimated recommendation prompt tokens over the last calls"""
+        with self._stats_lock:
+            reports = list(self._prompt_reports)
+        tokens = [report['estimated_tokens'] for report in reports]
+        return {
+            'token_budget': self.prompt_token_budget,
+            'recommendation_calls': len(reports),
+            'last_tokens': tokens[-1] if tokens else 0,
+            'avg_tokens': sum(tokens) / len(tokens) if tokens else 0.0,
+            'max_tokens': max(tokens) if tokens else 0,
+            'over_budget': sum(1 for report in reports if report['over_budget'])
+        }
+    
+    def analyze_meal(self, meal_description, consumption_time=None, temperature=0.5, use_cache=True, api_keys=None):
+        """
+        Analyze meal description using Gemini API. Simple meals ("2 slices
+        of white bread") are answered from the local food table, repeated
+        descriptions from the analysis cache and close variants ("ate 2
+        apples" after "an apple") from the similarity index. use_cache=False
+        forces a fresh Gemini call (the fresh result still replaces the
+        cached one). api_keys are the caller's stored Gemini keys; without
+        them GEMINI_API_KEY is used. Concurrent calls for the same meal share
+        one Gemini call. Returns structured nutrition data; 'source' records
+        which of food_db, cache, similar or gemini produced it
+        """
+        key = cache_key(meal_description, self.model, temperature, ANALYSIS_SCHEMA_VERSION)
+        if use_cache:
+            known = self._known_analysis(meal_description, key, consumption_time)
+            if known is not None:
+                return known
+        elif self.cache:
+            self.cache.record_bypass()
         
-        if api_key:
-            self.client = genai.Client(api_key=api_key)
-        else:
-            raise ValueError("No Gemini API key available")
+        return self._analyze_fresh(key, meal_description, consumption_time, temperature, api_keys)
     
-    def _rotate_api_key(self):
-        """Rotate to next API key if available"""
-        if len(self.api_keys) > 1:
-            self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-            self._initialize_client()
-            return True
-        return False
+    def _analyze_fresh(self, key, meal_description, consumption_time, temperature, api_keys):
+        """Gemini analysis joined with an identical one already in flight, then cached"""
+        def analyze():
+            result = self._analyze_meal_uncached(meal_description, consumption_time, temperature, api_keys)
+            return self._remember(key, meal_description, result, consumption_time)
+        # The time is part of the prompt, so it is part of the flight key
+        return self._meal_flights.do((key, consumption_time), analyze)
     
-    def analyze_meal(self, meal_description, consumption_time=None, temperature=0.5):
+    def analyze_meal_stream(self, meal_description, consumption_time=None, temperature=0.5, use_cache=True, api_keys=None):
         """
-        Analyze meal description using Gemini API
-        Returns structured nutrition data
+        analyze_meal as a generator for progressive display. While Gemini is
+        generating it yields ('field', (path, value)) for every value as soon
+        as it is complete (see incremental_json), and ('retry', None) if an
+        attempt failed midway so the fields shown so far should be dropped.
+        The last item is ('result', nutrition_data), already cached. Local,
+        cached and similar answers, and meals another request is already
+        analyzing, yield only the result
         """
+        key = cache_key(meal_description, self.model, temperature, ANALYSIS_SCHEMA_VERSION)
+        if use_cache:
+            known = self._known_analysis(meal_description, key, consumption_time)
+            if known is not None:
+                yield 'result', known
+                return
+        elif self.cache:
+            self.cache.record_bypass()
+        
+        flight_key = (key, consumption_time)
+        while True:
+            flight, leader = self._meal_flights.begin(flight_key)
+            if leader:
+                break
+            try:
+                yield 'result', SingleFlight.wait(flight)
+                return
+            except FlightAbandoned:
+                continue
+        
+        try:
+            contents, config = self._meal_request(meal_description, consumption_time, temperature)
+            parser = IncrementalJSONParser()
+            result = None
+            for kind, value in self._stream_events(contents, config, api_keys, "MEAL ANALYSIS"):
+                if kind == 'text':
+                    if parser is None:
+                        continue
+                    try:
+                        fields = parser.feed(value)
+                    except json.JSONDecodeError:
+                        # Not JSON after all; only the final parse decides whether the attempt failed
+                        parser = None
+                        continue
+                    for field in fields:
+                        yield 'field', field
+                elif kind == 'retry':
+                    parser = IncrementalJSONParser()
+                    yield 'retry', None
+                else:
+                    self._log_analysis(value)
+                    result = self._remember(key, meal_description, value, consumption_time)
+        except BaseException as e:
+            self._meal_flights.finish(flight_key, flight, error=e)
+            raise
+        self._meal_flights.finish(flight_key, flight, result=result)
+        yield 'result', result
+    
+    def analyze_meals(self, meals, temperature=0.5, use_cache=True, api_keys=None):
+        """
+        Analyze several meals ({'description', 'time'} dicts) with one Gemini
+        call instead of one each. Meals the food table, cache or similarity
+        index can answer are answered as in analyze_meal; the rest are sent
+        together, MAX_BATCH_MEALS at a time, and matched back by meal_index.
+        A meal missing from the batch response or failing validation is
+        retried on its own. Returns one entry per meal, in input order:
+        {'nutrition_data': ...} or {'error': ...}
+        """
+        results = [None] * len(meals)
+        # cache key -> (description, time, indexes); identical descriptions are analyzed once
+        pending = {}
+        for index, meal in enumerate(meals):
+            description, consumption_time = meal.get('description'), meal.get('time')
+            key = cache_key(description, self.model, temperature, ANALYSIS_SCHEMA_VERSION)
+            if use_cache:
+                known = self._known_analysis(description, key, consumption_time)
+                if known is not None:
+                    results[index] = {'nutrition_data': known}
+                    continue
+            elif self.cache:
+                self.cache.record_bypass()
+            if key in pending:
+                pending[key][2].append(index)
+            else:
+                pending[key] = (description, consumption_time, [index])
+        
+        leftovers = list(pending.items())
+        if len(pending) > 1:
+            leftovers = []
+            items = list(pending.items())
+            for start in range(0, len(items), MAX_BATCH_MEALS):
+                batch = items[start:start + MAX_BATCH_MEALS]
+                analyses = self._analyze_batch_uncached([(d, t) for _, (d, t, _) in batch], temperature, api_keys)
+                for position, (key, (description, consumption_time, indexes)) in enumerate(batch):
+                    analysis = analyses.get(position)
+                    try:
+                        validate_record(analysis)
+                    except ValueError as e:
+                        logger.warning(f"[BATCH] Meal {position + 1} ({description}) needs its own call: {e}")
+                        leftovers.append((key, (description, consumption_time, indexes)))
+                        continue
+                    result = self._remember(key, description, analysis, consumption_time)
+                    for index in indexes:
+                        results[index] = {'nutrition_data': dict(result)}
+        
+        for key, (description, consumption_time, indexes) in leftovers:
+            try:
+                entry = {'nutrition_data': self._analyze_fresh(key, description, consumption_time, temperature, api_keys)}
+            except Exception as e:
+                entry = {'error': str(e)}
+            for index in indexes:
+                results[index] = dict(entry)
+        return results
+    
+    def _analyze_batch_uncached(self, meals, temperature, api_keys):
+        """One Gemini call for several (description, time) pairs; {position: analysis} for the meals it answered"""
+        logger.info(f"[BATCH ANALYSIS] REQUEST: {len(meals)} meals")
+        meal_lines = []
+        for number, (description, consumption_time) in enumerate(meals, start=1):
+            time_context = f" consumed at {consumption_time}" if consumption_time else ""
+            meal_lines.append(f'Meal {number}: "{description}"{time_context}')
+        meal_list = "\n".join(meal_lines)
+        
+        input_text = f"""You are Chun, an expert nutritionist and registered dietitian with over 15 years of experience in food analysis and nutritional assessment. You have extensive knowledge of food composition databases, portion sizes, and nutritional values across different cuisines and cooking methods.
+
+Your task is to analyze each of the following {len(meals)} meal descriptions separately and provide accurate, detailed nutritional information for every one of them:
+
+{meal_list}
+
+Return one entry per meal in the "meals" array and set its meal_index to the meal's number. Analyze each meal on its own; do not combine them.
+
+Please analyze these meals with the precision of a professional nutritionist, considering:
+- Standard serving sizes and portions
+- Cooking methods that may affect nutritional content
+- Common ingredients and their nutritional profiles
+- Regional variations in food preparation
+
+Provide comprehensive nutritional analysis including macronutrients, micronutrients, and key vitamins/minerals."""
+        
+        logger.info(f"[PROMPT] Batch prompt ~{estimate_text_tokens(input_text)} tokens for {len(meals)} meals")
+        logger.debug(f"[PROMPT] SENT TO LLM:\n{input_text}")
+        
+        contents = [
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part.from_text(text=input_text),
+                ],
+            ),
+        ]
+        
+        meal_schema = self._get_nutrition_schema()
+        config = types.GenerateContentConfig(
+            temperature=temperature,
+            # One thinking budget for the whole day instead of one per meal
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=10587,
+            ),
+            response_mime_type="application/json",
+            response_schema=genai.types.Schema(
+                type=genai.types.Type.OBJECT,
+                properties={
+                    "meals": genai.types.Schema(
+                        type=genai.types.Type.ARRAY,
+                        items=genai.types.Schema(
+                            type=genai.types.Type.OBJECT,
+                            properties={
+                                "meal_index": genai.types.Schema(
+                                    type=genai.types.Type.INTEGER,
+                                    description="The number of the meal in the list this entry analyzes.",
+                                ),
+                                **meal_schema.properties,
+                            },
+                            required=["meal_index", "food_item", "nutritional_values"],
+                        ),
+                    ),
+                },
+                required=["meals"],
+            ),
+        )
+        
+        try:
+            parsed_response = self._stream_json(contents, config, api_keys, "BATCH ANALYSIS")
+        except Exception as e:
+            # Every meal falls back to its own call
+            logger.error(f"[BATCH] Batch call failed, analyzing meals one by one: {e}")
+            return {}
+        
+        analyses = {}
+        entries = parsed_response.get('meals') if isinstance(parsed_response, dict) else None
+        for entry in entries or []:
+            if not isinstance(entry, dict):
+                continue
+            number = entry.pop('meal_index', None)
+            if isinstance(number, int) and 1 <= number <= len(meals) and number - 1 not in analyses:
+                analyses[number - 1] = entry
+        logger.info(f"[BATCH] Gemini answered {len(analyses)} of {len(meals)} meals")
+        return analyses
+    
+    def _known_analysis(self, meal_description, key, consumption_time):
+        """Answer from the food table, the cache or the similarity index, or None"""
+        cached = self.food_db.lookup(meal_description) if self.food_db else None
+        if cached is not None:
+            logger.info(f"[FOOD DB HIT] {meal_description} -> {cached['food_item']}")
+            cached['source'] = 'food_db'
+        elif self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"[CACHE HIT] {meal_description}")
+                cached['source'] = 'cache'
+        if cached is None and self.similarity is not None:
+            cached = self._similar_analysis(meal_description)
+            if cached is not None:
+                cached['source'] = 'similar'
+        if cached is not None and consumption_time:
+            cached['consumption_time'] = consumption_time
+        return cached
+    
+    def _remember(self, key, meal_description, result, consumption_time):
+        """Cache and index a fresh Gemini analysis; returns it tagged with its source"""
+        result['source'] = 'gemini'
+        cached = dict(result)
+        if consumption_time:
+            # A time passed by the caller is not part of the key, so don't cache it
+            cached['consumption_time'] = None
+        if self.cache:
+            self.cache.put(key, meal_description, self.model, cached)
+        if self.similarity is not None:
+            self._seed_similarity()
+            self.similarity.add(meal_description, cached)
+        return result
+    
+    def _seed_similarity(self):
+        """Rebuild the in-memory similarity index from analyses that survived a restart"""
+        if self._similarity_seeded:
+            return
+        with self._seed_lock:
+            if not self._similarity_seeded:
+                if self.cache:
+                    count = self.similarity.add_many(self.cache.iter_entries(self.model))
+                    logger.info(f"[SIMILARITY] Indexed {count} cached analyses")
+                self._similarity_seeded = True
+    
+    def _similar_analysis(self, meal_description):
+        """Stored analysis of a near-duplicate description scaled to this one, or None"""
+        self._seed_similarity()
+        match = self.similarity.lookup(meal_description)
+        if match is None:
+            return None
+        result, score, matched = match
+        logger.info(f"[SIMILAR HIT] {meal_description} ~ {matched} ({score:.2f})")
+        return result
+    
+    def cache_stats(self):
+        """Hit/miss counters of the analysis cache, the similarity index, the local food table and coalesced calls"""
+        stats = self.cache.stats() if self.cache else {'enabled': False}
+        stats['similarity'] = self.similarity.stats() if self.similarity is not None else {'enabled': False}
+        stats['food_db'] = self.food_db.stats() if self.food_db else {'enabled': False}
+        stats['coalescing'] = {
+            'meals': self._meal_flights.stats(),
+            'recommendations': self._recommendation_flights.stats()
+        }
+        return stats
+    
+    def _analyze_meal_uncached(self, meal_description, consumption_time=None, temperature=0.5, api_keys=None):
+        """Call Gemini for one meal description"""
+        contents, config = self._meal_request(meal_description, consumption_time, temperature)
+        parsed_response = self._stream_json(contents, config, api_keys, "MEAL ANALYSIS")
+        self._log_analysis(parsed_response)
+        return parsed_response
+    
+    def _meal_request(self, meal_description, consumption_time=None, temperature=0.5):
+        """Prompt contents and generation config for one meal description"""
         logger.info(f"[MEAL ANALYSIS] REQUEST")
         logger.info(f"Description: {meal_description}")
         logger.info(f"Time: {consumption_time}")
         logger.info(f"Temperature: {temperature}")
         
-        if not self.client:
-            self._initialize_client()
-        
         # Prepare input text with expert prompt engineering
         time_context = ""
         if consumption_time:
@@ -74,8 +455,8 @@ Please analyze this meal with the precision of a professional nutritionist, cons
 
 Provide comprehensive nutritional analysis including macronutrients, micronutrients, and key vitamins/minerals."""
         
-        logger.info(f"[PROMPT] SENT TO LLM:")
-        logger.info(f"{input_text}")
+        logger.info(f"[PROMPT] Meal prompt ~{estimate_text_tokens(input_text)} tokens")
+        logger.debug(f"[PROMPT] SENT TO LLM:\n{input_text}")
         
         contents = [
             types.Content(
@@ -96,78 +477,37 @@ Provide comprehensive nutritional analysis including macronutrients, micronutrie
             response_schema=self._get_nutrition_schema(),
         )
         
-        try:
-            response_text = ""
-            for chunk in self.client.models.generate_content_stream(
-                model=self.model,
-                contents=contents,
-                config=generate_content_config,
-            ):
-                response_text += chunk.text
-            
-            logger.info(f"[LLM RESPONSE] Raw:")
-            logger.info(f"{response_text}")
-            
-            parsed_response = json.loads(response_text)
-            
-            logger.info(f"[PARSED DATA] Nutrition Analysis:")
-            logger.info(f"Food Item: {parsed_response.get('food_item', 'N/A')}")
-            logger.info(f"Calories: {parsed_response.get('nutritional_values', {}).get('calories', 'N/A')}")
-            logger.info(f"Protein: {parsed_response.get('nutritional_values', {}).get('protein', 'N/A')}")
-            logger.info(f"Carbs: {parsed_response.get('nutritional_values', {}).get('carbohydrates', {}).get('total', 'N/A')}")
-            logger.info(f"Fat: {parsed_response.get('nutritional_values', {}).get('fat', {}).get('total', 'N/A')}")
-            logger.info(f"Vitamins: {len(parsed_response.get('nutritional_values', {}).get('vitamins', []))} items")
-            
-            return parsed_response
-        
-        except Exception as e:
-            logger.error(f"[ERROR] MEAL ANALYSIS ERROR: {str(e)}")
-            # Try rotating API key if available
-            if self._rotate_api_key():
-                logger.info("[RETRY] Retrying with rotated API key...")
-                return self.analyze_meal(meal_description, consumption_time, temperature)
-            else:
-                raise Exception(f"Gemini API error: {str(e)}")
+        return contents, generate_content_config
+    
+    def _log_analysis(self, parsed_response):
+        logger.info(f"[PARSED DATA] Nutrition Analysis:")
+        logger.info(f"Food Item: {parsed_response.get('food_item', 'N/A')}")
+        logger.info(f"Calories: {parsed_response.get('nutritional_values', {}).get('calories', 'N/A')}")
+        logger.info(f"Protein: {parsed_response.get('nutritional_values', {}).get('protein', 'N/A')}")
+        logger.info(f"Carbs: {parsed_response.get('nutritional_values', {}).get('carbohydrates', {}).get('total', 'N/A')}")
+        logger.info(f"Fat: {parsed_response.get('nutritional_values', {}).get('fat', {}).get('total', 'N/A')}")
+        logger.info(f"Vitamins: {len(parsed_response.get('nutritional_values', {}).get('vitamins', []))} items")
+    
+    def generate_recommendations(self, recent_nutrition_data, user_profile, user_goals=None, temperature=0.7, api_keys=None):
+        """
+        Generate personalized nutrition recommendations. A request made while
+        one with the same data, profile, goals and temperature (the same user
+        asking twice) is still running waits for that one's answer
+        """
+        inputs = json.dumps([recent_nutrition_data, user_profile, user_goals, temperature], sort_keys=True, default=str)
+        return self._recommendation_flights.do(
+            hashlib.sha256(inputs.encode('utf-8')).hexdigest(),
+            lambda: self._generate_recommendations_uncached(recent_nutrition_data, user_profile, user_goals, temperature, api_keys)
+        )
     
-    def generate_recommendations(self, recent_nutrition_data, user_profile, user_goals=None, temperature=0.7):
-        """Generate personalized nutrition recommendations"""
+    def _generate_recommendations_uncached(self, recent_nutrition_data, user_profile, user_goals=None, temperature=0.7, api_keys=None):
+        """Call Gemini for one set of recommendations"""
         
         logger.info(f"[RECOMMENDATIONS] GENERATION REQUEST")
         logger.info(f"User Profile: {user_profile}")
         logger.info(f"User Goals: {user_goals}")
         logger.info(f"Temperature: {temperature}")
         
-        # Format today's meals
-        today_meals_text = ""
-        if recent_nutrition_data.get('today_meals'):
-            today_meals_text = "TODAY'S MEALS:\n"
-            for meal in recent_nutrition_data['today_meals']:
-                today_meals_text += f"- {meal['food_item']} at {meal['consumption_time']}\n"
-                today_meals_text += f"  Calories: {meal['calories']}, Protein: {meal['protein']}, Carbs: {meal['carbohydrates']}, Fat: {meal['fat']}\n"
-                if meal['vitamins']:
-                    vitamins_str = ", ".join([f"{v['name']}: {v['percent_daily_value']}" for v in meal['vitamins']])
-                    today_meals_text += f"  Key vitamins/minerals: {vitamins_str}\n"
-                today_meals_text += "\n"
-        else:
-            today_meals_text = "TODAY'S MEALS: No meals logged today\n\n"
-        
-        # Format previous week's meals
-        previous_meals_text = ""
-        if recent_nutrition_data.get('previous_meals'):
-            previous_meals_text = "PREVIOUS WEEK'S MEALS:\n"
-            current_date = None
-            for meal in recent_nutrition_data['previous_meals']:
-                if current_date != meal['date']:
-                    current_date = meal['date']
-                    previous_meals_text += f"\n{current_date}:\n"
-                previous_meals_text += f"- {meal['food_item']} at {meal['consumption_time']}\n"
-                previous_meals_text += f"  Calories: {meal['calories']}, Protein: {meal['protein']}, Carbs: {meal['carbohydrates']}, Fat: {meal['fat']}\n"
-                if meal['vitamins']:
-                    vitamins_str = ", ".join([f"{v['name']}: {v['percent_daily_value']}" for v in meal['vitamins']])
-                    previous_meals_text += f"  Key vitamins/minerals: {vitamins_str}\n"
-        else:
-            previous_meals_text = "PREVIOUS WEEK'S MEALS: No previous meals found\n"
-        
         logger.info(f"[DATA SUMMARY] Nutrition Overview:")
         logger.info(f"Today's meals: {len(recent_nutrition_data.get('today_meals', []))}")
         logger.info(f"Previous meals: {len(recent_nutrition_data.get('previous_meals', []))}")
@@ -177,80 +517,17 @@ Provide comprehensive nutritional analysis including macronutrients, micronutrie
         logger.info(f"Total meals: {recent_nutrition_data.get('total_meals', 0)}")
         logger.info(f"Food variety: {recent_nutrition_data.get('food_variety', 0)}")
         
-        prompt = f"""You are Chun, a certified nutritionist and wellness coach with expertise in personalized nutrition planning, metabolic health, and sustainable dietary habits. You have helped thousands of clients achieve their health goals through evidence-based nutrition guidance.
-
-Your client has been tracking their nutrition, and you need to provide personalized recommendations based on their profile and detailed eating patterns.
-
-CLIENT PROFILE:
-- Age: {user_profile.get('age', 'Not specified')}
-- Gender: {user_profile.get('gender', 'Not specified')}
-- Weight: {user_profile.get('weight', 'Not specified')}kg
-- Activity Level: {user_profile.get('activity_level', 'Not specified')}
-
-CLIENT NUTRITION GOALS:
-- Goal Description: {user_goals.get('goal_description', 'Not set by user') if user_goals else 'Not set by user'}
-- Daily Calorie Target: {user_goals.get('daily_calories', 'Not set by user') if user_goals else 'Not set by user'}
-- Daily Protein Target: {user_goals.get('daily_protein', 'Not set by user') if user_goals else 'Not set by user'}g
-- Daily Carbs Target: {user_goals.get('daily_carbs', 'Not set by user') if user_goals else 'Not set by user'}g
-- Daily Fat Target: {user_goals.get('daily_fat', 'Not set by user') if user_goals else 'Not set by user'}g
-
-NUTRITION ANALYSIS DATA:
-- Data availability: {recent_nutrition_data.get('days_with_data', 0)} days with logged meals out of past {recent_nutrition_data.get('period_days', 7)} days
-- Total calories logged: {recent_nutrition_data.get('total_calories', 0)} calories across all logged days
-- Average daily calories: {recent_nutrition_data.get('avg_daily_calories', 0):.0f} calories (calculated from {recent_nutrition_data.get('days_with_data', 0)} days with data)
-- Total meals logged: {recent_nutrition_data.get('total_meals', 0)}
-- Food variety: {recent_nutrition_data.get('food_variety', 0)} different foods
-
-{today_meals_text}
-
-{previous_meals_text}
-
-COMPREHENSIVE NUTRITION ANALYSIS TASK:
-
-IMPORTANT: The user has logged meals for {recent_nutrition_data.get('days_with_data', 0)} out of the past {recent_nutrition_data.get('period_days', 7)} days. Base your analysis on the ACTUAL data available, not assumptions about missing days. If data is limited, acknowledge this in your assessment and focus on patterns from available data.
-
-As their expert nutritionist, provide a detailed analysis covering:
-
-1. **OVERALL ASSESSMENT**: Summarize their current nutritional status, eating patterns, and overall health trajectory. IMPORTANT: Acknowledge the data completeness ({recent_nutrition_data.get('days_with_data', 0)} days of data) and base conclusions only on available information.
-
-2. **NUTRITIONAL ANALYSIS**: Break down their nutrition into:
-   - Calorie analysis (adequacy, distribution, timing) - base this on the {recent_nutrition_data.get('days_with_data', 0)} days with actual data
-   - Macronutrient balance (protein, carbs, fats ratios and quality) from logged meals
-   - Micronutrient status (vitamins, minerals from their actual intake)
-   - Identify specific deficiencies and nutritional strengths from available data
-
-3. **FOOD RECOMMENDATIONS**: Suggest 4-6 specific foods for different meals:
-   - Include meal type (breakfast/lunch/dinner/snack)
-   - Explain health benefits and nutrients provided
-   - Give practical preparation tips
-
-4. **DIET RECOMMENDATIONS**: Provide 3-4 dietary pattern suggestions:
-   - Focus on meal timing, portion control, food combinations
-   - Address their specific nutritional gaps
-   - Include practical implementation strategies
-
-5. **INGREDIENT RECOMMENDATIONS**: Suggest 4-5 key ingredients to address deficiencies:
-   - Specify which nutrients they provide
-   - Explain health benefits
-   - Give usage suggestions and daily amounts
-
-6. **NEXT DAY MEAL PLAN**: Create a detailed plan for tomorrow:
-   - Specific breakfast, lunch, dinner suggestions
-   - Focus nutrients for each meal
-   - Healthy snack options
-
-7. **WEEKLY GOAL**: One achievable goal for the week
-8. **HYDRATION REMINDER**: Personalized hydration advice
-
-Make all recommendations:
-- Specific to their actual nutritional data and deficiencies
-- Culturally appropriate and practical
-- Evidence-based and health-focused
-- Encouraging and sustainable
-- Focused on nutrient density and variety"""
-        
-        logger.info(f"[PROMPT] RECOMMENDATION PROMPT SENT TO LLM:")
-        logger.info(f"{prompt}")
+        prompt, report = build_recommendation_prompt(
+            recent_nutrition_data, user_profile, user_goals, token_budget=self.prompt_token_budget
+        )
+        with self._stats_lock:
+            self._prompt_reports.append(report)
+        logger.info(
+            f"[PROMPT] Recommendation prompt ~{report['estimated_tokens']} tokens (budget {report['token_budget']}): "
+            f"{report['meals_detailed']} of {report['meals']} meals listed, "
+            f"{report['days_summarized'] + report['days_totals_only']} older day(s) summarized"
+        )
+        logger.debug(f"[PROMPT] RECOMMENDATION PROMPT SENT TO LLM:\n{prompt}")
         
         contents = [
             types.Content(
@@ -373,37 +650,17 @@ Make all recommendations:
             )
         )
         
-        try:
-            response_text = ""
-            for chunk in self.client.models.generate_content_stream(
-                model=self.model,
-                contents=contents,
-                config=config,
-            ):
-                response_text += chunk.text
-            
-            logger.info(f"[LLM RESPONSE] Recommendation Response (Raw):")
-            logger.info(f"{response_text}")
-            
-            parsed_response = json.loads(response_text)
-            
-            logger.info(f"[PARSED RECOMMENDATIONS] Analysis Complete:")
-            logger.info(f"Overall Assessment: {parsed_response.get('overall_assessment', 'N/A')[:100]}...")
-            logger.info(f"Weekly Goal: {parsed_response.get('weekly_goal', 'N/A')[:100]}...")
-            logger.info(f"Number of Recommendations: {len(parsed_response.get('recommendations', []))}")
-            
-            for i, rec in enumerate(parsed_response.get('recommendations', []), 1):
-                logger.info(f"  {i}. {rec.get('title', 'No title')} ({rec.get('priority', 'N/A')} priority)")
-            
-            return parsed_response
+        parsed_response = self._stream_json(contents, config, api_keys, "RECOMMENDATION GENERATION")
         
-        except Exception as e:
-            logger.error(f"[ERROR] RECOMMENDATION GENERATION ERROR: {str(e)}")
-            if self._rotate_api_key():
-                logger.info("[RETRY] Retrying with rotated API key...")
-                return self.generate_recommendations(recent_nutrition_data, user_profile, user_goals, temperature)
-            else:
-                raise Exception(f"Gemini API error: {str(e)}")
+        logger.info(f"[PARSED RECOMMENDATIONS] Analysis Complete:")
+        logger.info(f"Overall Assessment: {parsed_response.get('overall_assessment', 'N/A')[:100]}...")
+        logger.info(f"Weekly Goal: {parsed_response.get('weekly_goal', 'N/A')[:100]}...")
+        logger.info(f"Number of Recommendations: {len(parsed_response.get('recommendations', []))}")
+        
+        for i, rec in enumerate(parsed_response.get('recommendations', []), 1):
+            logger.info(f"  {i}. {rec.get('title', 'No title')} ({rec.get('priority', 'N/A')} priority)")
+        
+        return parsed_response
     
     def _get_nutrition_schema(self):
         """Return the nutrition analysis schema for Gemini API"""
@@ -0,0 +1,114 @@
+"""
+Incremental JSON reader for streamed Gemini responses.
+
+Gemini sends a structured response as text chunks that split anywhere,
+even in the middle of a string or number. IncrementalJSONParser takes the
+chunks in order and reports every scalar value (string, number, true,
+false, null) once it is complete, together with its dotted path:
+
+    food_item                                -> "Margherita pizza"
+    nutritional_values.calories              -> 540
+    nutritional_values.carbohydrates.total   -> "62g"
+    nutritional_values.vitamins.0.name       -> "Calcium"
+
+Values are only reported, never guessed. A number is complete when the
+character after it has arrived, and a string when its closing quote has.
+The parser checks structure only as much as it needs to track paths, so the
+full text still has to pass json.loads at the end.
+"""
+import json
+import re
+from json.decoder import scanstring
+from typing import Any, List, Tuple
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_RE = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_NUMBER_CHARS = set('0123456789+-.eE')
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+
+class IncrementalJSONParser:
+    """Feed text chunks in order; each feed() returns the (path, value) pairs it completed"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget everything, e.g. when a failed attempt is retried from the start"""
+        self.text = ''
+        self._pos = 0
+        # One frame per open container: [is_object, key or index, expecting_key]
+        self._stack = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        fields = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if char in _WHITESPACE:
+                self._pos += 1
+            elif char == '{':
+                self._stack.append([True, None, True])
+                self._pos += 1
+            elif char == '[':
+                self._stack.append([False, 0, False])
+                self._pos += 1
+            elif char in '}]':
+                if self._stack:
+                    self._stack.pop()
+                self._pos += 1
+            elif char == ',':
+                if self._stack:
+                    frame = self._stack[-1]
+                    if frame[0]:
+                        frame[2] = True
+                    else:
+                        frame[1] += 1
+                self._pos += 1
+            elif char == ':':
+                if self._stack:
+                    self._stack[-1][2] = False
+                self._pos += 1
+            elif char == '"':
+                try:
+                    value, end = scanstring(text, self._pos + 1)
+                except json.JSONDecodeError:
+                    # Unterminated: wait for the rest of the string
+                    break
+                self._pos = end
+                if self._stack and self._stack[-1][0] and self._stack[-1][2]:
+                    self._stack[-1][1] = value
+                else:
+                    fields.append((self._path(), value))
+            else:
+                end = self._pos
+                while end < len(text) and text[end] in _NUMBER_CHARS:
+                    end += 1
+                if end > self._pos:
+                    if end == len(text):
+                        # "12" may still become "125" or "12.5"
+                        break
+                    number = text[self._pos:end]
+                    if not _NUMBER_RE.fullmatch(number):
+                        raise json.JSONDecodeError('Invalid number', text, self._pos)
+                    value = int(number) if number.lstrip('-').isdigit() else float(number)
+                    self._pos = end
+                    fields.append((self._path(), value))
+                    continue
+                for literal, value in _LITERALS.items():
+                    if text.startswith(literal, self._pos):
+                        self._pos += len(literal)
+                        fields.append((self._path(), value))
+                        break
+                else:
+                    if len(text) - self._pos < 5 and any(
+                        literal.startswith(text[self._pos:]) for literal in _LITERALS
+                    ):
+                        # Partial "tru" / "nul"
+                        break
+                    raise json.JSONDecodeError('Unexpected character', text, self._pos)
+        return fields
+
+    def _path(self) -> str:
+        return '.'.join(str(frame[1]) for frame in self._stack)
@@ -0,0 +1,191 @@
+"""
+Offline maintenance commands for the ChunDiet database.
+
+Usage:
+    python backend/maintenance.py rollup [--verify] [--db chundiet.db]
+    python backend/maintenance.py rebalance [--dry-run] [--from chundiet.db]
+    python backend/maintenance.py rebalance --user 42 --to shard-003.db
+    python backend/maintenance.py --db /tmp/scratch.db conformance [--user-id 900000001]
+    python backend/maintenance.py --database-url postgresql://localhost/chundiet_test conformance
+    python backend/maintenance.py archive --older-than 180 [--analyze]
+    CHUNDIET_QUERY_STATS=1 python backend/maintenance.py --db /tmp/scratch.db query-stats
+    python backend/maintenance.py query-stats --url http://localhost:5000
+
+Commands run against the backend configured in the environment: every shard
+in --shard-dir when CHUNDIET_SHARDS is set, PostgreSQL when
+CHUNDIET_DATABASE_URL (or --database-url) is set, otherwise --db (default
+chundiet.db). conformance and query-stats (without --url) write a throwaway
+user, so they ignore the environment and only run against an explicit
+scratch --db or --database-url.
+"""
+import argparse
+import json
+import os
+import sys
+from urllib.request import urlopen
+
+from database import DatabaseManager
+from models import init_db
+from query_stats import query_stats_from_env
+from sharding import ShardedDatabaseManager, router_from_env
+from shard_rebalance import move_user, rebalance
+from storage import create_database_manager
+from storage_conformance import run_conformance
+
+
+# The app's database file; commands that write test data refuse to touch it
+APP_DB = 'chundiet.db'
+
+
+def _scratch_error(args):
+    """Why a command that writes a throwaway user may not run against the chosen database, or None"""
+    if args.database_url:
+        return None
+    if not args.db:
+        hint = ' (or --url to read a running server)' if args.command == 'query-stats' else ''
+        return f"{args.command} writes a throwaway user: pass a scratch --db or --database-url{hint}"
+    if os.path.basename(args.db) == APP_DB:
+        return f"{args.command} writes a throwaway user; refusing to run it against {APP_DB}"
+    return None
+
+
+def open_backend(args, scratch: bool = False):
+    if args.database_url:
+        from postgres_backend import PostgresDatabaseManager
+        return PostgresDatabaseManager(args.database_url)
+    if scratch:
+        # Only the explicit scratch file, whatever the environment configures
+        init_db(args.db)
+        return DatabaseManager(args.db, query_stats=query_stats_from_env())
+    router = router_from_env(args.shard_dir)
+    if router is not None:
+        return ShardedDatabaseManager(router, single_writer=False, query_stats=query_stats_from_env())
+    db_path = args.db or APP_DB
+    if not os.environ.get('CHUNDIET_DATABASE_URL'):
+        init_db(db_path)
+    return create_database_manager(db_path)
+
+
+def cmd_rollup(db_manager, args):
+    report = db_manager.rebuild_daily_totals(verify_only=args.verify)
+    print(json.dumps(report, indent=2, default=str))
+    # Non-zero exit lets scripts detect drift when only verifying
+    return 1 if args.verify and report['drifted_days'] else 0
+
+
+def cmd_rebalance(db_manager, args):
+    if not isinstance(db_manager, ShardedDatabaseManager):
+        print("rebalance needs sharding enabled (set CHUNDIET_SHARDS)", file=sys.stderr)
+        return 2
+
+    router = db_manager.router
+    if args.user is not None:
+        if not args.to:
+            print("--user needs --to", file=sys.stderr)
+            return 2
+        source = router.shard_for(args.user)
+        target = args.to if os.path.dirname(args.to) else os.path.join(router.shard_dir, args.to)
+        if os.path.abspath(source) == os.path.abspath(target):
+            moves = []
+        elif args.dry_run:
+            moves = [{'user_id': args.user, 'from': source, 'to': target}]
+        else:
+            moves = [move_user(source, target, args.user, router=router)]
+    else:
+        moves = rebalance(router, extra_sources=args.sources, dry_run=args.dry_run)
+
+    print(json.dumps({'dry_run': args.dry_run, 'moves': moves}, indent=2))
+    return 0
+
+
+def cmd_conformance(db_manager, args):
+    report = run_conformance(db_manager, user_id=args.user_id)
+    print(json.dumps(report, indent=2, default=str))
+    return 0 if report['ok'] else 1
+
+
+def cmd_archive(db_manager, args):
+    report = db_manager.run_maintenance(
+        archive_after_days=args.older_than,
+        analyze=args.analyze,
+        vacuum_threshold=args.vacuum_threshold
+    )
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+def cmd_query_stats(db_manager, args):
+    if args.url:
+        # Dump what a running server has recorded
+        with urlopen(f"{args.url.rstrip('/')}/api/admin/query-stats?limit={args.limit}") as response:
+            report = json.load(response)
+    else:
+        if not db_manager.query_stats():
+            print("query stats are off (set CHUNDIET_QUERY_STATS=1)", file=sys.stderr)
+            return 2
+        # Profile the conformance workload, which calls every storage method;
+        # main() only gets here with an explicit scratch database
+        conformance = run_conformance(db_manager)
+        report = db_manager.query_stats(limit=args.limit)
+        report['conformance_ok'] = conformance['ok']
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ChunDiet database maintenance')
+    parser.add_argument('--db', default=None,
+                        help=f'Path to the SQLite database (default: {APP_DB}; conformance and query-stats need a scratch file)')
+    parser.add_argument('--database-url', default=None,
+                        help='PostgreSQL URL, instead of CHUNDIET_DATABASE_URL')
+    parser.add_argument('--shard-dir', default=None, help='Shard directory (default: CHUNDIET_SHARD_DIR or shards)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rollup = subparsers.add_parser('rollup', help='Recompute daily_totals from raw meals')
+    rollup.add_argument('--verify', action='store_true', help='Only report drift, do not rewrite')
+    rollup.set_defaults(func=cmd_rollup)
+
+    rebalance_parser = subparsers.add_parser('rebalance', help='Move users onto the shard the router picks')
+    rebalance_parser.add_argument('--dry-run', action='store_true', help='Only list the moves')
+    rebalance_parser.add_argument('--from', dest='sources', action='append', default=[],
+                                  help='Extra database to drain into the shards, e.g. the old chundiet.db')
+    rebalance_parser.add_argument('--user', type=int, help='Move a single user')
+    rebalance_parser.add_argument('--to', help='Target shard file for --user (pinned in shard_map.json)')
+    rebalance_parser.set_defaults(func=cmd_rebalance)
+
+    conformance = subparsers.add_parser('conformance', help='Check the configured backend against the storage interface')
+    conformance.add_argument('--user-id', type=int, help='Throwaway user id to test with (default: random)')
+    conformance.set_defaults(func=cmd_conformance, writes_test_data=True)
+
+    archive = subparsers.add_parser('archive', help='Move old meals to meals_archive, then optimize/VACUUM')
+    archive.add_argument('--older-than', type=int, default=None, metavar='DAYS',
+                         help='Archive meals logged more than DAYS ago (default: only optimize)')
+    archive.add_argument('--analyze', action='store_true', help='Run a full ANALYZE as well as PRAGMA optimize')
+    archive.add_argument('--vacuum-threshold', type=float, default=0.25,
+                         help='VACUUM when at least this fraction of pages is free (default: 0.25)')
+    archive.set_defaults(func=cmd_archive)
+
+    query_stats = subparsers.add_parser('query-stats', help='Dump per-query timings, slow queries and their plans')
+    query_stats.add_argument('--url', help='Read from a running server instead of profiling a scratch --db')
+    query_stats.add_argument('--limit', type=int, default=20, help='Number of queries and slow entries to show')
+    query_stats.set_defaults(func=cmd_query_stats, writes_test_data=True)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'url', None):
+        # Reads a running server; no database is opened
+        return args.func(None, args)
+    scratch = getattr(args, 'writes_test_data', False)
+    if scratch:
+        error = _scratch_error(args)
+        if error:
+            print(error, file=sys.stderr)
+            return 2
+    db_manager = open_backend(args, scratch=scratch)
+    try:
+        return args.func(db_manager, args)
+    finally:
+        db_manager.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
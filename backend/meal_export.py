@@ -0,0 +1,89 @@
+"""
+Serializers for streaming meal exports.
+
+Each function turns an iterator of export records (see
+DatabaseManager.iter_meal_export) into an iterator of text/bytes chunks so
+the whole history never has to be held in memory. The formats round-trip
+through the bulk import endpoint.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Dict, Iterable, Iterator
+
+from meal_import import CSV_COLUMNS
+
+EXPORT_CSV_COLUMNS = ['id'] + CSV_COLUMNS
+
+# Flush a chunk to the client roughly every this many bytes
+FLUSH_BYTES = 64 * 1024
+
+
+def ndjson_chunks(records: Iterable[Dict]) -> Iterator[str]:
+    buffer = []
+    size = 0
+    first = True
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        # The first record goes out on its own so the client sees bytes immediately
+        if first:
+            first = False
+            yield line
+            continue
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_row(record: Dict) -> Dict:
+    values = record['nutritional_values']
+    return {
+        'id': record.get('id'),
+        'food_item': record['food_item'],
+        'consumption_time': record.get('consumption_time'),
+        'date_logged': record.get('date_logged'),
+        'serving_size': values.get('serving_size'),
+        'calories': values.get('calories'),
+        'protein': values.get('protein'),
+        'total_carbohydrates': values['carbohydrates'].get('total'),
+        'fiber': values['carbohydrates'].get('fiber'),
+        'sugars': values['carbohydrates'].get('sugars'),
+        'total_fat': values['fat'].get('total'),
+        'saturated_fat': values['fat'].get('saturated'),
+        'vitamins': json.dumps(values.get('vitamins') or [])
+    }
+
+
+def csv_chunks(records: Iterable[Dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_COLUMNS)
+    writer.writeheader()
+    # Send the header right away
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for record in records:
+        writer.writerow(_csv_row(record))
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Incrementally gzip a stream of text chunks"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
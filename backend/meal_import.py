@@ -0,0 +1,265 @@
+"""
+Streaming parser and validator for bulk meal imports.
+
+Accepts CSV (one flat row per meal, columns named like nutrition_entries)
+or JSON Lines (one record per line in the same shape as the Gemini
+nutrition schema). Records are parsed one at a time so memory use does not
+depend on the size of the upload.
+
+The storage backends spool the validated records to a temporary file
+(SpooledRecords) on the request thread before the write starts, so a slow
+upload never holds the write transaction open.
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+CSV_COLUMNS = [
+    'food_item', 'consumption_time', 'date_logged', 'serving_size', 'calories',
+    'protein', 'total_carbohydrates', 'fiber', 'sugars', 'total_fat',
+    'saturated_fat', 'vitamins'
+]
+
+# Keep the error report bounded no matter how many rows fail
+MAX_REPORTED_ERRORS = 100
+# Spooled imports stay in memory up to this size, then move to a temp file
+SPOOL_MEMORY_BYTES = 8 * 1024 * 1024
+
+
+class RecordError(ValueError):
+    """Raised for a single record that fails validation"""
+
+
+def detect_format(content_type: Optional[str], filename: Optional[str], explicit: Optional[str]) -> str:
+    """Pick 'csv' or 'jsonl' from an explicit hint, the filename or the content type"""
+    if explicit:
+        explicit = explicit.lower()
+        if explicit in ('csv', 'jsonl', 'ndjson'):
+            return 'csv' if explicit == 'csv' else 'jsonl'
+        raise ValueError(f"Unsupported import format: {explicit}")
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    if content_type and 'csv' in content_type:
+        return 'csv'
+    return 'jsonl'
+
+
+def _optional_str(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_date(value) -> Optional[str]:
+    value = _optional_str(value)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).date().isoformat()
+    except ValueError:
+        raise RecordError(f"Invalid date_logged '{value}', expected YYYY-MM-DD")
+
+
+def _parse_vitamins(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise RecordError("vitamins is not a valid JSON array")
+        else:
+            # Compact CSV form: "Vitamin C:15%;Iron:8%"
+            vitamins = []
+            for pair in value.split(';'):
+                if not pair.strip():
+                    continue
+                name, _, pct = pair.partition(':')
+                vitamins.append({'name': name.strip(), 'percent_daily_value': pct.strip()})
+            return vitamins
+    if not isinstance(value, list):
+        raise RecordError("vitamins must be a list")
+    vitamins = []
+    for vitamin in value:
+        if not isinstance(vitamin, dict) or not vitamin.get('name'):
+            raise RecordError("each vitamin needs a name and percent_daily_value")
+        vitamins.append({
+            'name': str(vitamin['name']),
+            'percent_daily_value': _optional_str(vitamin.get('percent_daily_value'))
+        })
+    return vitamins
+
+
+def validate_record(record: Dict) -> Dict:
+    """
+    Validate one nested (schema-shaped) record and return it in the exact
+    shape store_meal expects, plus an optional date_logged
+    """
+    if not isinstance(record, dict):
+        raise RecordError("record must be a JSON object")
+
+    food_item = _optional_str(record.get('food_item'))
+    if not food_item:
+        raise RecordError("food_item is required")
+
+    values = record.get('nutritional_values')
+    if not isinstance(values, dict):
+        raise RecordError("nutritional_values object is required")
+
+    calories = values.get('calories')
+    try:
+        calories = int(round(float(calories)))
+    except (TypeError, ValueError):
+        raise RecordError(f"calories must be a number, got {calories!r}")
+    if calories < 0:
+        raise RecordError("calories must not be negative")
+
+    carbs = values.get('carbohydrates') or {}
+    fats = values.get('fat') or {}
+    if not isinstance(carbs, dict) or not isinstance(fats, dict):
+        raise RecordError("carbohydrates and fat must be objects")
+
+    return {
+        'food_item': food_item,
+        'consumption_time': _optional_str(record.get('consumption_time')),
+        'date_logged': _parse_date(record.get('date_logged')),
+        'nutritional_values': {
+            'serving_size': _optional_str(values.get('serving_size')),
+            'calories': calories,
+            'protein': _optional_str(values.get('protein')),
+            'carbohydrates': {
+                'total': _optional_str(carbs.get('total')),
+                'fiber': _optional_str(carbs.get('fiber')),
+                'sugars': _optional_str(carbs.get('sugars')),
+            },
+            'fat': {
+                'total': _optional_str(fats.get('total')),
+                'saturated': _optional_str(fats.get('saturated')),
+            },
+            'vitamins': _parse_vitamins(values.get('vitamins')),
+        }
+    }
+
+
+def csv_row_to_record(row: Dict) -> Dict:
+    """Turn a flat CSV row into the nested schema shape"""
+    return {
+        'food_item': row.get('food_item'),
+        'consumption_time': row.get('consumption_time'),
+        'date_logged': row.get('date_logged'),
+        'nutritional_values': {
+            'serving_size': row.get('serving_size'),
+            'calories': row.get('calories'),
+            'protein': row.get('protein'),
+            'carbohydrates': {
+                'total': row.get('total_carbohydrates'),
+                'fiber': row.get('fiber'),
+                'sugars': row.get('sugars'),
+            },
+            'fat': {
+                'total': row.get('total_fat'),
+                'saturated': row.get('saturated_fat'),
+            },
+            'vitamins': row.get('vitamins'),
+        }
+    }
+
+
+def iter_raw_records(binary_stream, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (line_number, record, error) for each record in the upload"""
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        if not reader.fieldnames or 'food_item' not in reader.fieldnames:
+            raise ValueError("CSV header must include food_item (expected columns: " + ', '.join(CSV_COLUMNS) + ")")
+        for row in reader:
+            yield reader.line_num, csv_row_to_record(row), None
+        return
+
+    for line_number, line in enumerate(text_stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+
+
+class ImportReport:
+    """Counts and (bounded) per-row errors collected while streaming an import"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def as_dict(self) -> Dict:
+        return {
+            'total_rows': self.total_rows,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors)
+        }
+
+
+def valid_records(raw_records: Iterable, report: ImportReport) -> Iterator[Dict]:
+    """Validate records lazily, recording failures on the report"""
+    for line_number, record, error in raw_records:
+        report.total_rows += 1
+        if error:
+            report.add_error(line_number, error)
+            continue
+        try:
+            yield validate_record(record)
+        except RecordError as e:
+            report.add_error(line_number, str(e))
+
+
+class SpooledRecords:
+    """
+    Fully read records, kept as JSON Lines in memory or in a temp file.
+    Iterating reads them back from local storage, never from the client.
+    """
+
+    def __init__(self, records: Iterable[Dict], max_memory: int = SPOOL_MEMORY_BYTES):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self.count = 0
+        try:
+            for record in records:
+                self._file.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+                self.count += 1
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Dict]:
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> 'SpooledRecords':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,366 @@
+"""
+Near-duplicate lookup for meal descriptions.
+
+The analysis cache only matches descriptions that are identical after
+trimming, so "I had an apple", "ate 1 apple" and "apple" each cost a Gemini
+call. This index reduces a description to its food words and a quantity:
+
+    "I had 2 apples"      -> quantity 2,   food "apple"
+    "half a cup of rice"  -> quantity 0.5, food "cup rice"
+
+Food words are compared through character trigram sets. A MinHash signature
+split into LSH bands narrows the candidates, so a lookup only computes the
+exact Jaccard similarity for a handful of entries. Above the threshold, the
+stored analysis is reused and scaled by the ratio of the two quantities.
+Only a count at the start of a description ("2 apples", "150 g rice") is a
+quantity. Descriptions with several items ("eggs and toast"), percentages
+("2% milk"), clock times ("pizza at 7pm") or any other number ("7 up") are
+never scaled; their numbers stay in the food text and have to match exactly.
+
+Configured with CHUNDIET_SIMILARITY_THRESHOLD (default 0.85) and
+CHUNDIET_SIMILARITY_MAX_ENTRIES (default 200000). Set CHUNDIET_SIMILARITY=0
+to turn it off.
+"""
+import copy
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+NUM_PERMUTATIONS = 16
+BAND_ROWS = 2
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Quantity ratios outside this range are more likely a misread than a real portion
+MIN_SCALE = 0.1
+MAX_SCALE = 10.0
+
+STOP_WORDS = frozenset((
+    'i', 'im', 'ive', 'id', 'me', 'my', 'we', 'our', 'just', 'had', 'have', 'has', 'having', 'ate', 'eat',
+    'eaten', 'eating', 'drank', 'drink', 'drinking', 'consumed', 'some', 'the', 'of', 'for', 'at', 'today',
+    'tonight', 'yesterday', 'this', 'morning', 'afternoon', 'evening', 'breakfast', 'lunch', 'dinner',
+    'snack', 'meal', 'about', 'around', 'approximately', 'roughly', 'like', 'was', 'were', 'it', 'is',
+    'piece', 'pieces', 'serving', 'servings', 'portion', 'portions'
+))
+
+# Words that join several items; their presence disables quantity scaling
+CONJUNCTIONS = frozenset(('and', 'with', 'plus', '&', ','))
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'single': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'dozen': 12,
+    'half': 0.5, 'quarter': 0.25, 'couple': 2, 'pair': 2
+}
+
+ARTICLES = frozenset(('a', 'an'))
+FRACTION_WORDS = frozenset(('half', 'quarter'))
+
+# Units too short to pass as a food word after a count ("150 g rice")
+SHORT_UNITS = frozenset(('g', 'gr', 'kg', 'mg', 'oz', 'lb', 'ml', 'l'))
+
+_TOKEN_RE = re.compile(r'\d+(?:\.\d+)?(?:/\d+)?%?|[a-z]+|[&,]')
+_AMOUNT_RE = re.compile(r'(\d+(?:\.\d+)?)(?:/(\d+))?')
+# Numbers that are not portions: "2% milk", "7pm", "7:30", "at 7"
+_NOT_A_PORTION_RE = re.compile(r'\d%|\d\s*[ap]\.?m\b|\d:\d\d|\bat\s+\d')
+_SCALABLE_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+def _stem(token: str) -> str:
+    """Crude plural folding so "apples" and "apple" share a signature"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith(('ches', 'shes', 'oes')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def _amount(token: str) -> Optional[float]:
+    amount = _AMOUNT_RE.fullmatch(token)
+    if amount:
+        return float(amount.group(1)) / float(amount.group(2) or 1)
+    return NUMBER_WORDS.get(token)
+
+
+def _leading_count(tokens: List[str]) -> Tuple[Optional[float], range]:
+    """(quantity, token positions) of the count opening a description, or (None, empty range)"""
+    position = 0
+    while position < len(tokens) and tokens[position] in STOP_WORDS:
+        position += 1
+    start = position
+    while position < len(tokens) and _amount(tokens[position]) is not None:
+        position += 1
+    run = tokens[start:position]
+    # One number, or one qualified by an article or fraction: "a dozen", "half a", "a half"
+    if not run or len(run) > 2 or (len(run) == 2 and not any(
+            token in ARTICLES or token in FRACTION_WORDS for token in run)):
+        return None, range(0)
+
+    while position < len(tokens) and (tokens[position] in STOP_WORDS or tokens[position] in ARTICLES):
+        position += 1
+    # A count is followed by a unit or a food word: "7 up" is a drink, not seven of something
+    following = tokens[position] if position < len(tokens) else ''
+    if following not in SHORT_UNITS and not (following.isalpha() and len(following) >= 3):
+        return None, range(0)
+
+    quantity = 1.0
+    for token in run:
+        quantity *= _amount(token)
+    return quantity, range(start, start + len(run))
+
+
+def parse_description(description: str, default_quantity: Optional[float] = 1.0) -> Tuple[float, str, bool]:
+    """
+    Split a meal description into (quantity, food text, scalable).
+    quantity is default_quantity when none is given. Descriptions with several
+    items, percentages, times or a number other than the leading count are not
+    scalable; their numbers stay in the food text instead.
+    """
+    text = (description or '').lower().replace('’', "'").replace("'", '')
+    text = re.sub(r'(\d)\s+%', r'\1%', text)
+    tokens = _TOKEN_RE.findall(text)
+    quantity, counted = _leading_count(tokens)
+    scalable = (
+        not any(token in CONJUNCTIONS for token in tokens)
+        and not _NOT_A_PORTION_RE.search(text)
+        and all(
+            position in counted
+            for position, token in enumerate(tokens)
+            if token not in ARTICLES and (token[0].isdigit() or token in NUMBER_WORDS)
+        )
+    )
+    if not scalable:
+        quantity, counted = None, range(0)
+
+    words: List[str] = []
+    for position, token in enumerate(tokens):
+        # Articles are an implicit single item
+        if position in counted or token in ARTICLES:
+            continue
+        if token in CONJUNCTIONS:
+            words.append('+')
+            continue
+        value = _amount(token)
+        if value is not None:
+            words.append(f'{value:g}')
+        elif token[0].isdigit():
+            # "2%"
+            words.append(token)
+        elif token not in STOP_WORDS:
+            words.append(_stem(token))
+
+    return (quantity if quantity is not None else default_quantity), ' '.join(words).strip(' +'), scalable
+
+
+def shingles(text: str, size: int = 3) -> frozenset:
+    padded = f' {text} '
+    if len(padded) <= size:
+        return frozenset((padded,))
+    return frozenset(padded[i:i + size] for i in range(len(padded) - size + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+def _permutations(count: int, seed: int = 1310) -> List[Tuple[int, int]]:
+    # Deterministic coefficients so signatures are stable across restarts
+    state = seed
+    coefficients = []
+    for _ in range(count):
+        state = (state * 6364136223846793005 + 1442695040888963407) & ((1 << 64) - 1)
+        a = (state >> 3) % (_MERSENNE_PRIME - 1) + 1
+        state = (state * 6364136223846793005 + 1442695040888963407) & ((1 << 64) - 1)
+        b = (state >> 3) % _MERSENNE_PRIME
+        coefficients.append((a, b))
+    return coefficients
+
+
+_COEFFICIENTS = _permutations(NUM_PERMUTATIONS)
+
+
+def minhash(grams: frozenset) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(gram.encode('utf-8')) for gram in grams]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _COEFFICIENTS
+    )
+
+
+def _band_keys(signature: Tuple[int, ...]) -> List[Tuple]:
+    return [(i,) + signature[i:i + BAND_ROWS] for i in range(0, len(signature), BAND_ROWS)]
+
+
+def _scale_value(value, factor: float):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return int(round(value * factor))
+    if isinstance(value, float):
+        return round(value * factor, 2)
+    if isinstance(value, str):
+        return _SCALABLE_NUMBER_RE.sub(lambda m: f'{float(m.group(0)) * factor:.1f}'.rstrip('0').rstrip('.'), value)
+    return value
+
+
+def scale_analysis(result: Dict, factor: float) -> Dict:
+    """Copy of a Gemini analysis with every nutrient amount multiplied by factor"""
+    scaled = copy.deepcopy(result)
+    if factor == 1:
+        return scaled
+    values = scaled.get('nutritional_values') or {}
+    for field in ('calories', 'protein'):
+        if field in values:
+            values[field] = _scale_value(values[field], factor)
+    for group in ('carbohydrates', 'fat'):
+        for field, amount in (values.get(group) or {}).items():
+            values[group][field] = _scale_value(amount, factor)
+    for vitamin in values.get('vitamins') or []:
+        if 'percent_daily_value' in vitamin:
+            vitamin['percent_daily_value'] = _scale_value(vitamin['percent_daily_value'], factor)
+    if values.get('serving_size'):
+        values['serving_size'] = f"{factor:g} x {values['serving_size']}"
+    return scaled
+
+
+class _Entry:
+    __slots__ = ('description', 'quantity', 'scalable', 'grams', 'bands', 'result')
+
+    def __init__(self, description, quantity, scalable, grams, bands, result):
+        self.description = description
+        self.quantity = quantity
+        self.scalable = scalable
+        self.grams = grams
+        self.bands = bands
+        self.result = result
+
+
+class MealSimilarityIndex:
+    """In-memory MinHash/LSH index from food text to a stored analysis, built as meals are analyzed"""
+
+    def __init__(self, threshold: float = 0.85, max_entries: int = 200000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # food text -> entry, oldest first so the index can drop from the front
+        self._entries = OrderedDict()
+        self._buckets: Dict[Tuple, set] = {}
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'exact_hits': 0, 'fuzzy_hits': 0, 'misses': 0, 'added': 0, 'evicted': 0}
+
+    @classmethod
+    def from_env(cls) -> Optional['MealSimilarityIndex']:
+        """Index configured from the environment, or None when CHUNDIET_SIMILARITY=0"""
+        if os.environ.get('CHUNDIET_SIMILARITY', '1').strip().lower() in ('0', 'false', 'no', 'off'):
+            return None
+        return cls(
+            threshold=float(os.environ.get('CHUNDIET_SIMILARITY_THRESHOLD', 0.85)),
+            max_entries=int(os.environ.get('CHUNDIET_SIMILARITY_MAX_ENTRIES', 200000))
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, description: str, result: Dict):
+        """Index one analyzed description; a newer analysis of the same food replaces the old one"""
+        quantity, text, scalable = parse_description(description)
+        if not text or quantity <= 0:
+            return
+        grams = shingles(text)
+        entry = _Entry(description, quantity, scalable, grams, _band_keys(minhash(grams)), copy.deepcopy(result))
+
+        with self._lock:
+            previous = self._entries.pop(text, None)
+            if previous is not None:
+                self._unlink(text, previous)
+            self._entries[text] = entry
+            for band in entry.bands:
+                self._buckets.setdefault(band, set()).add(text)
+            self._stats['added'] += 1
+            while len(self._entries) > self.max_entries:
+                old_text, old_entry = self._entries.popitem(last=False)
+                self._unlink(old_text, old_entry)
+                self._stats['evicted'] += 1
+
+    def add_many(self, items: Iterable[Tuple[str, Dict]]) -> int:
+        count = 0
+        for description, result in items:
+            self.add(description, result)
+            count += 1
+        return count
+
+    def _unlink(self, text: str, entry: _Entry):
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(text)
+                if not bucket:
+                    del self._buckets[band]
+
+    def lookup(self, description: str) -> Optional[Tuple[Dict, float, str]]:
+        """
+        Return (analysis scaled to this description's quantity, similarity,
+        matched description), or None when nothing is close enough.
+        """
+        quantity, text, scalable = parse_description(description)
+        if not text:
+            return None
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            match = self._entries.get(text)
+            score = 1.0
+            if match is None:
+                match, score = self._best_candidate(text)
+
+            if match is None or match.scalable != scalable:
+                self._stats['misses'] += 1
+                return None
+            factor = quantity / match.quantity if scalable else 1.0
+            if not MIN_SCALE <= factor <= MAX_SCALE:
+                self._stats['misses'] += 1
+                return None
+            self._stats['exact_hits' if score == 1.0 else 'fuzzy_hits'] += 1
+            result, matched = match.result, match.description
+
+        return scale_analysis(result, factor), score, matched
+
+    def _best_candidate(self, text: str):
+        grams = shingles(text)
+        candidates = set()
+        for band in _band_keys(minhash(grams)):
+            candidates.update(self._buckets.get(band, ()))
+
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            entry = self._entries[candidate]
+            score = jaccard(grams, entry.grams)
+            if score > best_score:
+                best, best_score = entry, score
+        if best_score < self.threshold:
+            return None, best_score
+        return best, best_score
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['buckets'] = len(self._buckets)
+        hits = stats['exact_hits'] + stats['fuzzy_hits']
+        stats.update({
+            'threshold': self.threshold,
+            'max_entries': self.max_entries,
+            'hit_rate': hits / stats['lookups'] if stats['lookups'] else 0.0
+        })
+        return stats
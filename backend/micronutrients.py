@@ -0,0 +1,127 @@
+"""
+Canonical vitamin/mineral dictionary and helpers for the micronutrients table.
+
+Gemini names the same nutrient in many ways ("Vit. C", "Vitamin C",
+"Ascorbic acid"), so every name is normalized and mapped to one canonical
+entry before it is stored as (entry_id, nutrient_id, pct_dv).
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from nutrient_parser import parse_percent
+
+# canonical name -> (kind, aliases); aliases are matched after normalize_nutrient_key()
+CANONICAL_NUTRIENTS = {
+    'Vitamin A': ('vitamin', ['vitamin a', 'retinol', 'beta carotene']),
+    'Vitamin B1': ('vitamin', ['vitamin b1', 'b1', 'thiamin', 'thiamine']),
+    'Vitamin B2': ('vitamin', ['vitamin b2', 'b2', 'riboflavin']),
+    'Vitamin B3': ('vitamin', ['vitamin b3', 'b3', 'niacin', 'nicotinic acid']),
+    'Vitamin B5': ('vitamin', ['vitamin b5', 'b5', 'pantothenic acid']),
+    'Vitamin B6': ('vitamin', ['vitamin b6', 'b6', 'pyridoxine']),
+    'Vitamin B7': ('vitamin', ['vitamin b7', 'b7', 'biotin']),
+    'Vitamin B9': ('vitamin', ['vitamin b9', 'b9', 'folate', 'folic acid', 'folacin']),
+    'Vitamin B12': ('vitamin', ['vitamin b12', 'b12', 'cobalamin', 'cyanocobalamin']),
+    'Vitamin C': ('vitamin', ['vitamin c', 'ascorbic acid']),
+    'Vitamin D': ('vitamin', ['vitamin d', 'vitamin d3', 'vitamin d2', 'cholecalciferol']),
+    'Vitamin E': ('vitamin', ['vitamin e', 'tocopherol', 'alpha tocopherol']),
+    'Vitamin K': ('vitamin', ['vitamin k', 'vitamin k1', 'vitamin k2', 'phylloquinone']),
+    'Choline': ('vitamin', ['choline']),
+    'Calcium': ('mineral', ['calcium', 'ca']),
+    'Iron': ('mineral', ['iron', 'fe']),
+    'Magnesium': ('mineral', ['magnesium', 'mg']),
+    'Phosphorus': ('mineral', ['phosphorus', 'phosphorous']),
+    'Potassium': ('mineral', ['potassium', 'k']),
+    'Sodium': ('mineral', ['sodium', 'na', 'salt']),
+    'Zinc': ('mineral', ['zinc', 'zn']),
+    'Copper': ('mineral', ['copper', 'cu']),
+    'Manganese': ('mineral', ['manganese', 'mn']),
+    'Selenium': ('mineral', ['selenium', 'se']),
+    'Iodine': ('mineral', ['iodine']),
+    'Chromium': ('mineral', ['chromium']),
+    'Molybdenum': ('mineral', ['molybdenum']),
+    'Chloride': ('mineral', ['chloride']),
+}
+
+_ALIASES = {
+    alias: canonical
+    for canonical, (_, aliases) in CANONICAL_NUTRIENTS.items()
+    for alias in aliases
+}
+
+
+def normalize_nutrient_key(name: str) -> str:
+    """Lowercase, strip punctuation and expand 'vit.' so aliases compare equal"""
+    text = name.lower()
+    text = re.sub(r'[^a-z0-9 ]', ' ', text)
+    text = re.sub(r'\b(vit|vitamine|vitamins)\b', 'vitamin', text)
+    # "b 12" / "b-12" -> "b12"
+    text = re.sub(r'\b([a-z])\s+(\d+)\b', r'\1\2', text)
+    return ' '.join(text.split())
+
+
+def canonical_nutrient_name(name: Optional[str]) -> Optional[str]:
+    """Map a free-form vitamin/mineral name to its canonical dictionary entry"""
+    if not name or not str(name).strip():
+        return None
+
+    name = str(name)
+    # Try the whole name, then the text outside and inside any parentheses,
+    # e.g. "Vitamin B12 (Cobalamin)" or "Cobalamin (B12)"
+    candidates = [name, re.sub(r'\(.*?\)', ' ', name)] + re.findall(r'\((.*?)\)', name)
+    for candidate in candidates:
+        key = normalize_nutrient_key(candidate)
+        if key in _ALIASES:
+            return _ALIASES[key]
+
+    # Unknown nutrient: keep it, but in a stable normalized spelling
+    key = normalize_nutrient_key(re.sub(r'\(.*?\)', ' ', name)) or normalize_nutrient_key(name)
+    return key.title() if key else None
+
+
+def seed_nutrients(cursor):
+    """Insert the canonical dictionary into the nutrients table"""
+    cursor.executemany(
+        'INSERT OR IGNORE INTO nutrients (name, kind) VALUES (?, ?)',
+        [(canonical, kind) for canonical, (kind, _) in CANONICAL_NUTRIENTS.items()]
+    )
+
+
+def store_micronutrients(cursor, entry_id: int, vitamins: List[Dict]):
+    """
+    Normalize a Gemini vitamins list and store it against a nutrition entry.
+    Duplicate names within one entry ("Vit C" and "Vitamin C") are summed.
+    """
+    store_micronutrients_many(cursor, [(entry_id, vitamins)])
+
+
+def micronutrient_rows(entries: List[Tuple[int, List[Dict]]]) -> List[Tuple[str, int, float]]:
+    """Normalize (entry_id, vitamins) pairs into (nutrient name, entry_id, pct_dv) rows"""
+    rows = []
+    for entry_id, vitamins in entries:
+        for vitamin in vitamins or []:
+            if not isinstance(vitamin, dict):
+                continue
+            name = canonical_nutrient_name(vitamin.get('name'))
+            pct_dv = parse_percent(vitamin.get('percent_daily_value'))
+            if name is None or pct_dv is None:
+                continue
+            rows.append((name, entry_id, pct_dv))
+    return rows
+
+
+def store_micronutrients_many(cursor, entries: List[Tuple[int, List[Dict]]]):
+    """Batched form of store_micronutrients for (entry_id, vitamins) pairs"""
+    rows = micronutrient_rows(entries)
+    if not rows:
+        return
+
+    cursor.executemany(
+        "INSERT OR IGNORE INTO nutrients (name, kind) VALUES (?, 'other')",
+        [(name,) for name, _, _ in rows]
+    )
+    cursor.executemany('''
+        INSERT INTO micronutrients (entry_id, nutrient_id, pct_dv)
+        SELECT ?, id, ? FROM nutrients WHERE name = ?
+        ON CONFLICT (entry_id, nutrient_id) DO UPDATE SET
+            pct_dv = pct_dv + excluded.pct_dv
+    ''', [(entry_id, pct_dv, name) for name, entry_id, pct_dv in rows])
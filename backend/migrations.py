@@ -0,0 +1,239 @@
+"""
+Versioned schema migrations.
+
+init_db() creates the baseline tables (version 0). Every later schema change
+is appended to MIGRATIONS as (version, description, function) and applied in
+order at startup, each in its own transaction, with the applied version
+recorded in the schema_version table.
+"""
+import json
+
+from nutrient_parser import parse_grams
+from rollups import DAILY_TOTALS_FROM_RAW_SQL, TOTAL_COLUMNS
+from micronutrients import seed_nutrients, store_micronutrients
+from recommendation_history import encode_payload
+
+MACRO_COLUMNS = (
+    ('protein_g', 'protein'),
+    ('carbs_g', 'total_carbohydrates'),
+    ('fiber_g', 'fiber'),
+    ('sugars_g', 'sugars'),
+    ('fat_g', 'total_fat'),
+    ('saturated_fat_g', 'saturated_fat'),
+)
+
+
+def _add_hot_query_indexes(cursor):
+    # Per-user date range lookups used by the daily summary, history and recommendations
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meals_user_date
+        ON meals (user_id, date_logged, consumption_time)
+    ''')
+    # Join from meals to their nutrition rows
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_nutrition_entries_meal
+        ON nutrition_entries (meal_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_settings_user
+        ON user_settings (user_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_goals_user
+        ON user_goals (user_id, updated_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_recommendations_user
+        ON recommendations (user_id, created_at)
+    ''')
+
+
+def _add_macro_gram_columns(cursor):
+    # Numeric grams next to the original unit strings so totals can be SUM()ed
+    for gram_column, _ in MACRO_COLUMNS:
+        cursor.execute(f'ALTER TABLE nutrition_entries ADD COLUMN {gram_column} REAL')
+
+    source_columns = ', '.join(text_column for _, text_column in MACRO_COLUMNS)
+    rows = cursor.execute(f'SELECT id, {source_columns} FROM nutrition_entries').fetchall()
+
+    assignments = ', '.join(f'{gram_column} = ?' for gram_column, _ in MACRO_COLUMNS)
+    cursor.executemany(
+        f'UPDATE nutrition_entries SET {assignments} WHERE id = ?',
+        [tuple(parse_grams(value) for value in row[1:]) + (row[0],) for row in rows]
+    )
+
+
+def _add_daily_totals_rollup(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            meal_count INTEGER NOT NULL DEFAULT 0,
+            calories INTEGER NOT NULL DEFAULT 0,
+            protein_g REAL NOT NULL DEFAULT 0,
+            carbs_g REAL NOT NULL DEFAULT 0,
+            fiber_g REAL NOT NULL DEFAULT 0,
+            sugars_g REAL NOT NULL DEFAULT 0,
+            fat_g REAL NOT NULL DEFAULT 0,
+            saturated_fat_g REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(f'''
+        INSERT INTO daily_totals (user_id, day, {', '.join(TOTAL_COLUMNS)})
+        {DAILY_TOTALS_FROM_RAW_SQL}
+    ''')
+
+
+def _add_micronutrients_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS nutrients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,  -- Canonical name, e.g. 'Vitamin C'
+            kind TEXT  -- 'vitamin', 'mineral' or 'other'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS micronutrients (
+            entry_id INTEGER NOT NULL,
+            nutrient_id INTEGER NOT NULL,
+            pct_dv REAL NOT NULL,
+            PRIMARY KEY (entry_id, nutrient_id),
+            FOREIGN KEY (entry_id) REFERENCES nutrition_entries (id),
+            FOREIGN KEY (nutrient_id) REFERENCES nutrients (id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_micronutrients_nutrient
+        ON micronutrients (nutrient_id, entry_id)
+    ''')
+    seed_nutrients(cursor)
+
+    # Backfill from the JSON blobs already stored on nutrition_entries
+    rows = cursor.execute(
+        "SELECT id, vitamins FROM nutrition_entries WHERE vitamins IS NOT NULL AND vitamins != ''"
+    ).fetchall()
+    for entry_id, vitamins_json in rows:
+        try:
+            vitamins = json.loads(vitamins_json)
+        except ValueError:
+            continue
+        store_micronutrients(cursor, entry_id, vitamins)
+
+
+def _add_meals_archive(cursor):
+    # Compact copy of meals past the archive horizon: gram totals only, no
+    # text macros or vitamins JSON. ids are the original meals.id values.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meals_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            consumption_time TIMESTAMP,
+            food_item TEXT NOT NULL,
+            calories INTEGER,
+            protein_g REAL,
+            carbs_g REAL,
+            fiber_g REAL,
+            sugars_g REAL,
+            fat_g REAL,
+            saturated_fat_g REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meals_archive_user_day
+        ON meals_archive (user_id, day, consumption_time)
+    ''')
+
+
+def _version_recommendations(cursor):
+    # Append-only history: per-user version numbers and compressed bodies
+    for column, column_type in (('version', 'INTEGER'), ('payload', 'BLOB'), ('payload_codec', 'TEXT'),
+                                ('payload_size', 'INTEGER'), ('content_hash', 'TEXT')):
+        cursor.execute(f'ALTER TABLE recommendations ADD COLUMN {column} {column_type}')
+
+    rows = cursor.execute('''
+        SELECT id, user_id, recommendations_data FROM recommendations
+        ORDER BY user_id, created_at, id
+    ''').fetchall()
+    versions = {}
+    updates = []
+    for row_id, user_id, recommendations_data in rows:
+        versions[user_id] = versions.get(user_id, 0) + 1
+        body = json.loads(recommendations_data) if recommendations_data else {}
+        payload = encode_payload(body)
+        updates.append((versions[user_id], payload['payload'], payload['payload_codec'],
+                        payload['payload_size'], payload['content_hash'], row_id))
+    cursor.executemany('''
+        UPDATE recommendations
+        SET version = ?, payload = ?, payload_codec = ?, payload_size = ?, content_hash = ?,
+            recommendations_data = NULL
+        WHERE id = ?
+    ''', updates)
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_recommendations_user_version
+        ON recommendations (user_id, version)
+    ''')
+
+
+def _add_recommendation_fingerprints(cursor):
+    # Hash of the inputs a version was generated from, so unchanged inputs skip Gemini
+    cursor.execute('ALTER TABLE recommendations ADD COLUMN input_fingerprint TEXT')
+
+
+MIGRATIONS = [
+    (1, 'Add composite indexes for per-user date lookups', _add_hot_query_indexes),
+    (2, 'Add numeric gram columns for macronutrients', _add_macro_gram_columns),
+    (3, 'Add daily_totals rollup table', _add_daily_totals_rollup),
+    (4, 'Add normalized micronutrients table', _add_micronutrients_table),
+    (5, 'Add compact meals_archive table for cold history', _add_meals_archive),
+    (6, 'Keep versioned, compressed recommendation history', _version_recommendations),
+    (7, 'Record the input fingerprint of each recommendation version', _add_recommendation_fingerprints),
+]
+
+
+def get_schema_version(conn) -> int:
+    """Return the highest applied migration version (0 for a fresh database)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    result = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return result[0] or 0
+
+
+def run_migrations(conn) -> int:
+    """Apply all pending migrations in order, return the resulting schema version"""
+    current = get_schema_version(conn)
+    conn.commit()
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+
+        try:
+            # IMMEDIATE takes the write lock up front so two processes starting
+            # together cannot both apply the same step
+            conn.execute('BEGIN IMMEDIATE')
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            migrate(conn.cursor())
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+            current = version
+            print(f"[MIGRATION] Applied schema version {version}: {description}")
+        except Exception as e:
+            conn.rollback()
+            print(f"[MIGRATION ERROR] Schema version {version} failed: {e}")
+            raise
+
+    return current
@@ -1,10 +1,12 @@
 import sqlite3
 from datetime import datetime, date
 import json
+from migrations import run_migrations
+from nutrient_parser import parse_macros
 
-def init_db():
-    """Initialize SQLite database with required tables"""
-    conn = sqlite3.connect('chundiet.db')
+def init_db(db_path='chundiet.db', seed_demo_user=True):
+    """Initialize SQLite database with required tables and apply pending migrations"""
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
     # Users table
@@ -98,9 +100,9 @@ def init_db():
         )
     ''')
     
-    # Insert default user if not exists
+    # Insert default user if not exists (shards only seed it where user 1 lives)
     cursor.execute('SELECT COUNT(*) FROM users')
-    if cursor.fetchone()[0] == 0:
+    if seed_demo_user and cursor.fetchone()[0] == 0:
         cursor.execute('''
             INSERT INTO users (name, email, age, gender, weight, height, activity_level)
             VALUES ('Demo User', 'demo@chundiet.app', 25, 'prefer_not_to_say', 70.0, 175.0, 'moderate')
@@ -113,6 +115,9 @@ def init_db():
         ''')
     
     conn.commit()
+    
+    # Bring the schema up to date (indexes, new columns, new tables)
+    run_migrations(conn)
     conn.close()
 
 class User:
@@ -146,4 +151,7 @@ class NutritionEntry:
         self.total_fat = fats['total']
         self.saturated_fat = fats['saturated']
         # Store vitamins as JSON string
-        self.vitamins = json.dumps(nutrition_data['nutritional_values']['vitamins'])
\ No newline at end of file
+        self.vitamins = json.dumps(nutrition_data['nutritional_values']['vitamins'])
+        # Numeric grams parsed from the unit strings above
+        for column, grams in parse_macros(nutrition_data['nutritional_values']).items():
+            setattr(self, column, grams)
\ No newline at end of file
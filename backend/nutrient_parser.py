@@ -0,0 +1,121 @@
+import re
+from typing import Optional, Union
+
+# Conversion factors to grams
+UNIT_TO_GRAMS = {
+    'g': 1.0,
+    'gram': 1.0,
+    'grams': 1.0,
+    'gr': 1.0,
+    'kg': 1000.0,
+    'mg': 0.001,
+    'milligram': 0.001,
+    'milligrams': 0.001,
+    'µg': 0.000001,
+    'μg': 0.000001,
+    'ug': 0.000001,
+    'mcg': 0.000001,
+    'microgram': 0.000001,
+    'micrograms': 0.000001,
+    'oz': 28.349523125,
+    'ounce': 28.349523125,
+    'ounces': 28.349523125,
+    'lb': 453.59237,
+    'lbs': 453.59237,
+}
+
+TRACE_WORDS = ('trace', 'negligible', 'none', 'nil')
+
+# Fractions first so "1/2 oz" is not read as 1 with the unit lost; "1 1/2" is a mixed number
+_NUMBER = r'(?:\d+\s+)?\d+/\d+|\d+(?:\.\d+)?|\.\d+'
+_AMOUNT_RE = re.compile(
+    r'(?P<lt><|less than|under)?\s*'
+    r'(?P<low>' + _NUMBER + r')'
+    r'(?:\s*(?:-|–|to)\s*(?P<high>' + _NUMBER + r'))?'
+    r'\s*(?P<unit>[a-zµμ]+)?',
+    re.IGNORECASE
+)
+
+
+def _to_number(text: str) -> Optional[float]:
+    whole, _, fraction = text.rpartition(' ')
+    if '/' not in fraction:
+        return float(fraction)
+    numerator, denominator = fraction.split('/')
+    if float(denominator) == 0:
+        return None
+    return float(whole or 0) + float(numerator) / float(denominator)
+
+
+def _parse_amount(value):
+    """Return (amount, unit) from free text, applying the "<X" and range rules"""
+    text = str(value).strip().lower().replace(',', '')
+    if not text:
+        return None
+    if any(word in text for word in TRACE_WORDS):
+        return 0.0, None
+
+    match = _AMOUNT_RE.search(text)
+    if not match:
+        return None
+
+    low = _to_number(match.group('low'))
+    high = _to_number(match.group('high')) if match.group('high') else None
+    if low is None or (match.group('high') and high is None):
+        return None
+    amount = (low + high) / 2 if high is not None else low
+    if match.group('lt'):
+        amount = amount / 2
+    return amount, match.group('unit')
+
+
+def parse_percent(value: Union[str, int, float, None]) -> Optional[float]:
+    """Convert a %DV string such as "15%", "<1%" or "10-20%" into a number"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = _parse_amount(value)
+    return round(parsed[0], 4) if parsed else None
+
+
+def parse_grams(value: Union[str, int, float, None], default_unit: str = 'g') -> Optional[float]:
+    """
+    Convert a nutrient amount such as "4g", "150 mg", "<1g", "10-12g", "1 oz"
+    or "1/2 oz" into grams. Bare numbers are interpreted in default_unit.
+    "<X" becomes X/2, ranges become their midpoint, "trace" becomes 0.
+    Returns None when no amount can be recognised.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) * UNIT_TO_GRAMS[default_unit]
+
+    parsed = _parse_amount(value)
+    if parsed is None:
+        return None
+    amount, unit = parsed
+
+    unit = (unit or default_unit).lower()
+    factor = UNIT_TO_GRAMS.get(unit)
+    if factor is None:
+        # Unknown trailing word (e.g. "4 approx"), fall back to the default unit
+        factor = UNIT_TO_GRAMS[default_unit]
+
+    return round(amount * factor, 6)
+
+
+def parse_macros(nutritional_values: dict) -> dict:
+    """Parse the macro strings of a Gemini nutritional_values block into gram columns"""
+    carbs = nutritional_values.get('carbohydrates') or {}
+    fats = nutritional_values.get('fat') or {}
+    return {
+        'protein_g': parse_grams(nutritional_values.get('protein')),
+        'carbs_g': parse_grams(carbs.get('total')),
+        'fiber_g': parse_grams(carbs.get('fiber')),
+        'sugars_g': parse_grams(carbs.get('sugars')),
+        'fat_g': parse_grams(fats.get('total')),
+        'saturated_fat_g': parse_grams(fats.get('saturated')),
+    }
@@ -0,0 +1,308 @@
+"""
+Opt-in statement instrumentation for the SQLite backend.
+
+With CHUNDIET_QUERY_STATS=1 every pooled and writer connection is opened as
+an InstrumentedConnection. Its cursors time each statement from execute()
+until its last row is fetched, count the rows, and note which
+DatabaseManager method ran it. QueryStats keeps a latency histogram per
+statement and a ring buffer of slow statements with their EXPLAIN QUERY
+PLAN. A statement is slow from CHUNDIET_SLOW_QUERY_MS (default 50). Slow
+statements can also be appended to a JSON Lines file with
+CHUNDIET_SLOW_QUERY_LOG.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Dict, List, Optional
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+# Statements with a query plan worth capturing
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+# Frames from these files name the calling method
+CALLER_FILES = ('database.py',)
+# f-string built statements could otherwise grow the table without bound
+MAX_TRACKED_QUERIES = 500
+
+
+def normalize_sql(sql: str) -> str:
+    return ' '.join(sql.split())
+
+
+def _caller() -> str:
+    """Name of the DatabaseManager method (or else the nearest function) running the statement"""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename != 'query_stats.py':
+            if filename in CALLER_FILES:
+                return frame.f_code.co_name
+            if fallback is None:
+                fallback = f"{os.path.splitext(filename)[0]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+class _QueryEntry:
+    __slots__ = ('count', 'total_ms', 'max_ms', 'rows', 'buckets', 'callers')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.callers = {}
+
+    def add(self, elapsed_ms: float, rows: int, caller: str):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if elapsed_ms <= bound), len(BUCKETS_MS))
+        self.buckets[index] += 1
+        self.callers[caller] = self.callers.get(caller, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls"""
+        threshold = self.count * fraction
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= threshold and count:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def as_dict(self, sql: str) -> Dict:
+        labels = [f'<={bound}ms' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms']
+        return {
+            'sql': sql,
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'rows': self.rows,
+            'callers': dict(sorted(self.callers.items(), key=lambda item: -item[1])),
+            'histogram': {label: count for label, count in zip(labels, self.buckets) if count}
+        }
+
+
+class QueryStats:
+    """Thread-safe per-statement latency histograms and slow-query log"""
+
+    def __init__(self, slow_ms: float = 50.0, slow_log_size: int = 200, slow_log_path: str = None,
+                 explain: bool = True):
+        self.slow_ms = slow_ms
+        self.slow_log_path = slow_log_path
+        self.explain = explain
+        self.statements = 0
+        self.started_at = time.time()
+        self._queries = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def record(self, conn, sql: str, params, elapsed_ms: float, rows: int, caller: str):
+        key = normalize_sql(sql)
+        slow = elapsed_ms >= self.slow_ms
+        entry = None
+        if slow:
+            entry = {
+                'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'sql': key,
+                'params': repr(params)[:200] if params is not None else None,
+                'elapsed_ms': round(elapsed_ms, 3),
+                'rows': rows,
+                'caller': caller,
+                'plan': self._explain(conn, sql, params) if self.explain else None
+            }
+
+        with self._lock:
+            self.statements += 1
+            query = self._queries.get(key)
+            if query is None:
+                if len(self._queries) >= MAX_TRACKED_QUERIES:
+                    key = '<other statements>'
+                query = self._queries.setdefault(key, _QueryEntry())
+            query.add(elapsed_ms, rows, caller)
+            if entry:
+                self._slow.append(entry)
+
+        if entry and self.slow_log_path:
+            with self._log_lock:
+                with open(self.slow_log_path, 'a', encoding='utf-8') as log:
+                    log.write(json.dumps(entry) + '\n')
+
+    @staticmethod
+    def _explain(conn, sql: str, params) -> Optional[List[str]]:
+        if conn is None or params is None or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            # Plain cursor so the EXPLAIN itself is not recorded
+            rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except sqlite3.Error as e:
+            return [f'EXPLAIN failed: {e}']
+        depth = {0: -1}
+        plan = []
+        for node_id, parent_id, _, detail in rows:
+            depth[node_id] = depth.get(parent_id, -1) + 1
+            plan.append('  ' * depth[node_id] + detail)
+        return plan
+
+    def snapshot(self, limit: int = 20) -> Dict:
+        """Top statements by total time plus the most recent slow ones"""
+        with self._lock:
+            queries = [query.as_dict(sql) for sql, query in self._queries.items()]
+            slow = list(self._slow)
+            statements = self.statements
+        queries.sort(key=lambda query: -query['total_ms'])
+        return {
+            'enabled': True,
+            'since': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'slow_ms': self.slow_ms,
+            'statements': statements,
+            'distinct_queries': len(queries),
+            'queries': queries[:limit],
+            'slow': slow[-limit:][::-1]
+        }
+
+    def reset(self):
+        with self._lock:
+            self._queries = {}
+            self._slow.clear()
+            self.statements = 0
+            self.started_at = time.time()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement to connection.query_stats once its rows are consumed"""
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        caller = _caller()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - started, 0, caller]
+        if self.description is None:
+            # No result set: DML, DDL or transaction control
+            self._pending[3] = max(self.rowcount, 0)
+            self._finish()
+        else:
+            self.connection.pending_cursors.add(self)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        caller = _caller()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._pending = [sql, None, time.perf_counter() - started, max(self.rowcount, 0), caller]
+        self._finish()
+        return self
+
+    def _fetched(self, started: float, rows: int):
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - started
+            self._pending[3] += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            self._finish()
+            raise
+        self._fetched(started, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            # The connection may already be in another thread's hands: no EXPLAIN
+            self._finish(explain=False)
+        except Exception:
+            pass
+
+    def _finish(self, explain: bool = True):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        self.connection.pending_cursors.discard(self)
+        stats = self.connection.query_stats
+        if stats is not None:
+            sql, params, elapsed, rows, caller = pending
+            stats.record(self.connection if explain else None, sql, params, elapsed * 1000, rows, caller)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors (including conn.execute) are instrumented"""
+
+    query_stats = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Cursors whose result set has not been read to the end yet
+        self.pending_cursors = weakref.WeakSet()
+
+    def finish_statements(self):
+        """Record statements whose rows were only partly fetched (e.g. a single fetchone())"""
+        for cursor in list(self.pending_cursors):
+            cursor._finish()
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def query_stats_from_env() -> Optional[QueryStats]:
+    """QueryStats configured from the environment, or None unless CHUNDIET_QUERY_STATS is on"""
+    if os.environ.get('CHUNDIET_QUERY_STATS', '').strip().lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+    return QueryStats(
+        slow_ms=float(os.environ.get('CHUNDIET_SLOW_QUERY_MS', 50)),
+        slow_log_path=os.environ.get('CHUNDIET_SLOW_QUERY_LOG') or None
+    )
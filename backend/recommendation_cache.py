@@ -0,0 +1,139 @@
+"""
+Reuse of stored AI recommendations when their inputs have not changed.
+
+Every stored recommendation carries a fingerprint of what it was generated
+from: a hash of the get_recent_nutrition_summary result, hashes of the
+profile and goal fields the prompt uses, the temperature, and the meal count
+and calorie total of the summary. A new request compares the fingerprint of
+its inputs with the stored one:
+
+    fresh     identical inputs: the stored plan is returned, Gemini is not called
+    stale     same profile, goals and temperature, and the meals drifted by at
+              most CHUNDIET_RECOMMENDATION_STALE_MEALS meals (default 2) and
+              CHUNDIET_RECOMMENDATION_STALE_CALORIES of the calories (default
+              0.15): the stored plan is returned at once and regenerated in
+              the background
+    changed   anything else, or no fingerprint: generate before answering
+
+Background refreshes run on CHUNDIET_RECOMMENDATION_REFRESH_WORKERS threads
+(default 1), one per user at a time. CHUNDIET_RECOMMENDATION_REUSE=0 always
+generates.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+FRESH = 'fresh'
+STALE = 'stale'
+CHANGED = 'changed'
+
+# Only the fields the recommendation prompt reads; a new name or updated_at is not a new input
+PROFILE_FIELDS = ('age', 'gender', 'weight', 'activity_level')
+GOAL_FIELDS = ('goal_description', 'daily_calories', 'daily_protein', 'daily_carbs', 'daily_fat')
+
+
+def _digest(value) -> str:
+    text = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def input_fingerprint(recent_nutrition_data: Dict, user_profile: Optional[Dict], user_goals: Optional[Dict],
+                      temperature: float) -> Dict:
+    """Fingerprint of everything a recommendation is generated from"""
+    profile = user_profile or {}
+    goals = user_goals or {}
+    return {
+        'data': _digest(recent_nutrition_data),
+        'profile': _digest({field: profile.get(field) for field in PROFILE_FIELDS}),
+        'goals': _digest({field: goals.get(field) for field in GOAL_FIELDS}),
+        'temperature': temperature,
+        'meals': recent_nutrition_data.get('total_meals', 0),
+        'calories': recent_nutrition_data.get('total_calories', 0),
+    }
+
+
+class RecommendationRefresher:
+    """Classifies stored recommendations against current inputs and regenerates stale ones in the background"""
+
+    def __init__(self, enabled: bool = True, max_meal_drift: int = 2, max_calorie_drift: float = 0.15,
+                 workers: int = 1):
+        self.enabled = enabled
+        self.max_meal_drift = max_meal_drift
+        self.max_calorie_drift = max_calorie_drift
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recommendation-refresh')
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {FRESH: 0, STALE: 0, CHANGED: 0, 'refreshes': 0, 'refresh_failures': 0, 'refresh_skipped': 0}
+
+    @classmethod
+    def from_env(cls) -> 'RecommendationRefresher':
+        return cls(
+            enabled=os.environ.get('CHUNDIET_RECOMMENDATION_REUSE', '1') != '0',
+            max_meal_drift=int(os.environ.get('CHUNDIET_RECOMMENDATION_STALE_MEALS', 2)),
+            max_calorie_drift=float(os.environ.get('CHUNDIET_RECOMMENDATION_STALE_CALORIES', 0.15)),
+            workers=int(os.environ.get('CHUNDIET_RECOMMENDATION_REFRESH_WORKERS', 1))
+        )
+
+    def classify(self, stored_fingerprint: Optional[str], fingerprint: Dict) -> str:
+        """FRESH, STALE or CHANGED for the stored fingerprint (JSON text, as stored) against the current one"""
+        state = self._classify(stored_fingerprint, fingerprint)
+        with self._lock:
+            self._stats[state] += 1
+        return state
+
+    def _classify(self, stored_fingerprint: Optional[str], fingerprint: Dict) -> str:
+        if not self.enabled or not stored_fingerprint:
+            return CHANGED
+        try:
+            stored = json.loads(stored_fingerprint)
+        except (TypeError, ValueError):
+            return CHANGED
+        if stored == fingerprint:
+            return FRESH
+        if any(stored.get(field) != fingerprint[field] for field in ('profile', 'goals', 'temperature')):
+            return CHANGED
+        try:
+            meal_drift = abs(fingerprint['meals'] - stored['meals'])
+            calorie_drift = abs(fingerprint['calories'] - stored['calories']) / max(stored['calories'], 1)
+        except (KeyError, TypeError):
+            return CHANGED
+        if meal_drift <= self.max_meal_drift and calorie_drift <= self.max_calorie_drift:
+            return STALE
+        return CHANGED
+
+    def refresh(self, key: Hashable, regenerate: Callable[[], None]) -> bool:
+        """Run regenerate() in the background unless a refresh for key is already running"""
+        with self._lock:
+            if key in self._refreshing:
+                self._stats['refresh_skipped'] += 1
+                return False
+            self._refreshing.add(key)
+            self._stats['refreshes'] += 1
+        self._executor.submit(self._run, key, regenerate)
+        return True
+
+    def _run(self, key: Hashable, regenerate: Callable[[], None]):
+        try:
+            regenerate()
+        except Exception:
+            logger.exception('Background recommendation refresh for %s failed', key)
+            with self._lock:
+                self._stats['refresh_failures'] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['refreshing'] = len(self._refreshing)
+        requests = stats[FRESH] + stats[STALE] + stats[CHANGED]
+        stats['enabled'] = self.enabled
+        stats['reuse_rate'] = (stats[FRESH] + stats[STALE]) / requests if requests else 0.0
+        return stats
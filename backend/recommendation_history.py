@@ -0,0 +1,108 @@
+"""
+Versioned, compressed recommendation history.
+
+Each generated plan is appended as a new version for the user; nothing is
+overwritten. The plan body is stored as zlib-compressed JSON. Its
+uncompressed size and a SHA-256 of the JSON are stored next to it, so
+listing versions, or telling that two versions are identical, never
+decompresses a body. Only the newest CHUNDIET_RECOMMENDATION_HISTORY
+versions are kept per user (default 20, 0 keeps all).
+"""
+import hashlib
+import json
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+CODEC_ZLIB = 'zlib'
+# Metadata that is not part of the plan itself
+META_KEYS = ('created_at', 'version')
+
+
+def history_limit() -> int:
+    """Number of versions kept per user; 0 means unlimited"""
+    return max(0, int(os.environ.get('CHUNDIET_RECOMMENDATION_HISTORY', 20)))
+
+
+def split_recommendations(recommendations_data: Dict) -> Tuple[object, str, str]:
+    """Return (body, overall_assessment, weekly_goal) in the shape that is stored"""
+    if 'food_recommendations' in recommendations_data or 'nutritional_analysis' in recommendations_data:
+        # Enhanced format - store entire data structure
+        body = recommendations_data
+    else:
+        # Legacy format - only the list of recommendations
+        body = recommendations_data.get('recommendations', [])
+    return body, recommendations_data.get('overall_assessment', ''), recommendations_data.get('weekly_goal', '')
+
+
+def encode_payload(body) -> Dict:
+    """Compress a body; returns the payload columns"""
+    raw = json.dumps(body, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return {
+        'payload': zlib.compress(raw, 6),
+        'payload_codec': CODEC_ZLIB,
+        'payload_size': len(raw),
+        'content_hash': hashlib.sha256(raw).hexdigest()
+    }
+
+
+def decode_payload(payload, codec: Optional[str], legacy_text: Optional[str] = None):
+    """Decompress a stored body; rows written before versioning only have legacy_text"""
+    if payload is None:
+        return json.loads(legacy_text) if legacy_text else {}
+    if codec != CODEC_ZLIB:
+        raise ValueError(f"Unknown recommendation payload codec: {codec}")
+    return json.loads(zlib.decompress(bytes(payload)).decode('utf-8'))
+
+
+def recommendation_document(body, overall_assessment: str, weekly_goal: str, created_at: str,
+                            version: Optional[int]) -> Dict:
+    """Build the API response for a stored version"""
+    if isinstance(body, dict) and ('food_recommendations' in body or 'nutritional_analysis' in body):
+        # Enhanced format - return as is with metadata
+        document = dict(body)
+        document['overall_assessment'] = overall_assessment
+        document['weekly_goal'] = weekly_goal
+    else:
+        # Legacy format
+        document = {
+            'recommendations': body if isinstance(body, list) else [],
+            'overall_assessment': overall_assessment,
+            'weekly_goal': weekly_goal
+        }
+    document['created_at'] = created_at
+    document['version'] = version
+    return document
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+def diff_documents(old: Dict, new: Dict, path: str = '') -> List[Dict]:
+    """
+    Structural diff of two recommendation documents. Nested dicts are
+    compared key by key, lists by added/removed items, and anything else
+    by value.
+    """
+    changes = []
+    for key in sorted(set(old) | set(new)):
+        if not path and key in META_KEYS:
+            continue
+        where = f'{path}.{key}' if path else key
+        if key not in old:
+            changes.append({'path': where, 'change': 'added', 'new': new[key]})
+        elif key not in new:
+            changes.append({'path': where, 'change': 'removed', 'old': old[key]})
+        elif isinstance(old[key], dict) and isinstance(new[key], dict):
+            changes.extend(diff_documents(old[key], new[key], where))
+        elif isinstance(old[key], list) and isinstance(new[key], list):
+            old_items = {_canonical(item): item for item in old[key]}
+            new_items = {_canonical(item): item for item in new[key]}
+            added = [item for canon, item in new_items.items() if canon not in old_items]
+            removed = [item for canon, item in old_items.items() if canon not in new_items]
+            if added or removed:
+                changes.append({'path': where, 'change': 'list', 'added': added, 'removed': removed})
+        elif old[key] != new[key]:
+            changes.append({'path': where, 'change': 'changed', 'old': old[key], 'new': new[key]})
+    return changes
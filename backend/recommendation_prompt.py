@@ -0,0 +1,179 @@
+"""
+Compact, token-budgeted prompt for AI recommendations.
+
+The original prompt wrote a multi-line block for every meal of the past week,
+vitamins included, so heavy loggers sent many thousands of tokens per call.
+This builder sends the same information in a denser form:
+
+    per-day totals      one "date|meals|kcal|protein|carbs|fat" row per day
+    micronutrients      average %DV per logged day, reduced to the biggest
+                        gaps and strengths instead of every vitamin of every meal
+    meals               one "date|time|food|kcal|protein|carbs|fat" row each
+
+If the prompt is still over the token budget (CHUNDIET_RECOMMENDATION_PROMPT_TOKENS,
+default 1200), older days are summarized first. Their meal rows are replaced
+by a list of food names, and then the names are dropped too. Today's meals
+and the per-day totals are always kept.
+"""
+import re
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from gemini_scheduler import estimate_text_tokens
+from micronutrients import canonical_nutrient_name
+from nutrient_parser import parse_grams, parse_percent
+
+DEFAULT_TOKEN_BUDGET = 1200
+
+# Always checked for gaps, even when no meal mentioned them
+KEY_NUTRIENTS = (
+    'Vitamin A', 'Vitamin C', 'Vitamin D', 'Vitamin E', 'Vitamin K', 'Vitamin B9', 'Vitamin B12',
+    'Calcium', 'Iron', 'Magnesium', 'Potassium', 'Zinc',
+)
+MAX_GAPS = 6
+MAX_STRENGTHS = 4
+MAX_FOOD_NAME = 40
+
+_TIME_RE = re.compile(r'(\d{1,2}:\d{2})')
+
+
+def _number(value: Optional[float]) -> str:
+    return f'{value:.0f}' if value is not None else '?'
+
+
+def _food(name: Optional[str]) -> str:
+    name = ' '.join(str(name or '?').replace('|', '/').split())
+    return name if len(name) <= MAX_FOOD_NAME else name[:MAX_FOOD_NAME - 1] + '…'
+
+
+def _clock(consumption_time: Optional[str]) -> str:
+    match = _TIME_RE.search(str(consumption_time or ''))
+    return match.group(1) if match else '-'
+
+
+def _target(goals: Optional[Dict], field: str, unit: str = '') -> str:
+    value = (goals or {}).get(field)
+    return f'{value}{unit}' if value not in (None, '') else 'not set'
+
+
+def micronutrient_status(meals: List[Dict], days_with_data: int) -> Tuple[List[Tuple[str, float]], List[Tuple[str, float]]]:
+    """(gaps, strengths): lowest and highest average %DV per logged day"""
+    totals = defaultdict(float)
+    for meal in meals:
+        for vitamin in meal.get('vitamins') or []:
+            name = canonical_nutrient_name(vitamin.get('name'))
+            percent = parse_percent(vitamin.get('percent_daily_value'))
+            if name and percent is not None:
+                totals[name] += percent
+    for name in KEY_NUTRIENTS:
+        totals.setdefault(name, 0.0)
+    days = max(days_with_data, 1)
+    averages = sorted(((name, total / days) for name, total in totals.items()), key=lambda item: item[1])
+    gaps = [item for item in averages if item[1] < 100][:MAX_GAPS]
+    strengths = [item for item in reversed(averages) if item[1] >= 100][:MAX_STRENGTHS]
+    return gaps, strengths
+
+
+def build_recommendation_prompt(recent_nutrition_data: Dict, user_profile: Dict, user_goals: Optional[Dict] = None,
+                                token_budget: int = DEFAULT_TOKEN_BUDGET) -> Tuple[str, Dict]:
+    """The recommendation prompt and a report of its estimated size and what was summarized"""
+    data = recent_nutrition_data
+    profile = user_profile or {}
+    meals = list(data.get('today_meals') or []) + list(data.get('previous_meals') or [])
+
+    # Newest day first; today's meals come first in the summary
+    days = OrderedDict()
+    for meal in sorted(meals, key=lambda meal: str(meal.get('date') or ''), reverse=True):
+        days.setdefault(meal.get('date') or 'unknown', []).append(meal)
+    today = data['today_meals'][0].get('date') if data.get('today_meals') else None
+
+    daily_rows = []
+    for day, day_meals in days.items():
+        grams = [
+            [parse_grams(meal.get(field)) for meal in day_meals]
+            for field in ('protein', 'carbohydrates', 'fat')
+        ]
+        daily_rows.append('|'.join([
+            day,
+            str(len(day_meals)),
+            _number(sum(meal.get('calories') or 0 for meal in day_meals)),
+            *(_number(sum(value for value in column if value is not None)) for column in grams)
+        ]))
+
+    gaps, strengths = micronutrient_status(meals, data.get('days_with_data', 0))
+
+    head = f"""You are Chun, a certified nutritionist and wellness coach with expertise in personalized nutrition planning, metabolic health, and sustainable dietary habits.
+
+CLIENT: age {profile.get('age') or 'not specified'}, gender {profile.get('gender') or 'not specified'}, weight {profile.get('weight') or 'not specified'}kg, activity {profile.get('activity_level') or 'not specified'}
+GOAL: {_target(user_goals, 'goal_description')}
+DAILY TARGETS: {_target(user_goals, 'daily_calories')} kcal, protein {_target(user_goals, 'daily_protein', 'g')}, carbs {_target(user_goals, 'daily_carbs', 'g')}, fat {_target(user_goals, 'daily_fat', 'g')}
+
+DATA: {data.get('days_with_data', 0)} of the past {data.get('period_days', 7)} days have logged meals, {data.get('total_meals', 0)} meals, {data.get('food_variety', 0)} different foods, {data.get('total_calories', 0)} kcal in total.
+Average per logged day: {data.get('avg_daily_calories', 0):.0f} kcal, protein {data.get('avg_daily_protein', 0)}g, carbs {data.get('avg_daily_carbs', 0)}g, fat {data.get('avg_daily_fat', 0)}g.
+
+DAILY TOTALS (date|meals|kcal|protein g|carbs g|fat g):
+{chr(10).join(daily_rows) or 'none logged'}
+
+MICRONUTRIENTS (average %DV per logged day):
+gaps: {', '.join(f'{name} {value:.0f}' for name, value in gaps) or 'none'}
+strengths: {', '.join(f'{name} {value:.0f}' for name, value in strengths) or 'none'}
+"""
+
+    task = f"""
+TASK: Base every conclusion on the data above only; {data.get('days_with_data', 0)} of {data.get('period_days', 7)} days have data, so acknowledge gaps in the record instead of assuming what happened on missing days. Provide:
+1. Overall assessment of nutritional status, eating patterns and trajectory, noting data completeness.
+2. Nutritional analysis: calories (adequacy, distribution, timing), macronutrient balance and quality, micronutrient status, specific deficiencies and strengths.
+3. 4-6 food recommendations with meal type, benefits, nutrients provided and a preparation tip.
+4. 3-4 diet recommendations on meal timing, portions and food combinations that address their gaps, with practical implementation.
+5. 4-5 ingredient recommendations with nutrient focus, health benefits, usage suggestions and daily amount.
+6. A next-day meal plan: breakfast, lunch and dinner suggestions with focus nutrients, plus snacks.
+7. One achievable weekly goal.
+8. Personalized hydration advice.
+Keep everything specific to their data, culturally appropriate, practical, evidence-based, encouraging and focused on nutrient density and variety."""
+
+    # Oldest days lose their meal rows first, then their food names
+    detailed = [day for day in days]
+    named = []
+    omitted = []
+
+    def render() -> str:
+        lines = []
+        for day in detailed:
+            for meal in days[day]:
+                lines.append('|'.join([
+                    day, _clock(meal.get('consumption_time')), _food(meal.get('food_item')),
+                    _number(meal.get('calories')), str(meal.get('protein') or '?'),
+                    str(meal.get('carbohydrates') or '?'), str(meal.get('fat') or '?')
+                ]))
+        text = head + '\nMEALS (date|time|food|kcal|protein|carbs|fat):\n' + ('\n'.join(lines) or 'none logged') + '\n'
+        if named:
+            text += 'OLDER DAYS (foods only):\n' + '\n'.join(
+                f"{day}: {', '.join(_food(meal.get('food_item')) for meal in days[day])}" for day in named
+            ) + '\n'
+        if omitted:
+            text += f"{len(omitted)} older day(s) appear in DAILY TOTALS only.\n"
+        return text + task
+
+    prompt = render()
+    while estimate_text_tokens(prompt) > token_budget:
+        if len(detailed) > 1 or (detailed and detailed[0] != today):
+            named.append(detailed.pop())
+        elif named:
+            omitted.append(named.pop())
+        else:
+            break
+        # Oldest first within each list
+        named.sort(reverse=True)
+        prompt = render()
+
+    report = {
+        'estimated_tokens': estimate_text_tokens(prompt),
+        'token_budget': token_budget,
+        'meals': len(meals),
+        'meals_detailed': sum(len(days[day]) for day in detailed),
+        'days_detailed': len(detailed),
+        'days_summarized': len(named),
+        'days_totals_only': len(omitted),
+    }
+    report['over_budget'] = report['estimated_tokens'] > token_budget
+    return prompt, report
@@ -0,0 +1,191 @@
+"""
+Helpers for the daily_totals rollup table.
+
+daily_totals holds one row per (user_id, day) with the meal count, calories
+and macro sums for that day. It is updated in the same transaction as every
+meal insert/delete, so summary and history reads cost one row per day
+instead of a join over every meal logged.
+"""
+from typing import Dict
+
+TOTAL_COLUMNS = (
+    'meal_count', 'calories', 'protein_g', 'carbs_g', 'fiber_g',
+    'sugars_g', 'fat_g', 'saturated_fat_g'
+)
+
+# Aggregate raw meals into rollup rows; shared by backfill and verification
+DAILY_TOTALS_FROM_RAW_SQL = '''
+    SELECT
+        m.user_id,
+        DATE(m.date_logged) as day,
+        COUNT(*) as meal_count,
+        COALESCE(SUM(n.calories), 0) as calories,
+        COALESCE(SUM(n.protein_g), 0) as protein_g,
+        COALESCE(SUM(n.carbs_g), 0) as carbs_g,
+        COALESCE(SUM(n.fiber_g), 0) as fiber_g,
+        COALESCE(SUM(n.sugars_g), 0) as sugars_g,
+        COALESCE(SUM(n.fat_g), 0) as fat_g,
+        COALESCE(SUM(n.saturated_fat_g), 0) as saturated_fat_g
+    FROM meals m
+    JOIN nutrition_entries n ON m.id = n.meal_id
+    GROUP BY m.user_id, DATE(m.date_logged)
+'''
+
+# Same aggregate, counting archived meals too (schema version 5 and later)
+DAILY_TOTALS_WITH_ARCHIVE_SQL = '''
+    SELECT
+        user_id,
+        day,
+        SUM(meal_count) as meal_count,
+        SUM(calories) as calories,
+        SUM(protein_g) as protein_g,
+        SUM(carbs_g) as carbs_g,
+        SUM(fiber_g) as fiber_g,
+        SUM(sugars_g) as sugars_g,
+        SUM(fat_g) as fat_g,
+        SUM(saturated_fat_g) as saturated_fat_g
+    FROM (
+        ''' + DAILY_TOTALS_FROM_RAW_SQL + '''
+        UNION ALL
+        SELECT
+            user_id,
+            day,
+            COUNT(*),
+            COALESCE(SUM(calories), 0),
+            COALESCE(SUM(protein_g), 0),
+            COALESCE(SUM(carbs_g), 0),
+            COALESCE(SUM(fiber_g), 0),
+            COALESCE(SUM(sugars_g), 0),
+            COALESCE(SUM(fat_g), 0),
+            COALESCE(SUM(saturated_fat_g), 0)
+        FROM meals_archive
+        GROUP BY user_id, day
+    )
+    GROUP BY user_id, day
+'''
+
+
+def apply_meal_to_daily_totals(cursor, meal_id: int, sign: int = 1):
+    """
+    Add (sign=1) or subtract (sign=-1) a stored meal from its day's rollup row.
+    Must run inside the caller's transaction, while the meal rows still exist.
+    """
+    cursor.execute('''
+        INSERT INTO daily_totals (
+            user_id, day, meal_count, calories, protein_g, carbs_g,
+            fiber_g, sugars_g, fat_g, saturated_fat_g
+        )
+        SELECT
+            m.user_id,
+            DATE(m.date_logged),
+            ?,
+            ? * COALESCE(n.calories, 0),
+            ? * COALESCE(n.protein_g, 0),
+            ? * COALESCE(n.carbs_g, 0),
+            ? * COALESCE(n.fiber_g, 0),
+            ? * COALESCE(n.sugars_g, 0),
+            ? * COALESCE(n.fat_g, 0),
+            ? * COALESCE(n.saturated_fat_g, 0)
+        FROM meals m
+        JOIN nutrition_entries n ON m.id = n.meal_id
+        WHERE m.id = ?
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            meal_count = meal_count + excluded.meal_count,
+            calories = calories + excluded.calories,
+            protein_g = protein_g + excluded.protein_g,
+            carbs_g = carbs_g + excluded.carbs_g,
+            fiber_g = fiber_g + excluded.fiber_g,
+            sugars_g = sugars_g + excluded.sugars_g,
+            fat_g = fat_g + excluded.fat_g,
+            saturated_fat_g = saturated_fat_g + excluded.saturated_fat_g
+    ''', (sign,) * 8 + (meal_id,))
+
+    if sign < 0:
+        cursor.execute('''
+            DELETE FROM daily_totals
+            WHERE (user_id, day) = (SELECT user_id, DATE(date_logged) FROM meals WHERE id = ?)
+              AND meal_count <= 0
+        ''', (meal_id,))
+
+
+def apply_meal_range_to_daily_totals(cursor, first_meal_id: int, last_meal_id: int):
+    """Add a contiguous block of freshly inserted meals to the rollup in one statement"""
+    cursor.execute('''
+        INSERT INTO daily_totals (
+            user_id, day, meal_count, calories, protein_g, carbs_g,
+            fiber_g, sugars_g, fat_g, saturated_fat_g
+        )
+        SELECT
+            m.user_id,
+            DATE(m.date_logged),
+            COUNT(*),
+            COALESCE(SUM(n.calories), 0),
+            COALESCE(SUM(n.protein_g), 0),
+            COALESCE(SUM(n.carbs_g), 0),
+            COALESCE(SUM(n.fiber_g), 0),
+            COALESCE(SUM(n.sugars_g), 0),
+            COALESCE(SUM(n.fat_g), 0),
+            COALESCE(SUM(n.saturated_fat_g), 0)
+        FROM meals m
+        JOIN nutrition_entries n ON m.id = n.meal_id
+        WHERE m.id BETWEEN ? AND ?
+        GROUP BY m.user_id, DATE(m.date_logged)
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            meal_count = meal_count + excluded.meal_count,
+            calories = calories + excluded.calories,
+            protein_g = protein_g + excluded.protein_g,
+            carbs_g = carbs_g + excluded.carbs_g,
+            fiber_g = fiber_g + excluded.fiber_g,
+            sugars_g = sugars_g + excluded.sugars_g,
+            fat_g = fat_g + excluded.fat_g,
+            saturated_fat_g = saturated_fat_g + excluded.saturated_fat_g
+    ''', (first_meal_id, last_meal_id))
+
+
+def _as_key_values(rows) -> Dict:
+    return {(row[0], row[1]): tuple(row[2:]) for row in rows}
+
+
+def rebuild_daily_totals(cursor, verify_only: bool = False,
+                         source_sql: str = DAILY_TOTALS_WITH_ARCHIVE_SQL) -> Dict:
+    """
+    Recompute daily_totals from raw (and archived) meals and report drift.
+    Unless verify_only is set, the rollup is replaced with the recomputed rows.
+    Must run inside the caller's transaction.
+    """
+    # Separate execute()/fetchall(): psycopg2's execute() returns None, sqlite3's returns the cursor
+    cursor.execute(source_sql)
+    expected = _as_key_values(cursor.fetchall())
+    cursor.execute(f'''
+        SELECT user_id, day, {', '.join(TOTAL_COLUMNS)} FROM daily_totals
+    ''')
+    actual = _as_key_values(cursor.fetchall())
+
+    drift = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], str(k[1]))):
+        want = expected.get(key)
+        have = actual.get(key)
+        if want is not None and have is not None and all(
+            abs((w or 0) - (h or 0)) < 1e-6 for w, h in zip(want, have)
+        ):
+            continue
+        drift.append({
+            'user_id': key[0],
+            'day': key[1],
+            'expected': dict(zip(TOTAL_COLUMNS, want)) if want else None,
+            'actual': dict(zip(TOTAL_COLUMNS, have)) if have else None
+        })
+
+    if not verify_only and drift:
+        cursor.execute('DELETE FROM daily_totals')
+        cursor.execute(f'''
+            INSERT INTO daily_totals (user_id, day, {', '.join(TOTAL_COLUMNS)})
+            {source_sql}
+        ''')
+
+    return {
+        'days_checked': len(set(expected) | set(actual)),
+        'drifted_days': len(drift),
+        'rebuilt': bool(drift) and not verify_only,
+        'drift': drift
+    }
@@ -0,0 +1,231 @@
+"""
+Offline tool for moving users between shard files.
+
+Run it while the server is stopped. A move copies the user's rows into the
+target shard in one transaction, pins the user there if needed, and only
+then deletes the rows from the source. Meal and entry ids are shifted into
+free ranges in the target, and micronutrient rows are remapped to the
+target's nutrients by name. If a move is interrupted, running it again
+gives the same result, because any rows the user already has in the target
+are replaced.
+"""
+import glob
+import os
+import sqlite3
+from typing import Dict, List
+
+from models import init_db
+from sharding import ShardRouter, normalize_user_id
+
+# Tables keyed by user_id whose own ids are not referenced anywhere else
+USER_OWNED_TABLES = ('user_settings', 'user_goals', 'recommendations')
+
+
+def _columns(conn, schema: str, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _shared_columns(conn, table: str, exclude=()) -> List[str]:
+    source = set(_columns(conn, 'src', table))
+    return [c for c in _columns(conn, 'main', table) if c in source and c not in exclude]
+
+
+def _next_id(conn, schema: str, table: str) -> int:
+    max_id = conn.execute(f'SELECT MAX(id) FROM {schema}.{table}').fetchone()[0] or 0
+    row = conn.execute(f'SELECT seq FROM {schema}.sqlite_sequence WHERE name = ?', (table,)).fetchone()
+    return max(max_id, row[0] if row else 0) + 1
+
+
+def _next_meal_id(conn, schema: str) -> int:
+    # Archived meals keep their meals.id, so both tables share one id space
+    archived = conn.execute(f'SELECT MAX(id) FROM {schema}.meals_archive').fetchone()[0] or 0
+    return max(_next_id(conn, schema, 'meals'), archived + 1)
+
+
+def _delete_user_rows(conn, schema: str, user_id: int):
+    conn.execute(f'''
+        DELETE FROM {schema}.micronutrients WHERE entry_id IN (
+            SELECT n.id FROM {schema}.nutrition_entries n
+            JOIN {schema}.meals m ON m.id = n.meal_id
+            WHERE m.user_id = ?
+        )
+    ''', (user_id,))
+    conn.execute(f'''
+        DELETE FROM {schema}.nutrition_entries
+        WHERE meal_id IN (SELECT id FROM {schema}.meals WHERE user_id = ?)
+    ''', (user_id,))
+    conn.execute(f'DELETE FROM {schema}.meals WHERE user_id = ?', (user_id,))
+    conn.execute(f'DELETE FROM {schema}.meals_archive WHERE user_id = ?', (user_id,))
+    conn.execute(f'DELETE FROM {schema}.daily_totals WHERE user_id = ?', (user_id,))
+    for table in USER_OWNED_TABLES:
+        conn.execute(f'DELETE FROM {schema}.{table} WHERE user_id = ?', (user_id,))
+    conn.execute(f'DELETE FROM {schema}.users WHERE id = ?', (user_id,))
+
+
+def _copy_user_rows(conn, user_id: int) -> int:
+    """Copy one user's rows from src into main; returns the number of meals copied"""
+    _delete_user_rows(conn, 'main', user_id)
+
+    cols = _shared_columns(conn, 'users')
+    conn.execute(f'''
+        INSERT INTO main.users ({', '.join(cols)})
+        SELECT {', '.join(cols)} FROM src.users WHERE id = ?
+    ''', (user_id,))
+
+    for table in USER_OWNED_TABLES:
+        cols = _shared_columns(conn, table, exclude=('id',))
+        conn.execute(f'''
+            INSERT INTO main.{table} ({', '.join(cols)})
+            SELECT {', '.join(cols)} FROM src.{table} WHERE user_id = ? ORDER BY id
+        ''', (user_id,))
+
+    first_meal = conn.execute('''
+        SELECT MIN(id) FROM (
+            SELECT id FROM src.meals WHERE user_id = ?
+            UNION ALL SELECT id FROM src.meals_archive WHERE user_id = ?
+        )
+    ''', (user_id, user_id)).fetchone()[0]
+    if first_meal is None:
+        return 0
+
+    # Shift ids into the free range above everything the target has used
+    meal_offset = _next_meal_id(conn, 'main') - first_meal
+    first_entry = conn.execute('''
+        SELECT MIN(n.id) FROM src.nutrition_entries n
+        JOIN src.meals m ON m.id = n.meal_id
+        WHERE m.user_id = ?
+    ''', (user_id,)).fetchone()[0]
+    entry_offset = _next_id(conn, 'main', 'nutrition_entries') - (first_entry or 0)
+
+    cols = _shared_columns(conn, 'meals', exclude=('id',))
+    conn.execute(f'''
+        INSERT INTO main.meals (id, {', '.join(cols)})
+        SELECT id + ?, {', '.join(cols)} FROM src.meals WHERE user_id = ?
+    ''', (meal_offset, user_id))
+
+    cols = _shared_columns(conn, 'nutrition_entries', exclude=('id', 'meal_id'))
+    conn.execute(f'''
+        INSERT INTO main.nutrition_entries (id, meal_id, {', '.join(cols)})
+        SELECT n.id + ?, n.meal_id + ?, {', '.join('n.' + c for c in cols)}
+        FROM src.nutrition_entries n
+        JOIN src.meals m ON m.id = n.meal_id
+        WHERE m.user_id = ?
+    ''', (entry_offset, meal_offset, user_id))
+
+    conn.execute('''
+        INSERT OR IGNORE INTO main.nutrients (name, kind)
+        SELECT name, kind FROM src.nutrients
+    ''')
+    conn.execute('''
+        INSERT INTO main.micronutrients (entry_id, nutrient_id, pct_dv)
+        SELECT mi.entry_id + ?, tn.id, mi.pct_dv
+        FROM src.micronutrients mi
+        JOIN src.nutrients sn ON sn.id = mi.nutrient_id
+        JOIN main.nutrients tn ON tn.name = sn.name
+        JOIN src.nutrition_entries n ON n.id = mi.entry_id
+        JOIN src.meals m ON m.id = n.meal_id
+        WHERE m.user_id = ?
+    ''', (entry_offset, user_id))
+
+    cols = _shared_columns(conn, 'meals_archive', exclude=('id',))
+    conn.execute(f'''
+        INSERT INTO main.meals_archive (id, {', '.join(cols)})
+        SELECT id + ?, {', '.join(cols)} FROM src.meals_archive WHERE user_id = ?
+    ''', (meal_offset, user_id))
+    # Keep new meals from reusing the archived ids
+    last_meal = _next_meal_id(conn, 'main') - 1
+    if conn.execute("UPDATE main.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'meals'", (last_meal,)).rowcount == 0:
+        conn.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES ('meals', ?)", (last_meal,))
+
+    cols = _shared_columns(conn, 'daily_totals')
+    conn.execute(f'''
+        INSERT INTO main.daily_totals ({', '.join(cols)})
+        SELECT {', '.join(cols)} FROM src.daily_totals WHERE user_id = ?
+    ''', (user_id,))
+
+    return conn.execute('''
+        SELECT (SELECT COUNT(*) FROM src.meals WHERE user_id = ?)
+             + (SELECT COUNT(*) FROM src.meals_archive WHERE user_id = ?)
+    ''', (user_id, user_id)).fetchone()[0]
+
+
+def move_user(source_path: str, target_path: str, user_id, router: ShardRouter = None) -> Dict:
+    """Move every row belonging to user_id from source_path to target_path"""
+    user_id = int(normalize_user_id(user_id))
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    # Both sides need the current schema so column lists line up
+    init_db(source_path, seed_demo_user=False)
+    init_db(target_path, seed_demo_user=False)
+
+    conn = sqlite3.connect(target_path, isolation_level=None)
+    try:
+        conn.execute('ATTACH DATABASE ? AS src', (source_path,))
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            meals = _copy_user_rows(conn, user_id)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        # Point the router at the new copy before removing the old one
+        if router is not None:
+            router.pin(user_id, target_path)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            _delete_user_rows(conn, 'src', user_id)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+
+    print(f"[SHARD] Moved user {user_id} ({meals} meals): {source_path} -> {target_path}")
+    return {'user_id': user_id, 'from': source_path, 'to': target_path, 'meals': meals}
+
+
+def users_in_shard(path: str) -> List[int]:
+    """Every user id with any rows in a shard file"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('''
+            SELECT id FROM users
+            UNION SELECT user_id FROM meals
+            UNION SELECT user_id FROM meals_archive
+            UNION SELECT user_id FROM user_settings
+            UNION SELECT user_id FROM user_goals
+            UNION SELECT user_id FROM recommendations
+        ''').fetchall()
+    finally:
+        conn.close()
+    return sorted(row[0] for row in rows if row[0] is not None)
+
+
+def shard_files(router: ShardRouter, extra_sources: List[str] = None) -> List[str]:
+    """Every existing database file under the shard directory plus any extra sources"""
+    paths = set(glob.glob(os.path.join(router.shard_dir, '**', '*.db'), recursive=True))
+    paths.update(router.known_shards())
+    paths.update(extra_sources or [])
+    return sorted(path for path in paths if os.path.exists(path))
+
+
+def plan_rebalance(router: ShardRouter, extra_sources: List[str] = None) -> List[Dict]:
+    """List the moves needed so every user sits on the shard the router picks"""
+    moves = []
+    for path in shard_files(router, extra_sources):
+        for user_id in users_in_shard(path):
+            target = router.shard_for(user_id)
+            if os.path.abspath(target) != os.path.abspath(path):
+                moves.append({'user_id': user_id, 'from': path, 'to': target})
+    return moves
+
+
+def rebalance(router: ShardRouter, extra_sources: List[str] = None, dry_run: bool = False) -> List[Dict]:
+    """Move every misplaced user (e.g. after changing the shard count)"""
+    moves = plan_rebalance(router, extra_sources)
+    if dry_run:
+        return moves
+    return [move_user(move['from'], move['to'], move['user_id']) for move in moves]
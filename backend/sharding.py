@@ -0,0 +1,292 @@
+"""
+Per-user sharding across several SQLite files.
+
+A ShardRouter maps each user_id to a database file. ShardedDatabaseManager
+exposes the same methods as DatabaseManager and forwards each call to the
+manager for that user's shard. A shard gets its own connection pool and
+writer, and it is created and migrated the first time a user writes to it.
+Reads for a user whose shard does not exist yet are answered from a shared,
+empty database (empty.db in the shard directory), so arbitrary user ids in
+query strings cannot create files. Admin operations such as pool stats and
+rollup checks run on every shard in parallel.
+
+Sharding is turned on with the CHUNDIET_SHARDS environment variable:
+    CHUNDIET_SHARDS=8          hash users across 8 files
+    CHUNDIET_SHARDS=per-user   one file per user
+CHUNDIET_SHARD_DIR sets the directory the files live in (default: shards).
+A relative directory is resolved on first use, like the SQLite path, so it
+lands in the data directory run.py changes into after importing the app.
+"""
+import glob
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from models import init_db
+from database import DatabaseManager
+from storage import StorageBackend
+
+SHARD_MAP_FILE = 'shard_map.json'
+EMPTY_SHARD_FILE = 'empty.db'
+
+
+def normalize_user_id(user_id) -> str:
+    """user_id arrives as int from JSON bodies and as str from query strings"""
+    text = str(user_id).strip()
+    return str(int(text)) if text.lstrip('-').isdigit() else text
+
+
+class ShardRouter:
+    """
+    Maps user ids to shard database paths. Subclasses implement
+    natural_shard() and known_shards(); pinned users listed in
+    shard_map.json take precedence so rebalancing can move single users.
+    """
+
+    def __init__(self, shard_dir: str):
+        self.shard_dir = shard_dir
+        self.map_path = os.path.join(shard_dir, SHARD_MAP_FILE)
+        self._lock = threading.RLock()
+        self._pinned = None
+
+    @property
+    def pinned(self) -> Dict[str, str]:
+        # Loaded on first use: the router is built at import time, before run.py
+        # changes into the data directory that a relative shard_dir refers to
+        if self._pinned is None:
+            with self._lock:
+                if self._pinned is None:
+                    self._pinned = self._load_map()
+        return self._pinned
+
+    def _load_map(self) -> Dict[str, str]:
+        if not os.path.exists(self.map_path):
+            return {}
+        with open(self.map_path) as f:
+            return json.load(f)
+
+    def natural_shard(self, user_id: str) -> str:
+        raise NotImplementedError
+
+    def known_shards(self) -> List[str]:
+        """Every shard file that may hold data"""
+        raise NotImplementedError
+
+    def shard_for(self, user_id) -> str:
+        user_id = normalize_user_id(user_id)
+        pinned = self.pinned.get(user_id)
+        if pinned:
+            return os.path.join(self.shard_dir, pinned)
+        return self.natural_shard(user_id)
+
+    def pin(self, user_id, shard_path: str):
+        """Record that a user now lives on shard_path (used by rebalancing)"""
+        user_id = normalize_user_id(user_id)
+        with self._lock:
+            if shard_path == self.natural_shard(user_id):
+                self.pinned.pop(user_id, None)
+            else:
+                self.pinned[user_id] = os.path.relpath(shard_path, self.shard_dir)
+            tmp_path = self.map_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.pinned, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.map_path)
+
+
+class HashShardRouter(ShardRouter):
+    """Spread users over a fixed number of shard files by user id"""
+
+    def __init__(self, shard_dir: str, shard_count: int):
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        self.shard_count = shard_count
+        super().__init__(shard_dir)
+
+    def shard_path(self, index: int) -> str:
+        return os.path.join(self.shard_dir, f'shard-{index:03d}.db')
+
+    def natural_shard(self, user_id: str) -> str:
+        # Numeric ids spread round-robin; anything else by a stable hash
+        key = int(user_id) if user_id.lstrip('-').isdigit() else zlib.crc32(user_id.encode('utf-8'))
+        return self.shard_path(key % self.shard_count)
+
+    def known_shards(self) -> List[str]:
+        shards = {self.shard_path(i) for i in range(self.shard_count)}
+        shards.update(os.path.join(self.shard_dir, path) for path in self.pinned.values())
+        return sorted(shards)
+
+
+class PerUserShardRouter(ShardRouter):
+    """One database file per user"""
+
+    def natural_shard(self, user_id: str) -> str:
+        safe_id = ''.join(c if c.isalnum() or c in '-_' else '_' for c in user_id)
+        return os.path.join(self.shard_dir, 'users', f'user-{safe_id}.db')
+
+    def known_shards(self) -> List[str]:
+        shards = set(glob.glob(os.path.join(self.shard_dir, 'users', 'user-*.db')))
+        shards.update(os.path.join(self.shard_dir, path) for path in self.pinned.values())
+        return sorted(shards)
+
+
+def _routed(name: str, user_arg: int = 0, create: bool = True):
+    """
+    Build a method that forwards to the user's shard; user_arg is the positional
+    index of user_id. Methods with create=False never create a missing shard.
+    """
+    def method(self, *args, **kwargs):
+        user_id = kwargs['user_id'] if 'user_id' in kwargs else args[user_arg]
+        return getattr(self.for_user(user_id, create=create), name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(DatabaseManager, name).__doc__
+    return method
+
+
+class ShardedDatabaseManager(StorageBackend):
+    """DatabaseManager-compatible facade that routes every call by user_id"""
+
+    def __init__(self, router: ShardRouter, fan_out_workers: int = 8, **manager_options):
+        self.router = router
+        self.fan_out_workers = fan_out_workers
+        self.manager_options = manager_options
+        self._managers = {}
+        # Guards the dicts only; opening a shard holds that shard's own lock
+        self._lock = threading.Lock()
+        self._shard_locks = {}
+
+    def for_shard(self, shard_path: str) -> DatabaseManager:
+        """Open (and on first use create and migrate) one shard"""
+        manager = self._managers.get(shard_path)
+        if manager is not None:
+            return manager
+
+        with self._lock:
+            shard_lock = self._shard_locks.setdefault(shard_path, threading.Lock())
+        # A slow migration of one shard must not block requests to the others
+        with shard_lock:
+            manager = self._managers.get(shard_path)
+            if manager is None:
+                os.makedirs(os.path.dirname(shard_path) or '.', exist_ok=True)
+                init_db(shard_path, seed_demo_user=shard_path == self.router.shard_for(1))
+                manager = DatabaseManager(shard_path, **self.manager_options)
+                with self._lock:
+                    self._managers[shard_path] = manager
+                print(f"[SHARD] Opened shard {shard_path}")
+        return manager
+
+    def for_user(self, user_id, create: bool = True) -> DatabaseManager:
+        """
+        The manager of the user's shard. With create=False a shard that does
+        not exist yet is not created; the shared empty shard answers instead.
+        """
+        shard_path = self.router.shard_for(user_id)
+        if (create or shard_path in self._managers or os.path.exists(shard_path)
+                or shard_path == self.router.shard_for(1)):
+            return self.for_shard(shard_path)
+        return self.for_shard(os.path.join(self.router.shard_dir, EMPTY_SHARD_FILE))
+
+    def fan_out(self, func: Callable[[DatabaseManager], object], shards: List[str] = None) -> Dict[str, object]:
+        """Run func(manager) on every shard in parallel; returns {shard_path: result}"""
+        shards = self.router.known_shards() if shards is None else shards
+        shards = [path for path in shards if os.path.exists(path) or path in self._managers]
+        if not shards:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.fan_out_workers, len(shards))) as executor:
+            results = executor.map(lambda path: func(self.for_shard(path)), shards)
+            return dict(zip(shards, results))
+
+    def pool_stats(self) -> Dict:
+        """Connection pool counters per open shard"""
+        with self._lock:
+            managers = dict(self._managers)
+        return {path: manager.pool_stats() for path, manager in managers.items()}
+
+    def writer_stats(self) -> Dict:
+        """Write queue counters per open shard"""
+        with self._lock:
+            managers = dict(self._managers)
+        return {path: manager.writer_stats() for path, manager in managers.items()}
+
+    def shard_stats(self) -> Dict:
+        """User and meal counts plus file size for every shard"""
+        def count(manager):
+            conn = manager.get_connection()
+            try:
+                users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+                meals = conn.execute('SELECT COUNT(*) FROM meals').fetchone()[0]
+            finally:
+                conn.close()
+            return {'users': users, 'meals': meals, 'size_bytes': os.path.getsize(manager.db_path)}
+        return self.fan_out(count)
+
+    def query_stats(self, limit: int = 20) -> Dict:
+        """Statement timings; every shard records into the same QueryStats"""
+        stats = self.manager_options.get('query_stats')
+        return stats.snapshot(limit) if stats else {}
+
+    def rebuild_daily_totals(self, verify_only: bool = False) -> Dict:
+        """Recompute the daily_totals rollup on every shard and merge the reports"""
+        reports = self.fan_out(lambda manager: manager.rebuild_daily_totals(verify_only=verify_only))
+        merged = {'days_checked': 0, 'drifted_days': 0, 'rebuilt': False, 'drift': []}
+        for path, report in reports.items():
+            merged['days_checked'] += report['days_checked']
+            merged['drifted_days'] += report['drifted_days']
+            merged['rebuilt'] = merged['rebuilt'] or report['rebuilt']
+            merged['drift'].extend(dict(item, shard=path) for item in report['drift'])
+        return merged
+
+    def run_maintenance(self, archive_after_days: int = None, analyze: bool = False,
+                        vacuum_threshold: float = 0.25) -> Dict:
+        """Archive and optimize every shard; returns {shard_path: report}"""
+        return self.fan_out(lambda manager: manager.run_maintenance(
+            archive_after_days=archive_after_days, analyze=analyze, vacuum_threshold=vacuum_threshold
+        ))
+
+    def close(self):
+        with self._lock:
+            managers, self._managers = list(self._managers.values()), {}
+        for manager in managers:
+            manager.close()
+
+    encode_meal_cursor = staticmethod(DatabaseManager.encode_meal_cursor)
+    decode_meal_cursor = staticmethod(DatabaseManager.decode_meal_cursor)
+
+    store_meal = _routed('store_meal')
+    store_meal_async = _routed('store_meal_async')
+    store_meals = _routed('store_meals')
+    bulk_store_meals = _routed('bulk_store_meals')
+    update_user_profile = _routed('update_user_profile')
+    update_user_settings = _routed('update_user_settings')
+    store_recommendations = _routed('store_recommendations')
+    update_user_goals = _routed('update_user_goals')
+
+    # Reads (and deletes, which have nothing to delete on a missing shard)
+    iter_meal_export = _routed('iter_meal_export', create=False)
+    get_daily_summary = _routed('get_daily_summary', create=False)
+    list_meals = _routed('list_meals', create=False)
+    get_nutrition_history = _routed('get_nutrition_history', create=False)
+    get_micronutrient_totals = _routed('get_micronutrient_totals', create=False)
+    delete_meal = _routed('delete_meal', user_arg=1, create=False)
+    purge_user = _routed('purge_user', create=False)
+    get_recent_nutrition_summary = _routed('get_recent_nutrition_summary', create=False)
+    get_user_profile = _routed('get_user_profile', create=False)
+    get_user_settings = _routed('get_user_settings', create=False)
+    get_stored_recommendations = _routed('get_stored_recommendations', create=False)
+    list_recommendation_versions = _routed('list_recommendation_versions', create=False)
+    get_recommendation_version = _routed('get_recommendation_version', create=False)
+    get_user_goals = _routed('get_user_goals', create=False)
+
+
+def router_from_env(shard_dir: str = None):
+    """Build the router described by CHUNDIET_SHARDS, or None when sharding is off"""
+    mode = os.environ.get('CHUNDIET_SHARDS', '').strip().lower()
+    if not mode:
+        return None
+    shard_dir = shard_dir or os.environ.get('CHUNDIET_SHARD_DIR', 'shards')
+    if mode in ('per-user', 'per_user', 'user'):
+        return PerUserShardRouter(shard_dir)
+    return HashShardRouter(shard_dir, int(mode))
+
@@ -0,0 +1,84 @@
+"""
+Coalescing of identical concurrent calls ("single flight").
+
+A double-clicked Analyze button, or two people logging "pizza" at the same
+moment, would otherwise pay for the same Gemini call twice. The first caller
+for a key becomes the leader and does the work. Anyone asking for the same
+key while it runs waits on the leader's Future and gets a deep copy of its
+result, or the same exception. Nothing is remembered after the call ends;
+caching finished results is the analysis cache's job.
+
+If the leader is abandoned (a streaming client disconnects), its followers
+start over, and one of them becomes the new leader.
+"""
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class FlightAbandoned(Exception):
+    """The leader stopped before finishing; followers should try again"""
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'leaders': 0, 'coalesced': 0, 'errors': 0}
+
+    def begin(self, key: Hashable) -> Tuple[Future, bool]:
+        """(future, is_leader); the leader must call finish() exactly once"""
+        with self._lock:
+            self._stats['calls'] += 1
+            future = self._flights.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                return future, False
+            future = self._flights[key] = Future()
+            self._stats['leaders'] += 1
+            return future, True
+
+    def finish(self, key: Hashable, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+            if error is not None:
+                self._stats['errors'] += 1
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # GeneratorExit / KeyboardInterrupt in the leader are not the followers' errors
+            future.set_exception(FlightAbandoned(repr(error)))
+
+    @staticmethod
+    def wait(future: Future):
+        """The leader's result as a private copy; raises its error or FlightAbandoned"""
+        return copy.deepcopy(future.result())
+
+    def do(self, key: Hashable, func: Callable):
+        """func() once per key at a time; concurrent callers share its outcome"""
+        while True:
+            future, leader = self.begin(key)
+            if leader:
+                break
+            try:
+                return self.wait(future)
+            except FlightAbandoned:
+                continue
+        try:
+            result = func()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result=result)
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        stats['coalesced_rate'] = stats['coalesced'] / stats['calls'] if stats['calls'] else 0.0
+        return stats
@@ -0,0 +1,186 @@
+"""
+Storage interface shared by every database backend.
+
+The Flask routes only talk to a StorageBackend. The implementations are:
+    DatabaseManager          SQLite (default), one chundiet.db file
+    ShardedDatabaseManager   SQLite spread over several files (CHUNDIET_SHARDS)
+    PostgresDatabaseManager  PostgreSQL (CHUNDIET_DATABASE_URL=postgresql://...)
+
+All of them return plain dicts/lists with the same keys, so a backend can
+be swapped by configuration alone. storage_conformance.py checks that a
+backend behaves like the others.
+"""
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from recommendation_history import diff_documents
+
+
+class StorageBackend(ABC):
+    """Methods the application needs from a database backend"""
+
+    # Writes
+
+    @abstractmethod
+    def store_meal(self, user_id: int, nutrition_data: Dict) -> int:
+        """Store meal and nutrition data, return meal_id"""
+
+    def store_meal_async(self, user_id: int, nutrition_data: Dict) -> Future:
+        """Store a meal; the Future resolves to the new meal_id"""
+        future = Future()
+        try:
+            future.set_result(self.store_meal(user_id, nutrition_data))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    @abstractmethod
+    def store_meals(self, user_id: int, meals: List[Dict]) -> List[int]:
+        """Store several meals in one transaction, return their meal_ids in order"""
+
+    @abstractmethod
+    def bulk_store_meals(self, user_id: int, records: Iterable[Dict], chunk_size: int = 500) -> int:
+        """Store validated records in one transaction, return the number stored"""
+
+    @abstractmethod
+    def delete_meal(self, meal_id: int, user_id: int) -> bool:
+        """Delete a meal and its nutrition data"""
+
+    @abstractmethod
+    def purge_user(self, user_id: int) -> Dict:
+        """Delete everything stored for a user, return the number of rows removed per table"""
+
+    @abstractmethod
+    def update_user_profile(self, user_id: int, profile_data: Dict) -> bool:
+        """Update user profile"""
+
+    @abstractmethod
+    def update_user_settings(self, user_id: int, settings_data: Dict) -> bool:
+        """Update user settings"""
+
+    @abstractmethod
+    def store_recommendations(self, user_id: int, recommendations_data: Dict, input_fingerprint: str = None) -> bool:
+        """Store AI-generated recommendations, tagged with the fingerprint of their inputs"""
+
+    @abstractmethod
+    def update_user_goals(self, user_id: int, goals_data: Dict) -> bool:
+        """Update user nutrition goals"""
+
+    # Reads
+
+    @abstractmethod
+    def iter_meal_export(self, user_id: int, start_date: str = None, end_date: str = None,
+                         chunk_size: int = 500) -> Iterator[Dict]:
+        """Yield every meal of a user as an import-compatible record"""
+
+    @abstractmethod
+    def get_daily_summary(self, user_id: int, date_str: str) -> Dict:
+        """Get aggregated nutrition data for a specific date"""
+
+    @abstractmethod
+    def list_meals(self, user_id: int, limit: int = 20, cursor_token: str = None) -> Dict:
+        """List meals newest first with keyset pagination"""
+
+    @abstractmethod
+    def get_nutrition_history(self, user_id: int, days: int = 30, include_foods: bool = False) -> List[Dict]:
+        """Get per-day totals for the past N days"""
+
+    @abstractmethod
+    def get_micronutrient_totals(self, user_id: int, end_date: str, days: int = 1) -> Dict:
+        """Get per-day and period %DV totals for every vitamin/mineral"""
+
+    @abstractmethod
+    def get_recent_nutrition_summary(self, user_id: int, days: int = 7) -> Dict:
+        """Get detailed nutrition summary for AI recommendations"""
+
+    @abstractmethod
+    def get_user_profile(self, user_id: int) -> Dict:
+        """Get user profile data"""
+
+    @abstractmethod
+    def get_user_settings(self, user_id: int) -> Dict:
+        """Get user settings"""
+
+    @abstractmethod
+    def get_stored_recommendations(self, user_id: int) -> Optional[Dict]:
+        """Get the latest stored recommendations for user"""
+
+    @abstractmethod
+    def list_recommendation_versions(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """List stored recommendation versions newest first, without their bodies"""
+
+    @abstractmethod
+    def get_recommendation_version(self, user_id: int, version: int, include_body: bool = True) -> Optional[Dict]:
+        """Get one stored version; the body is only decompressed when include_body is set"""
+
+    def diff_recommendation_versions(self, user_id: int, from_version: int, to_version: int) -> Optional[Dict]:
+        """Compare two versions; identical content hashes skip decompression"""
+        old = self.get_recommendation_version(user_id, from_version, include_body=False)
+        new = self.get_recommendation_version(user_id, to_version, include_body=False)
+        if not old or not new:
+            return None
+
+        changes = []
+        # Rows stored before versioning have no hash and are always compared
+        if old['content_hash'] is None or old['content_hash'] != new['content_hash']:
+            old = self.get_recommendation_version(user_id, from_version)
+            new = self.get_recommendation_version(user_id, to_version)
+            changes = diff_documents(old.pop('recommendations'), new.pop('recommendations'))
+        return {'from': old, 'to': new, 'identical': not changes, 'changes': changes}
+
+    @abstractmethod
+    def get_user_goals(self, user_id: int) -> Dict:
+        """Get user nutrition goals"""
+
+    # Administration
+
+    @abstractmethod
+    def rebuild_daily_totals(self, verify_only: bool = False) -> Dict:
+        """Recompute the daily_totals rollup from raw meals and report drift"""
+
+    def run_maintenance(self, archive_after_days: int = None, analyze: bool = False,
+                        vacuum_threshold: float = 0.25) -> Dict:
+        """Archive cold meals and compact storage; a no-op where the server handles it"""
+        return {}
+
+    def pool_stats(self) -> Dict:
+        """Connection pool usage counters"""
+        return {}
+
+    def writer_stats(self) -> Dict:
+        """Write queue counters (only backends with a write queue have any)"""
+        return {}
+
+    def query_stats(self, limit: int = 20) -> Dict:
+        """Per-statement timings and slow queries (only backends that record them)"""
+        return {}
+
+    def close(self):
+        """Release every connection held by the backend"""
+
+
+def create_database_manager(db_path: str = 'chundiet.db') -> StorageBackend:
+    """
+    Pick the backend from the environment:
+    CHUNDIET_DATABASE_URL=postgresql://... selects PostgreSQL,
+    CHUNDIET_SHARDS selects sharded SQLite, otherwise a single SQLite file.
+    """
+    database_url = os.environ.get('CHUNDIET_DATABASE_URL', '').strip()
+    if database_url.startswith(('postgres://', 'postgresql://')):
+        from postgres_backend import PostgresDatabaseManager
+        return PostgresDatabaseManager(
+            database_url,
+            pool_size=int(os.environ.get('CHUNDIET_DB_POOL_SIZE', 8))
+        )
+
+    from query_stats import query_stats_from_env
+    from sharding import ShardedDatabaseManager, router_from_env
+    query_stats = query_stats_from_env()
+    router = router_from_env()
+    if router is not None:
+        return ShardedDatabaseManager(router, query_stats=query_stats)
+
+    from database import DatabaseManager
+    return DatabaseManager(db_path, query_stats=query_stats)
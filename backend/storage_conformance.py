@@ -0,0 +1,245 @@
+"""
+Behavioural conformance checks for StorageBackend implementations.
+
+Every backend must give the same answers to the same sequence of calls.
+run_conformance() exercises the whole interface as a throwaway user and
+returns a report, so the same checks can be run against a scratch SQLite
+file and against a local PostgreSQL instance:
+
+    python backend/maintenance.py --db /tmp/scratch.db conformance
+    python backend/maintenance.py --database-url postgresql://localhost/chundiet_test conformance
+
+backend/tests/test_storage_conformance.py runs the same checks under pytest
+for SQLite, sharded SQLite and (when CHUNDIET_DATABASE_URL is set) PostgreSQL.
+Point it at a scratch database. The test user is removed afterwards with
+purge_user(), which deletes their rows from every table.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict
+
+from storage import StorageBackend
+
+
+def _meal(food_item: str, calories: int, protein: str, vitamin_c: str, date_logged: str = None) -> Dict:
+    record = {
+        'food_item': food_item,
+        'consumption_time': None,
+        'nutritional_values': {
+            'serving_size': '1 serving',
+            'calories': calories,
+            'protein': protein,
+            'carbohydrates': {'total': '10g', 'fiber': '2g', 'sugars': '500 mg'},
+            'fat': {'total': '3g', 'saturated': '1g'},
+            'vitamins': [
+                {'name': 'Vit C', 'percent_daily_value': vitamin_c},
+                {'name': 'Iron', 'percent_daily_value': '5%'}
+            ]
+        }
+    }
+    if date_logged:
+        record['date_logged'] = date_logged
+    return record
+
+
+class _Report:
+    def __init__(self):
+        self.passed = []
+        self.failed = []
+
+    def check(self, name: str, condition: bool, detail=None):
+        if condition:
+            self.passed.append(name)
+        else:
+            self.failed.append({'check': name, 'detail': detail})
+
+    def as_dict(self) -> Dict:
+        return {'passed': len(self.passed), 'failed': self.failed, 'ok': not self.failed}
+
+
+def run_conformance(manager: StorageBackend, user_id: int = None) -> Dict:
+    """Run every check against manager and return {'passed', 'failed', 'ok'}"""
+    report = _Report()
+    user_id = user_id or random.randint(900000000, 999999999)
+    # Both backends date meals in UTC
+    today = datetime.utcnow().date()
+    yesterday = (today - timedelta(days=1)).isoformat()
+    two_days_ago = (today - timedelta(days=2)).isoformat()
+    today = today.isoformat()
+
+    meal_ids = []
+    try:
+        # Writes
+        meal_id = manager.store_meal(user_id, _meal('Apple', 95, '0.5g', '14%'))
+        report.check('store_meal returns an int id', isinstance(meal_id, int), meal_id)
+        meal_ids.append(meal_id)
+
+        meal_id = manager.store_meal_async(user_id, _meal('Yogurt', 150, '12 g', '2%')).result()
+        report.check('store_meal_async resolves to an int id', isinstance(meal_id, int), meal_id)
+        meal_ids.append(meal_id)
+
+        batch_ids = manager.store_meals(user_id, [
+            _meal('Toast', 80, '3g', '1%'),
+            _meal('Tea', 2, '0g', ''),
+        ])
+        report.check('store_meals returns one id per meal in order',
+                     len(batch_ids) == 2 and all(isinstance(i, int) for i in batch_ids) and batch_ids[0] < batch_ids[1],
+                     batch_ids)
+        # Removed again so the totals checked below are unchanged
+        report.check('store_meals meals can be deleted',
+                     all(manager.delete_meal(meal_id, user_id) for meal_id in batch_ids), batch_ids)
+
+        stored = manager.bulk_store_meals(user_id, iter([
+            _meal('Oats', 300, '10g', '0%', yesterday),
+            _meal('Salmon', 400, '40g', '<1%', yesterday),
+            _meal('Rice', 200, '4g', '', two_days_ago),
+        ]), chunk_size=2)
+        report.check('bulk_store_meals stores every record', stored == 3, stored)
+
+        # Daily summary comes from the rollup
+        summary = manager.get_daily_summary(user_id, today)
+        report.check('daily summary counts meals', summary['meal_count'] == 2, summary['meal_count'])
+        report.check('daily summary sums calories', summary['total_calories'] == 245, summary['total_calories'])
+        report.check('daily summary sums parsed grams', summary['total_protein'] == 12.5, summary['total_protein'])
+        report.check('daily summary parses mg', summary['total_sugars'] == 1.0, summary['total_sugars'])
+        report.check('daily summary lists foods', sorted(summary['foods']) == ['Apple', 'Yogurt'], summary['foods'])
+        report.check('daily summary meals carry vitamins',
+                     all(isinstance(meal['vitamins'], list) for meal in summary['meals']), summary['meals'])
+        empty = manager.get_daily_summary(user_id, '2001-01-01')
+        report.check('empty day summary', empty['meal_count'] == 0 and empty['meals'] == [], empty)
+
+        # Keyset pagination visits every meal exactly once, newest day first
+        seen = []
+        cursor_token = None
+        for _ in range(10):
+            page = manager.list_meals(user_id, limit=2, cursor_token=cursor_token)
+            seen.extend(page['meals'])
+            cursor_token = page['next_cursor']
+            if not page['has_more']:
+                break
+        ids = [meal['id'] for meal in seen]
+        report.check('list_meals pages through every meal once', len(ids) == 5 and len(set(ids)) == 5, ids)
+        dates = [meal['date'] for meal in seen]
+        report.check('list_meals is newest first', dates == sorted(dates, reverse=True), dates)
+        report.check('list_meals dates are ISO strings', all(isinstance(d, str) for d in dates), dates)
+        try:
+            manager.list_meals(user_id, cursor_token='not-a-cursor')
+            report.check('list_meals rejects bad cursors', False)
+        except ValueError:
+            report.check('list_meals rejects bad cursors', True)
+
+        history = manager.get_nutrition_history(user_id, days=7, include_foods=True)
+        by_date = {day['date']: day for day in history}
+        report.check('history has one row per day', sorted(by_date) == sorted({today, yesterday, two_days_ago}),
+                     sorted(by_date))
+        report.check('history sums calories', by_date.get(yesterday, {}).get('total_calories') == 700,
+                     by_date.get(yesterday))
+        report.check('history lists foods', sorted(by_date.get(yesterday, {}).get('foods', [])) == ['Oats', 'Salmon'],
+                     by_date.get(yesterday))
+
+        micros = manager.get_micronutrient_totals(user_id, today, days=3)
+        totals = {total['name']: total for total in micros['totals']}
+        report.check('micronutrient period bounds', (micros['start_date'], micros['end_date']) == (two_days_ago, today),
+                     (micros['start_date'], micros['end_date']))
+        report.check('micronutrient aliases are merged', 'Vitamin C' in totals and 'Vit C' not in totals, sorted(totals))
+        report.check('micronutrient %DV is summed', totals.get('Vitamin C', {}).get('pct_dv') == 16.5,
+                     totals.get('Vitamin C'))
+        report.check('micronutrient daily average', totals.get('Iron', {}).get('avg_daily_pct_dv') == round(25 / 3, 1),
+                     totals.get('Iron'))
+
+        exported = list(manager.iter_meal_export(user_id, chunk_size=2))
+        report.check('export yields every meal', sorted(r['id'] for r in exported) == sorted(ids),
+                     [r['id'] for r in exported])
+        report.check('export is oldest first', [r['date_logged'] for r in exported] == sorted(dates),
+                     [r['date_logged'] for r in exported])
+        ranged = list(manager.iter_meal_export(user_id, start_date=yesterday, end_date=yesterday))
+        report.check('export honours the date range', len(ranged) == 2, len(ranged))
+
+        recent = manager.get_recent_nutrition_summary(user_id, days=7)
+        report.check('recent summary counts meals', recent['total_meals'] == 5, recent['total_meals'])
+        report.check('recent summary splits today', len(recent['today_meals']) == 2, len(recent['today_meals']))
+        report.check('recent summary lists unique foods', recent['food_variety'] == 5, recent['unique_foods'])
+
+        # Deletes keep the rollup in step
+        report.check('delete_meal refuses another user', manager.delete_meal(meal_ids[0], user_id + 1) is False)
+        report.check('delete_meal removes the meal', manager.delete_meal(meal_ids[0], user_id) is True)
+        summary = manager.get_daily_summary(user_id, today)
+        report.check('delete_meal updates the rollup',
+                     (summary['meal_count'], summary['total_calories']) == (1, 150), summary)
+        report.check('delete_meal of a missing meal', manager.delete_meal(meal_ids[0], user_id) is False)
+
+        # Per-user documents
+        report.check('update_user_profile', manager.update_user_profile(user_id, {'name': 'Conformance', 'age': 40}))
+        profile = manager.get_user_profile(user_id)
+        report.check('get_user_profile round-trips', (profile.get('name'), profile.get('age')) == ('Conformance', 40),
+                     profile)
+        manager.update_user_profile(user_id, {'name': '', 'weight': 80.5})
+        profile = manager.get_user_profile(user_id)
+        report.check('empty profile fields are ignored', (profile.get('name'), profile.get('weight')) == ('Conformance', 80.5),
+                     profile)
+
+        manager.update_user_settings(user_id, {'gemini_api_keys': ['k1'], 'theme': 'light'})
+        manager.update_user_settings(user_id, {'units': 'imperial'})
+        settings = manager.get_user_settings(user_id)
+        report.check('settings updates merge',
+                     (settings.get('gemini_api_keys'), settings.get('theme'), settings.get('units')) == (['k1'], 'light', 'imperial'),
+                     settings)
+
+        manager.update_user_goals(user_id, {'daily_calories': 2000, 'goal_description': 'maintain'})
+        manager.update_user_goals(user_id, {'daily_calories': 2200})
+        goals = manager.get_user_goals(user_id)
+        report.check('goals are replaced on update', (goals.get('daily_calories'), goals.get('goal_description')) == (2200, None),
+                     goals)
+
+        manager.store_recommendations(user_id, {'food_recommendations': [{'food': 'Kale'}], 'overall_assessment': 'ok',
+                                                'weekly_goal': 'more greens'}, input_fingerprint='{"data": "abc"}')
+        stored = manager.get_stored_recommendations(user_id) or {}
+        report.check('recommendations round-trip',
+                     (stored.get('food_recommendations'), stored.get('weekly_goal')) == ([{'food': 'Kale'}], 'more greens'),
+                     stored)
+        report.check('recommendations carry created_at', isinstance(stored.get('created_at'), str), stored.get('created_at'))
+        report.check('recommendations keep their input fingerprint',
+                     stored.get('input_fingerprint') == '{"data": "abc"}', stored.get('input_fingerprint'))
+
+        manager.store_recommendations(user_id, {'food_recommendations': [{'food': 'Kale'}, {'food': 'Beans'}],
+                                                'overall_assessment': 'better', 'weekly_goal': 'more greens'})
+        versions = manager.list_recommendation_versions(user_id)
+        report.check('recommendation versions are kept newest first', [v['version'] for v in versions] == [2, 1],
+                     versions)
+        report.check('latest recommendations are the newest version',
+                     (manager.get_stored_recommendations(user_id) or {}).get('overall_assessment') == 'better')
+        old = manager.get_recommendation_version(user_id, 1) or {}
+        report.check('old recommendation versions stay readable',
+                     old.get('recommendations', {}).get('overall_assessment') == 'ok', old)
+        diff = manager.diff_recommendation_versions(user_id, 1, 2) or {}
+        report.check('recommendation diff lists changes',
+                     sorted(change['path'] for change in diff.get('changes', [])) == ['food_recommendations', 'overall_assessment'],
+                     diff.get('changes'))
+        report.check('recommendation diff of a version with itself',
+                     (manager.diff_recommendation_versions(user_id, 2, 2) or {}).get('identical') is True)
+
+        drift = manager.rebuild_daily_totals(verify_only=True)
+        report.check('rollup has no drift', drift['drifted_days'] == 0, drift['drift'][:5])
+
+        removed = manager.purge_user(user_id)
+        report.check('purge_user removes meals and their nutrition rows',
+                     removed.get('meals', 0) > 0 and removed.get('nutrition_entries', 0) > 0
+                     and not manager.list_meals(user_id)['meals'], removed)
+        report.check('purge_user removes profile, settings and goals',
+                     min(removed.get(table, 0) for table in ('users', 'user_settings', 'user_goals')) > 0
+                     and not manager.get_user_profile(user_id), removed)
+        report.check('purge_user removes recommendation versions',
+                     removed.get('recommendations', 0) == 2 and not manager.list_recommendation_versions(user_id),
+                     removed)
+        report.check('purge_user removes the rollup rows',
+                     removed.get('daily_totals', 0) > 0 and not manager.get_nutrition_history(user_id, days=7), removed)
+    except Exception as e:
+        report.check('no unexpected errors', False, repr(e))
+    finally:
+        # Remove every row the run wrote so repeated runs start clean
+        manager.purge_user(user_id)
+
+    result = report.as_dict()
+    result['backend'] = type(manager).__name__
+    result['user_id'] = user_id
+    return result
@@ -0,0 +1,29 @@
+"""
+Shared fixtures. The backend modules import each other by bare name
+(from models import init_db), as they do when app.py runs, so the backend
+directory goes on sys.path first.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager  # noqa: E402
+from models import init_db  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A migrated SQLite database with the demo user"""
+    path = str(tmp_path / 'chundiet.db')
+    init_db(path)
+    return path
+
+
+@pytest.fixture
+def sqlite_manager(db_path):
+    manager = DatabaseManager(db_path)
+    yield manager
+    manager.close()
@@ -0,0 +1,64 @@
+import shutil
+
+import pytest
+
+from food_composition import DEFAULT_CSV_PATH, FoodCompositionDB
+
+
+@pytest.fixture(scope='module')
+def foods(tmp_path_factory):
+    return FoodCompositionDB(str(tmp_path_factory.mktemp('foods') / 'food_composition.db'))
+
+
+def _summary(result):
+    values = result['nutritional_values']
+    return result['food_item'], values['serving_size'], values['calories']
+
+
+@pytest.mark.parametrize('description, expected', [
+    ('an apple', ('Apple', '1 medium (182g)', 95)),
+    ('2 large apples', ('Apple', '2 large (446g)', 232)),
+    ('2 slices of white bread', ('White bread', '2 slice (58g)', 154)),
+    ('150g chicken breast', ('Chicken breast', '150g', 248)),
+    ('3 almonds', ('Almonds', '3 (4g)', 21)),
+    ('almonds', ('Almonds', '1 handful (28g)', 162)),
+])
+def test_lookup_answers_simple_meals(foods, description, expected):
+    assert _summary(foods.lookup(description)) == expected
+
+
+@pytest.mark.parametrize('description', [
+    'eggs and toast', 'unicorn steak', '2 bowls of apple', '',
+    '2% milk', '1 cup 2% milk', '1 cup of rice at 7', 'rice at 7pm', '7 up', '2 apples 3 bananas',
+])
+def test_lookup_leaves_everything_else_to_gemini(foods, description):
+    assert foods.lookup(description) is None
+
+
+def test_lookup_returns_the_gemini_analysis_shape(foods):
+    values = foods.lookup('an apple')['nutritional_values']
+    assert values['protein'] == '0.5g'
+    assert set(values['carbohydrates']) == {'total', 'fiber', 'sugars'}
+    assert {'name': 'Vitamin C', 'percent_daily_value': '9%'} in values['vitamins']
+
+
+def test_search_by_prefix_and_words(foods):
+    assert [food['name'] for food in foods.search('chick', prefix=True)][:2] == ['Chicken breast', 'Chickpeas']
+    assert foods.search('white bread')[0]['name'] == 'White bread'
+    assert foods.search('   ') == []
+
+
+def test_changed_csv_rebuilds_the_table(tmp_path):
+    csv_path = tmp_path / 'foods.csv'
+    shutil.copy(DEFAULT_CSV_PATH, csv_path)
+    db_path = str(tmp_path / 'food_composition.db')
+    assert FoodCompositionDB(db_path, str(csv_path)).lookup('kumquat') is None
+
+    with open(csv_path, 'a', encoding='utf-8') as f:
+        f.write('Kumquat,kumquats,71,1.9,15.9,6.5,9.4,0.9,0.1,73,5,6,5,each:19,each\n')
+    assert _summary(FoodCompositionDB(db_path, str(csv_path)).lookup('4 kumquats')) == ('Kumquat', '4 (76g)', 54)
+
+
+def test_from_env_can_turn_the_table_off(monkeypatch):
+    monkeypatch.setenv('CHUNDIET_LOCAL_FOODS', '0')
+    assert FoodCompositionDB.from_env() is None
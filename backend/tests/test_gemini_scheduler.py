@@ -0,0 +1,150 @@
+import json
+
+import pytest
+
+import gemini_scheduler
+from gemini_scheduler import (
+    KEY, PERMANENT, QUOTA, TRANSIENT, GeminiScheduler, GeminiUnavailableError, TokenBucket, classify_error,
+    retry_after
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gemini_scheduler.time, 'monotonic', clock)
+    monkeypatch.setattr(gemini_scheduler.time, 'sleep', lambda seconds: setattr(clock, 'now', clock.now + seconds))
+    return clock
+
+
+class ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+@pytest.mark.parametrize('error, kind', [
+    (ApiError(429, 'RESOURCE_EXHAUSTED'), QUOTA),
+    (Exception('429 Too Many Requests'), QUOTA),
+    (ApiError(403, 'PERMISSION_DENIED'), KEY),
+    (Exception('API key not valid. Please pass a valid API key.'), KEY),
+    (ApiError(400, 'INVALID_ARGUMENT'), PERMANENT),
+    (ApiError(408, 'Request Timeout'), TRANSIENT),
+    (ApiError(503, 'UNAVAILABLE'), TRANSIENT),
+    (json.JSONDecodeError('Unterminated string', '{"a', 1), TRANSIENT),
+    (ConnectionError('reset by peer'), TRANSIENT),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_retry_after_reads_the_server_hint():
+    assert retry_after(Exception('quota exceeded, "retryDelay": "23s"')) == 23.0
+    assert retry_after(Exception('Please retry in 4.5s.')) == 4.5
+    assert retry_after(Exception('no hint')) is None
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(capacity=2, per_minute=60)
+    bucket.take(2)
+    assert bucket.wait_time(1, bucket.updated) == pytest.approx(1.0)
+    assert bucket.wait_time(1, bucket.updated + 1) == 0.0
+    # Requests bigger than the bucket only wait for a full bucket
+    assert bucket.wait_time(10, bucket.updated + 2) == 0.0
+
+
+def test_acquire_spreads_calls_and_waits_for_the_bucket(clock):
+    scheduler = GeminiScheduler(rpm=1, max_wait=120)
+    assert scheduler.acquire(['a', 'b']) == 'a'
+    assert scheduler.acquire(['a', 'b']) == 'b'
+    # Both buckets are empty: the next call waits about a minute for a refill
+    assert scheduler.acquire(['a', 'b']) in ('a', 'b')
+    assert clock.now >= 1059
+
+
+def test_acquire_gives_up_after_max_wait(clock):
+    scheduler = GeminiScheduler(rpm=1, max_wait=5)
+    scheduler.acquire(['a'])
+    with pytest.raises(GeminiUnavailableError):
+        scheduler.acquire(['a'])
+
+
+def test_excluded_keys_are_a_last_resort(clock):
+    scheduler = GeminiScheduler()
+    assert scheduler.acquire(['a', 'b'], exclude=['a']) == 'b'
+    assert scheduler.acquire(['a'], exclude=['a']) == 'a'
+
+
+def test_breaker_opens_then_half_opens_for_a_single_probe(clock):
+    scheduler = GeminiScheduler(max_wait=0)
+    for _ in range(gemini_scheduler.FAILURE_THRESHOLD):
+        scheduler.record_failure('a', TRANSIENT, Exception('503'))
+    assert scheduler.stats()[0]['state'] == 'open'
+    assert scheduler.acquire(['a', 'b']) == 'b'
+
+    clock.now += gemini_scheduler.BASE_COOLDOWN
+    assert scheduler.stats()[0]['state'] == 'half_open'
+    scheduler.record_success('b', 0.1)
+    # b is healthier, so exclude it to send the probe to a
+    assert scheduler.acquire(['a', 'b'], exclude=['b']) == 'a'
+    # While the probe is out, a takes nothing else
+    assert scheduler.acquire(['a', 'b'], exclude=['b']) == 'b'
+
+    # A failed probe reopens with a doubled cooldown
+    scheduler.record_failure('a', TRANSIENT, Exception('503'))
+    assert scheduler.stats()[0]['reopens_in_s'] == 2 * gemini_scheduler.BASE_COOLDOWN
+
+    clock.now += 2 * gemini_scheduler.BASE_COOLDOWN
+    assert scheduler.acquire(['a']) == 'a'
+    scheduler.record_success('a', 0.2)
+    stats = scheduler.stats()[0]
+    assert (stats['state'], stats['consecutive_failures'], stats['last_latency_ms']) == ('closed', 0, 200.0)
+
+
+def test_quota_parks_the_key_for_the_suggested_delay(clock):
+    scheduler = GeminiScheduler()
+    scheduler.record_failure('a', QUOTA, Exception('429 RESOURCE_EXHAUSTED, retry in 12s'))
+    assert scheduler.stats()[0]['reopens_in_s'] == 12.0
+    scheduler.record_failure('b', KEY, Exception('403'))
+    assert scheduler.stats()[1]['reopens_in_s'] == gemini_scheduler.KEY_COOLDOWN
+
+
+def test_permanent_errors_do_not_count_against_the_key(clock):
+    scheduler = GeminiScheduler()
+    for _ in range(5):
+        scheduler.record_failure('a', PERMANENT, Exception('400'))
+    stats = scheduler.stats()[0]
+    assert (stats['state'], stats['health'], stats['permanent_errors']) == ('closed', 1.0, 5)
+
+
+def test_release_frees_an_abandoned_probe(clock):
+    scheduler = GeminiScheduler(max_wait=0)
+    scheduler.record_failure('a', KEY, Exception('401'))
+    clock.now += gemini_scheduler.KEY_COOLDOWN
+    assert scheduler.acquire(['a']) == 'a'
+    with pytest.raises(GeminiUnavailableError):
+        scheduler.acquire(['a'])
+    scheduler.release('a')
+    assert scheduler.acquire(['a']) == 'a'
+
+
+def test_retry_policy_and_backoff_bounds():
+    scheduler = GeminiScheduler(max_attempts=3, base_backoff=0.5, max_backoff=2)
+    assert scheduler.should_retry(TRANSIENT, 0) and scheduler.should_retry(QUOTA, 1)
+    assert not scheduler.should_retry(TRANSIENT, 2)
+    assert not scheduler.should_retry(PERMANENT, 0)
+    assert all(0 <= scheduler.backoff(attempt) <= 2 for attempt in range(10) for _ in range(20))
+
+
+def test_stats_mask_keys():
+    scheduler = GeminiScheduler()
+    scheduler.acquire(['AIzaSecretKey1234'])
+    assert scheduler.stats()[0]['key'] == '...1234'
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+import app as chundiet
+
+
+class FakeJobs:
+    """Replays a fixed sequence of job states, one per get() after the route's existence check"""
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.waits = []
+
+    def start(self):
+        pass
+
+    def get(self, job_id, user_id=None):
+        return self.states.pop(0) if len(self.states) > 1 else self.states[0]
+
+    def wait_for_change(self, timeout):
+        self.waits.append(timeout)
+
+
+def _events(body):
+    events = []
+    for block in body.decode().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def use(states, seconds=30):
+        jobs = FakeJobs(states)
+        monkeypatch.setattr(chundiet, 'analysis_jobs', jobs)
+        monkeypatch.setattr(chundiet, 'JOB_EVENTS_SECONDS', seconds)
+        response = chundiet.app.test_client().get('/api/jobs/abc/events?user_id=5')
+        return response, jobs
+    return use
+
+
+def test_stream_ends_with_the_finished_job(client):
+    queued = {'job_id': 'abc', 'status': 'queued'}
+    done = {'job_id': 'abc', 'status': 'done', 'meal_id': 7}
+    response, _ = client([queued, queued, done])
+    assert [name for name, _ in _events(response.data)] == ['status', 'done']
+    assert _events(response.data)[-1][1]['meal_id'] == 7
+
+
+def test_job_expiring_mid_stream_sends_failed(client):
+    response, _ = client([{'job_id': 'abc', 'status': 'running'}, None])
+    assert response.status_code == 200
+    name, data = _events(response.data)[-1]
+    assert (name, data['status'], data['error']) == ('failed', 'failed', 'Job not found')
+
+
+def test_stream_times_out_and_points_at_the_status_url(client):
+    response, jobs = client([{'job_id': 'abc', 'status': 'running'}], seconds=0)
+    name, data = _events(response.data)[-1]
+    assert name == 'timeout'
+    assert data['status_url'] == '/api/jobs/abc?user_id=5'
+    assert jobs.waits == []
+
+
+def test_unknown_job_is_404(client):
+    response, _ = client([None])
+    assert response.status_code == 404
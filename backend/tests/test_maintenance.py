@@ -0,0 +1,30 @@
+import sqlite3
+
+import maintenance
+
+
+def test_conformance_needs_an_explicit_scratch_database(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    assert maintenance.main(['conformance']) == 2
+    assert maintenance.main(['--db', 'chundiet.db', 'conformance']) == 2
+    assert 'throwaway user' in capsys.readouterr().err
+    assert not (tmp_path / 'chundiet.db').exists()
+
+
+def test_conformance_ignores_the_configured_backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # The app's shards must not receive the throwaway user
+    monkeypatch.setenv('CHUNDIET_SHARDS', '4')
+    assert maintenance.main(['--db', str(tmp_path / 'scratch.db'), 'conformance', '--user-id', '900000002']) == 0
+    assert not (tmp_path / 'shards').exists()
+    conn = sqlite3.connect(str(tmp_path / 'scratch.db'))
+    assert conn.execute('SELECT COUNT(*) FROM users WHERE id = 900000002').fetchone()[0] == 0
+    conn.close()
+
+
+def test_local_query_stats_needs_a_scratch_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('CHUNDIET_QUERY_STATS', '1')
+    assert maintenance.main(['query-stats']) == 2
+    assert not (tmp_path / 'chundiet.db').exists()
+    assert maintenance.main(['--db', str(tmp_path / 'scratch.db'), 'query-stats', '--limit', '3']) == 0
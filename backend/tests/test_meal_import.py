@@ -0,0 +1,57 @@
+import io
+import threading
+
+from meal_import import ImportReport, SpooledRecords, iter_raw_records, valid_records
+from storage_conformance import _meal
+
+UPLOAD = (
+    b'{"food_item": "Egg", "nutritional_values": {"calories": 70, "protein": "6g"}}\n'
+    b'not json\n'
+    b'{"food_item": "", "nutritional_values": {"calories": 1}}\n'
+    b'{"food_item": "Toast", "date_logged": "2024-03-01", "nutritional_values": {"calories": "80.4"}}\n'
+)
+
+
+def test_valid_records_reports_bad_rows():
+    report = ImportReport()
+    records = list(valid_records(iter_raw_records(io.BytesIO(UPLOAD), 'jsonl'), report))
+    assert [record['food_item'] for record in records] == ['Egg', 'Toast']
+    assert records[1]['nutritional_values']['calories'] == 80
+    assert records[1]['date_logged'] == '2024-03-01'
+    assert (report.total_rows, report.failed) == (4, 2)
+    assert [error['line'] for error in report.errors] == [2, 3]
+
+
+def test_spooled_records_round_trip_past_the_memory_limit():
+    records = [_meal(f'Meal {i}', i, '1g', '1%') for i in range(50)]
+    with SpooledRecords(iter(records), max_memory=256) as spooled:
+        assert len(spooled) == 50
+        assert list(spooled) == records
+        # Iterable more than once
+        assert list(spooled) == records
+
+
+def test_slow_upload_does_not_block_other_writes(sqlite_manager):
+    release = threading.Event()
+    reading = threading.Event()
+
+    def stalled_upload():
+        yield _meal('Oats', 300, '10g', '0%')
+        reading.set()
+        # The client stops sending here
+        release.wait(10)
+        yield _meal('Rice', 200, '4g', '')
+
+    result = {}
+    importer = threading.Thread(target=lambda: result.update(stored=sqlite_manager.bulk_store_meals(2, stalled_upload())))
+    importer.start()
+    try:
+        assert reading.wait(5)
+        # Another user's write goes through while the upload is still stalled
+        meal_id = sqlite_manager.store_meal_async(3, _meal('Apple', 95, '0.5g', '14%')).result(timeout=5)
+        assert isinstance(meal_id, int)
+    finally:
+        release.set()
+        importer.join(10)
+    assert result['stored'] == 2
+    assert len(sqlite_manager.list_meals(2)['meals']) == 2
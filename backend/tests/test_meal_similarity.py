@@ -0,0 +1,110 @@
+import pytest
+
+from meal_similarity import MealSimilarityIndex, jaccard, parse_description, scale_analysis, shingles
+
+APPLE = {
+    'food_item': 'Apple',
+    'nutritional_values': {
+        'calories': 95, 'protein': '0.5g', 'carbohydrates': {'total': '25g'}, 'fat': {'total': 0.3},
+        'vitamins': [{'name': 'Vitamin C', 'percent_daily_value': '14%'}], 'serving_size': '1 medium'
+    }
+}
+
+
+@pytest.mark.parametrize('description, parsed', [
+    ('I had 2 apples', (2.0, 'apple', True)),
+    ('Ate some Apple today', (1.0, 'apple', True)),
+    ('half a cup of rice', (0.5, 'cup rice', True)),
+    ('a half banana', (0.5, 'banana', True)),
+    ('3/4 cup oats', (0.75, 'cup oat', True)),
+    ('eggs and toast', (1.0, 'egg + toast', False)),
+    ('2 eggs and a toast', (1.0, '2 egg + toast', False)),
+    ('150g chicken breast', (150.0, 'g chicken breast', True)),
+    ('a dozen eggs', (12.0, 'egg', True)),
+    # Numbers that are not a leading count are kept and never scaled
+    ('2% milk', (1.0, '2% milk', False)),
+    ('1 % milk', (1.0, '1% milk', False)),
+    ('1 cup 2% milk', (1.0, '1 cup 2% milk', False)),
+    ('pizza at 7pm', (1.0, 'pizza 7 pm', False)),
+    ('1 cup of rice at 7', (1.0, '1 cup rice 7', False)),
+    ('coffee at 7:30', (1.0, 'coffee 7 30', False)),
+    ('7 up', (1.0, '7 up', False)),
+    ('2 apples 3 bananas', (1.0, '2 apple 3 banana', False)),
+])
+def test_parse_description(description, parsed):
+    assert parse_description(description) == parsed
+
+
+def test_jaccard_of_shingles():
+    assert jaccard(shingles('apple'), shingles('apple')) == 1.0
+    assert jaccard(shingles('apple'), frozenset()) == 0.0
+    assert 0 < jaccard(shingles('apple pie'), shingles('apple')) < 1
+
+
+def test_scale_analysis_multiplies_every_amount():
+    scaled = scale_analysis(APPLE, 2)
+    values = scaled['nutritional_values']
+    assert (values['calories'], values['protein'], values['carbohydrates']['total']) == (190, '1g', '50g')
+    assert values['fat']['total'] == 0.6
+    assert values['vitamins'][0]['percent_daily_value'] == '28%'
+    assert values['serving_size'] == '2 x 1 medium'
+    # The original is untouched
+    assert APPLE['nutritional_values']['calories'] == 95
+
+
+def test_exact_food_match_is_scaled_to_the_new_quantity():
+    index = MealSimilarityIndex()
+    index.add('I had an apple', APPLE)
+    result, score, matched = index.lookup('ate 2 apples')
+    assert (score, matched) == (1.0, 'I had an apple')
+    assert result['nutritional_values']['calories'] == 190
+
+
+def test_fuzzy_match_above_the_threshold():
+    index = MealSimilarityIndex(threshold=0.7)
+    index.add('2 grilled chicken breasts', {'nutritional_values': {'calories': 500}})
+    result, score, _ = index.lookup('a grilled chiken breast')
+    assert 0.7 <= score < 1
+    assert result['nutritional_values']['calories'] == 250
+    assert index.lookup('beef stew') is None
+    stats = index.stats()
+    assert (stats['fuzzy_hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+
+def test_implausible_scale_and_mixed_items_miss():
+    index = MealSimilarityIndex()
+    index.add('an apple', APPLE)
+    assert index.lookup('30 apples') is None
+    index.add('eggs and toast', {'nutritional_values': {'calories': 300}})
+    assert index.lookup('2 eggs and toast') is None
+    assert index.lookup('eggs and toast')[0]['nutritional_values']['calories'] == 300
+
+
+def test_percentages_and_times_are_not_quantities():
+    index = MealSimilarityIndex()
+    index.add('2% milk', {'nutritional_values': {'calories': 122}})
+    index.add('pizza', {'nutritional_values': {'calories': 285}})
+    assert index.lookup('1% milk') is None
+    assert index.lookup('2% milk')[0]['nutritional_values']['calories'] == 122
+    assert index.lookup('pizza at 7pm') is None
+    assert index.lookup('7 up') is None
+
+
+def test_newer_analysis_replaces_and_oldest_is_evicted():
+    index = MealSimilarityIndex(max_entries=2)
+    index.add('apple', APPLE)
+    index.add('apple', {'nutritional_values': {'calories': 80}})
+    assert len(index) == 1
+    assert index.lookup('apple')[0]['nutritional_values']['calories'] == 80
+    index.add('banana', {})
+    index.add('cherry', {})
+    assert len(index) == 2 and index.lookup('apple') is None
+    assert index.stats()['evicted'] == 1
+
+
+def test_from_env_can_turn_the_index_off(monkeypatch):
+    monkeypatch.setenv('CHUNDIET_SIMILARITY', 'off')
+    assert MealSimilarityIndex.from_env() is None
+    monkeypatch.setenv('CHUNDIET_SIMILARITY', '1')
+    monkeypatch.setenv('CHUNDIET_SIMILARITY_THRESHOLD', '0.9')
+    assert MealSimilarityIndex.from_env().threshold == 0.9
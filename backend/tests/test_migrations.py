@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from database import DatabaseManager
+from migrations import MIGRATIONS, get_schema_version, run_migrations
+from models import init_db
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def _baseline_db(path, monkeypatch):
+    """A version 0 database: the original tables, no migrations applied"""
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, 'MIGRATIONS', [])
+        init_db(path)
+    conn = sqlite3.connect(path)
+    assert get_schema_version(conn) == 0
+    return conn
+
+
+def test_versions_are_ordered_and_unique():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+
+def test_fresh_database_is_fully_migrated(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT version FROM schema_version ORDER BY version').fetchall()
+    assert [row[0] for row in rows] == [version for version, _, _ in MIGRATIONS]
+    conn.close()
+
+
+def test_init_db_twice_applies_nothing_new(db_path):
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    assert get_schema_version(conn) == LATEST
+    assert conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0] == len(MIGRATIONS)
+    assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 1
+    conn.close()
+
+
+def test_upgrade_backfills_existing_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / 'old.db')
+    conn = _baseline_db(path, monkeypatch)
+    conn.execute("INSERT INTO meals (user_id, food_item, date_logged) VALUES (1, 'Oats', '2024-03-01')")
+    conn.execute('''
+        INSERT INTO nutrition_entries (meal_id, calories, protein, total_carbohydrates, total_fat, vitamins)
+        VALUES (1, 300, '10g', '54 g', '500mg', '[{"name": "Vit C", "percent_daily_value": "12%"}]')
+    ''')
+    conn.execute('''
+        INSERT INTO recommendations (user_id, recommendations_data, overall_assessment, weekly_goal)
+        VALUES (1, '{"food_recommendations": [{"food": "Kale"}]}', 'ok', 'greens')
+    ''')
+    conn.commit()
+
+    assert run_migrations(conn) == LATEST
+
+    grams = conn.execute('SELECT protein_g, carbs_g, fat_g FROM nutrition_entries').fetchone()
+    assert grams == (10.0, 54.0, 0.5)
+    totals = conn.execute('SELECT user_id, day, meal_count, calories, protein_g FROM daily_totals').fetchall()
+    assert totals == [(1, '2024-03-01', 1, 300, 10.0)]
+    micros = conn.execute('''
+        SELECT nu.name, mi.pct_dv FROM micronutrients mi JOIN nutrients nu ON nu.id = mi.nutrient_id
+    ''').fetchall()
+    assert micros == [('Vitamin C', 12.0)]
+    assert conn.execute('SELECT version, recommendations_data FROM recommendations').fetchone() == (1, None)
+    conn.close()
+
+    manager = DatabaseManager(path)
+    try:
+        stored = manager.get_stored_recommendations(1)
+        assert stored['food_recommendations'] == [{'food': 'Kale'}]
+        assert stored['version'] == 1
+        assert stored['input_fingerprint'] is None
+    finally:
+        manager.close()
+
+
+def test_partially_migrated_database_continues(tmp_path, monkeypatch):
+    path = str(tmp_path / 'partial.db')
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, 'MIGRATIONS', MIGRATIONS[:3])
+        init_db(path)
+    conn = sqlite3.connect(path)
+    assert get_schema_version(conn) == 3
+    assert run_migrations(conn) == LATEST
+    conn.close()
+
+
+def test_failed_step_rolls_back_and_is_not_recorded(db_path, monkeypatch):
+    def broken(cursor):
+        cursor.execute('CREATE TABLE half_done (id INTEGER)')
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [(LATEST + 1, 'Broken step', broken)])
+    conn = sqlite3.connect(db_path)
+    with pytest.raises(RuntimeError):
+        run_migrations(conn)
+    assert get_schema_version(conn) == LATEST
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    conn.close()
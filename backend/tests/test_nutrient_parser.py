@@ -0,0 +1,42 @@
+import pytest
+
+from nutrient_parser import parse_grams, parse_macros, parse_percent
+
+
+@pytest.mark.parametrize('value, grams', [
+    ('4g', 4.0),
+    ('2 g', 2.0),
+    ('150 mg', 0.15),
+    ('<1g', 0.5),
+    ('10-12g', 11.0),
+    ('0.5 oz', 14.174762),
+    ('1/2 oz', 14.174762),
+    ('1 1/2 oz', 42.524285),
+    ('3/4g', 0.75),
+    ('1/4-1/2 oz', 10.631071),
+    ('trace', 0.0),
+    ('12', 12.0),
+    (7, 7.0),
+])
+def test_parse_grams(value, grams):
+    assert parse_grams(value) == pytest.approx(grams)
+
+
+@pytest.mark.parametrize('value', [None, True, '', 'unknown', '1/0 g'])
+def test_parse_grams_rejects_unreadable_amounts(value):
+    assert parse_grams(value) is None
+
+
+def test_parse_percent():
+    assert parse_percent('15%') == 15.0
+    assert parse_percent('<1%') == 0.5
+    assert parse_percent('10-20%') == 15.0
+    assert parse_percent(None) is None
+
+
+def test_parse_macros():
+    macros = parse_macros({'protein': '1/2 oz', 'carbohydrates': {'total': '54 g', 'fiber': '2g'},
+                           'fat': {'total': '500mg'}})
+    assert macros['protein_g'] == pytest.approx(14.174762)
+    assert (macros['carbs_g'], macros['fiber_g'], macros['sugars_g']) == (54.0, 2.0, None)
+    assert (macros['fat_g'], macros['saturated_fat_g']) == (0.5, None)
@@ -0,0 +1,66 @@
+"""
+Query plan regressions: the hot per-user queries must SEARCH an index, not
+SCAN a table. Plans are captured from the real DatabaseManager methods
+through QueryStats with every statement treated as slow.
+"""
+from datetime import date
+
+import pytest
+
+from database import DatabaseManager
+from query_stats import QueryStats
+from storage_conformance import _meal
+
+TODAY = date.today().isoformat()
+
+
+@pytest.fixture
+def traced(db_path):
+    stats = QueryStats(slow_ms=0, slow_log_size=1000)
+    manager = DatabaseManager(db_path, query_stats=stats)
+    for food in ('Apple', 'Yogurt', 'Toast'):
+        manager.store_meal(1, _meal(food, 100, '5g', '10%'))
+    manager.store_recommendations(1, {'food_recommendations': [], 'overall_assessment': 'ok', 'weekly_goal': 'x'})
+    stats.reset()
+    yield manager, stats
+    manager.close()
+
+
+def _plans(stats, caller):
+    entries = [entry for entry in stats.snapshot(limit=1000)['slow'] if entry['caller'] == caller]
+    assert entries, f'{caller} ran no statements'
+    return [(entry['sql'], [line.strip() for line in entry['plan'] or []]) for entry in entries]
+
+
+def _assert_indexed(stats, caller):
+    for sql, plan in _plans(stats, caller):
+        scans = [line for line in plan if line.startswith('SCAN') and line != 'SCAN CONSTANT ROW']
+        assert not scans, f'{caller} scans a table: {scans}\n{sql}'
+        if 'FROM' in sql.upper():
+            assert any(line.startswith('SEARCH') for line in plan), f'{caller} uses no index\n{sql}\n{plan}'
+
+
+def test_daily_summary_uses_indexes(traced):
+    manager, stats = traced
+    manager.get_daily_summary(1, TODAY)
+    _assert_indexed(stats, 'get_daily_summary')
+
+
+def test_micronutrient_totals_use_indexes(traced):
+    manager, stats = traced
+    manager.get_micronutrient_totals(1, TODAY, days=7)
+    _assert_indexed(stats, 'get_micronutrient_totals')
+
+
+def test_list_meals_uses_indexes_on_every_page(traced):
+    manager, stats = traced
+    page = manager.list_meals(1, limit=2)
+    manager.list_meals(1, limit=2, cursor_token=page['next_cursor'])
+    assert len(_plans(stats, 'list_meals')) == 2
+    _assert_indexed(stats, 'list_meals')
+
+
+def test_stored_recommendations_use_indexes(traced):
+    manager, stats = traced
+    manager.get_stored_recommendations(1)
+    _assert_indexed(stats, 'get_stored_recommendations')
@@ -0,0 +1,101 @@
+import json
+import threading
+
+import pytest
+
+from recommendation_cache import CHANGED, FRESH, STALE, RecommendationRefresher, input_fingerprint
+
+SUMMARY = {'total_meals': 10, 'total_calories': 5000, 'today_meals': [{'food_item': 'Oats'}]}
+PROFILE = {'name': 'Demo User', 'age': 30, 'gender': 'female', 'weight': 60, 'activity_level': 'moderate',
+           'updated_at': '2024-03-01 08:00:00'}
+GOALS = {'goal_description': 'more greens', 'daily_calories': 2000}
+
+
+def _stored(summary=SUMMARY, profile=PROFILE, goals=GOALS, temperature=0.7):
+    return json.dumps(input_fingerprint(summary, profile, goals, temperature))
+
+
+@pytest.fixture
+def refresher():
+    return RecommendationRefresher()
+
+
+def test_fingerprint_ignores_fields_the_prompt_does_not_read():
+    renamed = dict(PROFILE, name='Someone Else', updated_at='2024-03-09 10:00:00')
+    assert input_fingerprint(SUMMARY, renamed, GOALS, 0.7) == input_fingerprint(SUMMARY, PROFILE, GOALS, 0.7)
+    assert input_fingerprint(SUMMARY, dict(PROFILE, age=31), GOALS, 0.7) != input_fingerprint(SUMMARY, PROFILE, GOALS, 0.7)
+
+
+def test_identical_inputs_are_fresh(refresher):
+    assert refresher.classify(_stored(), input_fingerprint(SUMMARY, PROFILE, GOALS, 0.7)) == FRESH
+
+
+def test_small_meal_drift_is_stale(refresher):
+    current = dict(SUMMARY, total_meals=12, total_calories=5600, today_meals=[{'food_item': 'Rice'}])
+    assert refresher.classify(_stored(), input_fingerprint(current, PROFILE, GOALS, 0.7)) == STALE
+
+
+@pytest.mark.parametrize('summary, profile, goals, temperature', [
+    (dict(SUMMARY, total_meals=13), PROFILE, GOALS, 0.7),
+    (dict(SUMMARY, total_calories=6000), PROFILE, GOALS, 0.7),
+    (SUMMARY, dict(PROFILE, weight=65), GOALS, 0.7),
+    (SUMMARY, PROFILE, dict(GOALS, daily_calories=1800), 0.7),
+    (SUMMARY, PROFILE, GOALS, 0.9),
+])
+def test_bigger_or_other_changes_regenerate(refresher, summary, profile, goals, temperature):
+    assert refresher.classify(_stored(), input_fingerprint(summary, profile, goals, temperature)) == CHANGED
+
+
+@pytest.mark.parametrize('stored', [None, '', 'not json', json.dumps({'data': 'x'})])
+def test_missing_or_unreadable_fingerprints_regenerate(refresher, stored):
+    assert refresher.classify(stored, input_fingerprint(SUMMARY, PROFILE, GOALS, 0.7)) == CHANGED
+
+
+def test_reuse_can_be_turned_off():
+    refresher = RecommendationRefresher(enabled=False)
+    assert refresher.classify(_stored(), input_fingerprint(SUMMARY, PROFILE, GOALS, 0.7)) == CHANGED
+
+
+def test_fingerprint_survives_storage(sqlite_manager, refresher):
+    sqlite_manager.store_recommendations(1, {'overall_assessment': 'ok', 'weekly_goal': 'greens'}, _stored())
+    stored = sqlite_manager.get_stored_recommendations(1)['input_fingerprint']
+    assert refresher.classify(stored, input_fingerprint(SUMMARY, PROFILE, GOALS, 0.7)) == FRESH
+
+
+def test_refresh_runs_once_per_user_at_a_time(refresher):
+    started = threading.Event()
+    release = threading.Event()
+    finished = threading.Event()
+
+    def regenerate():
+        started.set()
+        release.wait(5)
+        finished.set()
+
+    assert refresher.refresh(1, regenerate)
+    assert started.wait(5)
+    assert not refresher.refresh(1, regenerate)
+    assert refresher.stats()['refreshing'] == 1
+    release.set()
+    assert finished.wait(5)
+    refresher._executor.shutdown(wait=True)
+    stats = refresher.stats()
+    assert (stats['refreshes'], stats['refresh_skipped'], stats['refreshing']) == (1, 1, 0)
+
+
+def test_failed_refresh_is_counted_and_frees_the_user(refresher):
+    def regenerate():
+        raise RuntimeError('Gemini down')
+
+    refresher.refresh(1, regenerate)
+    refresher._executor.shutdown(wait=True)
+    stats = refresher.stats()
+    assert (stats['refresh_failures'], stats['refreshing']) == (1, 0)
+
+
+def test_stats_report_the_reuse_rate(refresher):
+    current = input_fingerprint(SUMMARY, PROFILE, GOALS, 0.7)
+    refresher.classify(_stored(), current)
+    refresher.classify(None, current)
+    stats = refresher.stats()
+    assert (stats[FRESH], stats[CHANGED], stats['reuse_rate']) == (1, 1, 0.5)
@@ -0,0 +1,74 @@
+from recommendation_prompt import build_recommendation_prompt, micronutrient_status
+
+PROFILE = {'age': 30, 'gender': 'female', 'weight': 60, 'activity_level': 'moderate'}
+GOALS = {'goal_description': 'eat more greens', 'daily_calories': 2000, 'daily_protein': 90}
+
+
+def _meal(day, food, calories=400):
+    return {
+        'date': day, 'consumption_time': f'{day}T12:30:00', 'food_item': food, 'calories': calories,
+        'protein': '20g', 'carbohydrates': '50g', 'fat': '10g',
+        'vitamins': [{'name': 'Vit C', 'percent_daily_value': '60%'}]
+    }
+
+
+def _week(meals_per_day=4):
+    days = [f'2024-03-{day:02d}' for day in range(7, 0, -1)]
+    today = [_meal(days[0], f'Today dish {i}') for i in range(meals_per_day)]
+    previous = [_meal(day, f'Dish {day} {i}') for day in days[1:] for i in range(meals_per_day)]
+    return {
+        'today_meals': today, 'previous_meals': previous, 'days_with_data': 7, 'period_days': 7,
+        'total_meals': len(today) + len(previous), 'food_variety': len(today) + len(previous),
+        'total_calories': 400 * (len(today) + len(previous)), 'avg_daily_calories': 400.0 * meals_per_day
+    }
+
+
+def test_everything_fits_a_generous_budget():
+    data = _week()
+    prompt, report = build_recommendation_prompt(data, PROFILE, GOALS, token_budget=100000)
+    assert (report['meals'], report['meals_detailed'], report['days_detailed']) == (28, 28, 7)
+    assert (report['days_summarized'], report['days_totals_only'], report['over_budget']) == (0, 0, False)
+    assert '2024-03-07|12:30|Today dish 0|400|20g|50g|10g' in prompt
+    assert '2024-03-01|4|1600|80|200|40' in prompt
+    assert 'GOAL: eat more greens' in prompt and 'fat not set' in prompt
+
+
+def test_older_days_shrink_first_and_today_is_kept():
+    data = _week()
+    full, _ = build_recommendation_prompt(data, PROFILE, GOALS, token_budget=100000)
+    prompt, report = build_recommendation_prompt(data, PROFILE, GOALS, token_budget=len(full) // 4 - 100)
+    assert report['days_summarized'] + report['days_totals_only'] > 0
+    assert not report['over_budget']
+    assert all(f'Today dish {i}|' in prompt for i in range(4))
+    # The oldest day loses its meal rows before the newest previous day
+    assert '2024-03-01: Dish 2024-03-01 0, Dish 2024-03-01 1' in prompt
+    assert '2024-03-01|12:30|' not in prompt
+    assert '2024-03-06|12:30|Dish 2024-03-06 0' in prompt
+    # Per-day totals survive every cut
+    assert '2024-03-01|4|1600|80|200|40' in prompt
+
+
+def test_tiny_budget_keeps_only_todays_meals_and_totals():
+    prompt, report = build_recommendation_prompt(_week(), PROFILE, GOALS, token_budget=1)
+    assert (report['days_detailed'], report['days_summarized'], report['days_totals_only']) == (1, 0, 6)
+    assert report['meals_detailed'] == 4 and report['over_budget']
+    assert '6 older day(s) appear in DAILY TOTALS only.' in prompt
+    assert 'Dish 2024-03-01' not in prompt
+
+
+def test_food_names_are_sanitized_for_the_table():
+    data = _week(1)
+    data['today_meals'][0]['food_item'] = 'Rice | beans   and a very long description of a burrito bowl'
+    prompt, _ = build_recommendation_prompt(data, PROFILE, None, token_budget=100000)
+    assert '|Rice / beans and a very long descriptio…|400|' in prompt
+    assert 'DAILY TARGETS: not set kcal' in prompt
+
+
+def test_micronutrient_gaps_include_unmentioned_key_nutrients():
+    meals = [{'vitamins': [{'name': 'Vit C', 'percent_daily_value': '150%'},
+                           {'name': 'Iron', 'percent_daily_value': '20%'}]}] * 2
+    gaps, strengths = micronutrient_status(meals, days_with_data=2)
+    assert strengths == [('Vitamin C', 150.0)]
+    # Ten key nutrients never logged at all outrank Iron at 20%
+    assert len(gaps) == 6 and all(value == 0.0 for _, value in gaps)
+    assert 'Vitamin D' in dict(gaps)
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+
+import pytest
+
+import sharding
+from sharding import HashShardRouter, PerUserShardRouter, ShardedDatabaseManager
+from storage_conformance import _meal
+
+
+@pytest.fixture
+def per_user(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = ShardedDatabaseManager(PerUserShardRouter('shards'))
+    yield manager
+    manager.close()
+
+
+def test_hash_router_spreads_numeric_ids(tmp_path):
+    router = HashShardRouter(str(tmp_path), 4)
+    assert router.shard_for(5) == router.shard_for('5') == router.shard_path(1)
+    assert len({router.shard_for(user_id) for user_id in range(8)}) == 4
+
+
+def test_shard_map_is_read_on_first_use_not_at_construction(tmp_path, monkeypatch):
+    # app.py builds the router at import time; run.py changes directory afterwards
+    router = HashShardRouter('shards', 4)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('shards')
+    with open(os.path.join('shards', 'shard_map.json'), 'w') as f:
+        json.dump({'7': 'shard-big.db'}, f)
+    assert router.shard_for(7) == os.path.join('shards', 'shard-big.db')
+
+
+def test_reads_do_not_create_shards(per_user):
+    assert per_user.list_meals('424242')['meals'] == []
+    assert per_user.get_user_profile('424242') == {}
+    assert per_user.get_daily_summary('424242', '2024-03-01')['meal_count'] == 0
+    assert per_user.delete_meal(1, '424242') is False
+    assert not os.path.exists(per_user.router.shard_for('424242'))
+    assert per_user.router.known_shards() == []
+
+
+def test_writes_create_the_shard(per_user):
+    meal_id = per_user.store_meal(31, _meal('Apple', 95, '0.5g', '14%'))
+    assert os.path.exists(per_user.router.shard_for(31))
+    assert [meal['id'] for meal in per_user.list_meals(31)['meals']] == [meal_id]
+    # Another user's reads still see nothing
+    assert per_user.list_meals(32)['meals'] == []
+
+
+def test_demo_user_shard_is_seeded(per_user):
+    assert per_user.get_user_profile(1)['name'] == 'Demo User'
+
+
+def test_slow_shard_migration_does_not_block_other_shards(per_user, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    real_init_db = sharding.init_db
+    slow_path = per_user.router.shard_for(41)
+
+    def init_db(path, **kwargs):
+        if path == slow_path:
+            started.set()
+            release.wait(10)
+        real_init_db(path, **kwargs)
+
+    monkeypatch.setattr(sharding, 'init_db', init_db)
+    slow = threading.Thread(target=per_user.store_meal, args=(41, _meal('Oats', 300, '10g', '0%')))
+    slow.start()
+    try:
+        assert started.wait(5)
+        done = threading.Event()
+        threading.Thread(target=lambda: (per_user.store_meal(42, _meal('Rice', 200, '4g', '')), done.set())).start()
+        assert done.wait(5), 'opening another shard waited for the slow migration'
+    finally:
+        release.set()
+        slow.join(10)
+    assert len(per_user.list_meals(41)['meals']) == 1
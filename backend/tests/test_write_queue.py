@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+
+import pytest
+
+from write_queue import WriteQueue, WriterUnavailableError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    path = str(tmp_path / 'writes.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+    conn.commit()
+    conn.close()
+    queue = WriteQueue(lambda: sqlite3.connect(path, check_same_thread=False))
+    queue.path = path
+    yield queue
+    queue.close()
+
+
+def _insert(cursor, name):
+    cursor.execute('INSERT INTO items (name) VALUES (?)', (name,))
+    return cursor.lastrowid
+
+
+def _names(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT name FROM items ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_results_resolve_after_commit(queue):
+    futures = [queue.submit(_insert, f'item {i}') for i in range(20)]
+    ids = [future.result(5) for future in futures]
+    assert ids == sorted(ids) and len(set(ids)) == 20
+    assert len(_names(queue.path)) == 20
+    stats = queue.stats()
+    assert (stats['submitted'], stats['completed'], stats['failed']) == (20, 20, 0)
+    assert stats['batches'] <= 20 and stats['running']
+
+
+def test_failing_operation_only_rolls_back_itself(queue):
+    gate = threading.Event()
+    blocker = queue.submit(lambda cursor: gate.wait(5))
+    # Queued behind the blocker so all three land in one batch
+    first = queue.submit(_insert, 'a')
+    duplicate = queue.submit(_insert, 'a')
+    last = queue.submit(_insert, 'b')
+    gate.set()
+    blocker.result(5)
+    assert isinstance(first.result(5), int) and isinstance(last.result(5), int)
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result(5)
+    assert _names(queue.path) == ['a', 'b']
+
+
+def test_connection_failure_fails_futures_instead_of_hanging(tmp_path):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError('unable to open database file')
+        return sqlite3.connect(str(tmp_path / 'ok.db'), check_same_thread=False)
+
+    queue = WriteQueue(connect)
+    try:
+        with pytest.raises(WriterUnavailableError):
+            queue.submit(lambda cursor: 1).result(5)
+        assert queue.stats()['writer_failures'] == 1
+        assert 'unable to open' in queue.stats()['last_error']
+        # The next write starts a fresh writer
+        assert queue.submit(lambda cursor: 2).result(5) == 2
+        assert len(attempts) == 2
+    finally:
+        queue.close()
+
+
+def test_error_outside_an_operation_fails_the_batch_and_queue(queue):
+    gate = threading.Event()
+    release = threading.Event()
+
+    def stall(cursor):
+        gate.set()
+        release.wait(5)
+
+    class Escapes(BaseException):
+        pass
+
+    def escape(cursor):
+        raise Escapes()
+
+    stalled = queue.submit(stall)
+    assert gate.wait(5)
+    doomed = queue.submit(escape)
+    queued = queue.submit(_insert, 'never')
+    release.set()
+    stalled.result(5)
+    with pytest.raises(WriterUnavailableError) as failure:
+        doomed.result(5)
+    assert isinstance(failure.value.__cause__, Escapes)
+    with pytest.raises(WriterUnavailableError):
+        queued.result(5)
+    assert queue.submit(_insert, 'after').result(5)
+    assert _names(queue.path) == ['after']
+
+
+def test_submit_from_inside_an_operation_is_rejected(queue):
+    def nested(cursor):
+        return queue.submit(_insert, 'inner')
+
+    with pytest.raises(RuntimeError, match='inside a write operation'):
+        queue.submit(nested).result(5)
+    # The writer is still alive
+    assert queue.submit(_insert, 'outer').result(5)
+
+
+def test_cancelled_operation_is_skipped(queue):
+    gate = threading.Event()
+    blocker = queue.submit(lambda cursor: gate.wait(5))
+    cancelled = queue.submit(_insert, 'cancelled')
+    assert cancelled.cancel()
+    gate.set()
+    blocker.result(5)
+    assert queue.submit(_insert, 'kept').result(5)
+    assert _names(queue.path) == ['kept']
+
+
+def test_writes_after_close_still_run(queue):
+    queue.submit(_insert, 'before').result(5)
+    queue.close()
+    assert queue.submit(_insert, 'after').result(5)
+    assert _names(queue.path) == ['before', 'after']
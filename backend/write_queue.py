@@ -0,0 +1,221 @@
+"""
+Single-writer queue for SQLite writes.
+
+SQLite allows one writer at a time, so instead of every request thread
+racing for the write lock, writes are submitted as operations to one
+background thread that owns the only write connection. The thread drains
+whatever is queued, runs each operation inside its own SAVEPOINT and
+group-commits the batch in a single transaction. Callers get a Future that
+resolves to the operation's return value (e.g. the new row id) once the
+batch is durable. Reads keep using the connection pool and stay concurrent.
+
+If the writer thread itself fails (the connection cannot be opened, or an
+error escapes outside any operation), every write still queued fails with
+WriterUnavailableError and the next submit starts a fresh writer, so callers
+never wait on a thread that is gone. Operations must not submit further
+writes: they already run inside the writer's transaction and should use the
+cursor they are given.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import Callable, Dict
+
+_STOP = object()
+
+
+class WriterUnavailableError(RuntimeError):
+    """The writer thread failed before the operation could run"""
+
+
+class _WriteOp:
+    __slots__ = ('func', 'args', 'kwargs', 'future', 'enqueued_at')
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class WriteQueue:
+    """Background writer thread that group-commits queued write operations"""
+
+    def __init__(self, connection_factory: Callable, max_batch: int = 64):
+        self.max_batch = max_batch
+        self._connection_factory = connection_factory
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch_size': 0,
+            'last_batch_size': 0,
+            'commit_time_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'last_commit_ms': 0.0,
+            'queue_wait_ms': 0.0,
+            'writer_failures': 0
+        }
+        self.last_error = None
+        self._thread = None
+        self._batch = []
+
+    def _ensure_started(self):
+        # Started on first use so the write connection is opened lazily,
+        # like pooled connections (relative db paths resolve at first write).
+        # Caller holds self._lock.
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='chundiet-db-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        Queue func(cursor, *args, **kwargs) for the writer thread.
+        The returned Future resolves after the enclosing transaction commits.
+        """
+        if threading.current_thread() is self._thread:
+            # Waiting on it from inside an operation would deadlock the writer
+            raise RuntimeError('submit() called from inside a write operation; use the cursor it was given')
+        op = _WriteOp(func, args, kwargs)
+        with self._lock:
+            self._ensure_started()
+            self._stats['submitted'] += 1
+            self._queue.put(op)
+        return op.future
+
+    def close(self, timeout: float = 5.0):
+        """Finish queued work and stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        try:
+            conn = self._connection_factory()
+            # Transactions are managed explicitly below
+            conn.isolation_level = None
+            cursor = conn.cursor()
+
+            while True:
+                batch = self._next_batch()
+                stop = _STOP in batch
+                # Callers may have cancelled a Future that is still queued
+                self._batch = [op for op in batch if op is not _STOP and op.future.set_running_or_notify_cancel()]
+                if self._batch:
+                    self._run_batch(conn, cursor, self._batch)
+                self._batch = []
+                if stop:
+                    break
+        except BaseException as e:
+            self._fail(e)
+        else:
+            with self._lock:
+                self._thread = None
+                # Writes submitted after close() still get a writer
+                if not self._queue.empty():
+                    self._ensure_started()
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def _fail(self, error: BaseException):
+        """Fail the running batch and everything queued; the next submit starts a new writer"""
+        with self._lock:
+            self._stats['writer_failures'] += 1
+            self.last_error = repr(error)
+            self._thread = None
+            pending = [op for op in self._batch if not op.future.done()]
+            self._batch = []
+            while True:
+                try:
+                    op = self._queue.get_nowait()
+                except Empty:
+                    break
+                if op is not _STOP and op.future.set_running_or_notify_cancel():
+                    pending.append(op)
+            self._stats['failed'] += len(pending)
+        for op in pending:
+            failure = WriterUnavailableError(f'Database writer failed: {error!r}')
+            failure.__cause__ = error
+            op.future.set_exception(failure)
+
+    def _run_batch(self, conn, cursor, batch):
+        started = time.perf_counter()
+        queue_wait_ms = sum((started - op.enqueued_at) * 1000 for op in batch)
+        outcomes = []
+
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for op in batch:
+                # A failing operation only rolls back its own savepoint
+                cursor.execute('SAVEPOINT write_op')
+                try:
+                    result = op.func(cursor, *op.args, **op.kwargs)
+                    cursor.execute('RELEASE write_op')
+                    outcomes.append((op, result, None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_op')
+                    cursor.execute('RELEASE write_op')
+                    outcomes.append((op, None, e))
+            cursor.execute('COMMIT')
+        except Exception as e:
+            # BEGIN or COMMIT itself failed: nothing in this batch was written
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(op, None, e) for op in batch]
+
+        commit_ms = (time.perf_counter() - started) * 1000
+        failed = 0
+        for op, result, error in outcomes:
+            if error is not None:
+                failed += 1
+                op.future.set_exception(error)
+            else:
+                op.future.set_result(result)
+
+        with self._lock:
+            self._stats['completed'] += len(batch) - failed
+            self._stats['failed'] += failed
+            self._stats['batches'] += 1
+            self._stats['last_batch_size'] = len(batch)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+            self._stats['commit_time_ms'] += commit_ms
+            self._stats['last_commit_ms'] = commit_ms
+            self._stats['max_commit_ms'] = max(self._stats['max_commit_ms'], commit_ms)
+            self._stats['queue_wait_ms'] += queue_wait_ms
+
+    def stats(self) -> Dict:
+        """Queue depth, batch sizes and commit latency"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['running'] = self._thread is not None
+            stats['last_error'] = self.last_error
+        processed = stats['completed'] + stats['failed']
+        stats.update({
+            'queue_depth': self._queue.qsize(),
+            'avg_batch_size': processed / stats['batches'] if stats['batches'] else 0.0,
+            'avg_commit_ms': stats['commit_time_ms'] / stats['batches'] if stats['batches'] else 0.0,
+            'avg_queue_wait_ms': stats['queue_wait_ms'] / processed if processed else 0.0
+        })
+        return stats
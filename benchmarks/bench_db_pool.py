@@ -0,0 +1,80 @@
+"""
+Per-request overhead of DatabaseManager with and without the connection pool.
+
+Usage: python benchmarks/bench_db_pool.py [iterations]
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import DatabaseManager
+from models import init_db
+
+
+class UnpooledDatabaseManager(DatabaseManager):
+    """Baseline behaviour: open and close a fresh connection for every call"""
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+
+def seed(db_manager, meals=50):
+    for i in range(meals):
+        db_manager.store_meal(1, {
+            'food_item': f'Benchmark meal {i}',
+            'consumption_time': None,
+            'nutritional_values': {
+                'serving_size': '1 plate',
+                'calories': 450,
+                'protein': '20g',
+                'carbohydrates': {'total': '50g', 'fiber': '5g', 'sugars': '8g'},
+                'fat': {'total': '15g', 'saturated': '4g'},
+                'vitamins': [{'name': 'Vitamin C', 'percent_daily_value': '20%'}]
+            }
+        })
+
+
+def simulate_page_load(db_manager, today):
+    # The dashboard fires these on every load
+    db_manager.get_user_settings(1)
+    db_manager.get_user_profile(1)
+    db_manager.get_daily_summary(1, today)
+    db_manager.get_user_goals(1)
+
+
+def run(db_manager, iterations, today):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        simulate_page_load(db_manager, today)
+    elapsed = time.perf_counter() - started
+    return elapsed * 1000 / (iterations * 4)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    init_db()
+    db_path = os.path.join(workdir, 'chundiet.db')
+
+    pooled = DatabaseManager(db_path)
+    seed(pooled)
+    today = time.strftime('%Y-%m-%d')
+
+    unpooled = UnpooledDatabaseManager(db_path)
+    baseline_ms = run(unpooled, iterations, today)
+    pooled_ms = run(pooled, iterations, today)
+
+    print(f"iterations:          {iterations} page loads ({iterations * 4} queries)")
+    print(f"unpooled per call:   {baseline_ms:.3f} ms")
+    print(f"pooled per call:     {pooled_ms:.3f} ms")
+    print(f"speedup:             {baseline_ms / pooled_ms:.1f}x")
+    print(f"pool stats:          {pooled.pool_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -45,6 +45,7 @@ call .\%VENV_DIR%\Scripts\pyinstaller.exe --name ChunDiet ^
             --console ^
             --icon="nah.png" ^
             --add-data "frontend;frontend" ^
+            --add-data "backend\data;backend\data" ^
             --add-data "nah.png;." ^
             --collect-data "google-genai" ^
             --collect-data "google.api_core" ^
@@ -71,6 +71,12 @@ class ChunDietApp {
             }
         });
 
+        // History page meal log pagination
+        const loadMoreMealsBtn = document.getElementById('loadMoreMealsBtn');
+        if (loadMoreMealsBtn) {
+            loadMoreMealsBtn.addEventListener('click', () => this.loadMealLog(false));
+        }
+
         // Planner page buttons
         const refreshPlanBtn = document.getElementById('refreshPlanBtn');
         if (refreshPlanBtn) {
@@ -156,6 +162,7 @@ class ChunDietApp {
                 break;
             case 'history':
                 await this.loadHistory();
+                await this.loadMealLog(true);
                 break;
             case 'planner':
                 // Load stored recommendations first, show empty state if none exist
@@ -178,21 +185,27 @@ class ChunDietApp {
         }
 
         this.showLoading(true);
+        this.renderAnalysisPreview({});
 
         try {
-            const response = await fetch(`${this.apiBase}/analyze-meal`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    description: description,
-                    time: time,
-                    user_id: this.currentUser.id
-                })
-            });
-
-            const result = await response.json();
+            const payload = {
+                description: description,
+                time: time,
+                user_id: this.currentUser.id
+            };
+
+            // Partial results appear while Gemini is still generating; plain request if streaming is unavailable
+            let result = await this.streamMealAnalysis(payload);
+            if (result === null) {
+                const response = await fetch(`${this.apiBase}/analyze-meal`, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify(payload)
+                });
+                result = await response.json();
+            }
 
             if (result.success) {
                 this.showNotification('Meal analyzed successfully! 🎉', 'success');
@@ -217,6 +230,104 @@ class ChunDietApp {
         }
     }
 
+    async streamMealAnalysis(payload) {
+        // Returns null when the stream cannot be opened, so the caller can fall back
+        if (!window.ReadableStream || !window.TextDecoder) {
+            return null;
+        }
+
+        const response = await fetch(`${this.apiBase}/analyze-meal/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(payload)
+        });
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!response.ok || !response.body || !contentType.includes('text/event-stream')) {
+            return null;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let partial = {};
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                if (!data) {
+                    continue;
+                }
+
+                const message = JSON.parse(data);
+                if (event === 'field') {
+                    this.setPath(partial, message.path, message.value);
+                    this.renderAnalysisPreview(partial);
+                } else if (event === 'retry') {
+                    // The fields so far came from an attempt that failed
+                    partial = {};
+                    this.renderAnalysisPreview(partial);
+                } else if (event === 'done' || event === 'error') {
+                    reader.cancel();
+                    return message;
+                }
+            }
+        }
+
+        throw new Error('Analysis stream ended before a result');
+    }
+
+    setPath(target, path, value) {
+        const keys = path.split('.');
+        let node = target;
+        keys.slice(0, -1).forEach(key => {
+            if (typeof node[key] !== 'object' || node[key] === null) {
+                node[key] = {};
+            }
+            node = node[key];
+        });
+        node[keys[keys.length - 1]] = value;
+    }
+
+    renderAnalysisPreview(partial) {
+        const preview = document.getElementById('analysisPreview');
+        if (!preview) {
+            return;
+        }
+
+        let filled = 0;
+        preview.querySelectorAll('[data-field]').forEach(element => {
+            const value = element.dataset.field.split('.').reduce(
+                (node, key) => (node && typeof node === 'object' ? node[key] : undefined),
+                partial
+            );
+            const known = value !== undefined && value !== null && value !== '';
+            element.textContent = known ? value : '…';
+            element.classList.toggle('filled', known);
+            filled += known ? 1 : 0;
+        });
+        preview.classList.toggle('active', filled > 0);
+    }
+
     async loadDailyProgress() {
         try {
             const today = new Date().toISOString().split('T')[0];
@@ -293,7 +404,7 @@ class ChunDietApp {
 
     async loadHistory() {
         try {
-            const response = await fetch(`${this.apiBase}/history?user_id=${this.currentUser.id}&days=30`);
+            const response = await fetch(`${this.apiBase}/history?user_id=${this.currentUser.id}&days=30&foods=1`);
             const history = await response.json();
 
             const timeline = document.getElementById('historyTimeline');
@@ -327,6 +438,40 @@ class ChunDietApp {
         }
     }
 
+    async loadMealLog(reset = true) {
+        // Keyset pagination: each page asks for the meals after the last cursor
+        if (reset) {
+            this.mealLogCursor = null;
+        }
+
+        try {
+            let url = `${this.apiBase}/meals?user_id=${this.currentUser.id}&limit=20`;
+            if (this.mealLogCursor) {
+                url += `&cursor=${encodeURIComponent(this.mealLogCursor)}`;
+            }
+            const response = await fetch(url);
+            const page = await response.json();
+
+            const mealLog = document.getElementById('mealLog');
+            const cards = (page.meals || []).map(meal => this.renderEnhancedMealCard(meal)).join('');
+
+            if (reset) {
+                mealLog.innerHTML = cards || `
+                    <div class="empty-state">
+                        <p>No meals logged yet</p>
+                    </div>
+                `;
+            } else {
+                mealLog.insertAdjacentHTML('beforeend', cards);
+            }
+
+            this.mealLogCursor = page.next_cursor;
+            document.getElementById('loadMoreMealsBtn').style.display = page.has_more ? '' : 'none';
+        } catch (error) {
+            console.error('Failed to load meal log:', error);
+        }
+    }
+
     showPlannerEmptyState() {
         const section = document.getElementById('recommendationsSection');
         section.innerHTML = `
@@ -1117,6 +1262,10 @@ class ChunDietApp {
                 // Refresh the meals display
                 await this.loadDailyProgress();
                 await this.loadTodaysMeals();
+                if (this.currentPage === 'history') {
+                    await this.loadHistory();
+                    await this.loadMealLog(true);
+                }
             } else {
                 this.showNotification('Failed to delete meal', 'error');
                 console.error('Delete failed:', result);